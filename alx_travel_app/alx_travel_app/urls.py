@@ -19,6 +19,7 @@ from django.urls import path, include
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from listings.views import metrics_view
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -36,5 +37,6 @@ urlpatterns = [
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name="schema-swagger-vi"),
     path('api/', include('listings.urls')),
     path('api-auth/', include('rest_framework.urls')),
-    path('accounts/', include('accounts.urls'))
+    path('accounts/', include('accounts.urls')),
+    path('metrics', metrics_view, name='metrics')
 ]
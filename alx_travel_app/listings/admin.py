@@ -4,7 +4,8 @@ from .models import (
     Listing,
     Booking,
     Review,
-    Payment
+    Payment,
+    PaymentEvent
 )
 
 admin.site.register(User)
@@ -12,3 +13,4 @@ admin.site.register(Listing)
 admin.site.register(Booking)
 admin.site.register(Review)
 admin.site.register(Payment)
+admin.site.register(PaymentEvent)
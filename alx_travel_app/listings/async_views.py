@@ -0,0 +1,170 @@
+"""
+Native async listing reads for ASGI deployments.
+
+The list, detail and search endpoints of ``ListingViewSet``, served from
+the same ``ReadPlan`` rows, keyset pagination, validators and response
+cache, with the same JSON. The views await Django's async ORM instead of
+holding a worker thread for the whole request, so one ASGI worker can
+serve many slow clients at once. They are anonymous reads only: no DRF
+authentication, throttling or browsable API.
+"""
+import functools
+
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import cache, replicas
+from .conditional import (
+    is_not_modified,
+    latest,
+    make_etag,
+    page_validators
+)
+from .pagination import KeysetPagination
+from .serializers import ListingSearchSerializer
+from .views import ListingViewSet
+
+
+class DataResponse(HttpResponse):
+    """
+    JSON response rendered like DRF's ``Response``, keeping ``data`` for
+    the response cache.
+    """
+
+    def __init__(self, data=None, status=status.HTTP_200_OK, headers=None):
+        content = b'' if data is None else JSONRenderer().render(data)
+        super().__init__(content, status=status, headers=headers,
+                         content_type='application/json')
+        self.data = data
+
+
+def _not_found():
+    return DataResponse({'detail': 'No Listing matches the given query.'},
+                        status=status.HTTP_404_NOT_FOUND)
+
+
+async def _conditional(request, etag, last_modified, build):
+    timestamp = last_modified.timestamp() if last_modified else None
+    if is_not_modified(request, etag, timestamp):
+        response = DataResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = await build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+async def _list(request, queryset):
+    paginator = KeysetPagination()
+    stamp = latest(ListingViewSet.validator_fields)
+    page = paginator.page_queryset(queryset.values_list('pk', stamp),
+                                   request, ListingViewSet)
+    if page is not None:
+        etag, last_modified = page_validators(
+            request, [row async for row in page], paginator.page_size
+        )
+    else:
+        validators = await queryset.order_by().aaggregate(
+            last_modified=Max(stamp), count=Count('pk')
+        )
+        last_modified = validators['last_modified']
+        etag = make_etag(request.get_full_path(), last_modified,
+                         validators['count'])
+
+    async def build():
+        plan = ListingViewSet.read_plan
+        rows = plan.values_list(queryset,
+                                extra=ListingViewSet.keyset_ordering)
+        page = await paginator.apaginate_queryset(rows, request,
+                                                  ListingViewSet)
+        if page is None:
+            return DataResponse(plan.render([row async for row in
+                                             rows.aiterator()]))
+        return DataResponse(paginator.get_paginated_response(
+            plan.render(page)
+        ).data)
+
+    return await _conditional(request, etag, last_modified, build)
+
+
+async def _render_row(plan, row):
+    return DataResponse(plan.render_row(row))
+
+
+def _reading(view):
+    """
+    Wraps the DRF request around ``request`` and picks the database the
+    view reads from.
+    """
+    @require_GET
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        alias = None
+        if not replicas.is_pinned(request):
+            alias = await replicas.achoose_replica()
+        with replicas.reads_from(alias):
+            return await view(Request(request), *args, **kwargs)
+    return wrapper
+
+
+@_reading
+async def listing_list(request):
+    """
+    Async ``GET /api/listing/``.
+    """
+    return await cache.acached_response(
+        request, 'list',
+        lambda: _list(request, ListingViewSet.queryset.all()),
+        DataResponse
+    )
+
+
+@_reading
+async def listing_detail(request, pk):
+    """
+    Async ``GET /api/listing/<pk>/``.
+    """
+    async def build():
+        plan = ListingViewSet.read_plan
+        row = await plan.values_list(
+            ListingViewSet.queryset.filter(pk=pk),
+            extra=ListingViewSet.validator_fields
+        ).afirst()
+        if row is None:
+            return _not_found()
+        # One query for the validators and the row.
+        updated_at = max(getattr(row, name)
+                         for name in ListingViewSet.validator_fields)
+        return await _conditional(
+            request, make_etag(str(pk), updated_at), updated_at,
+            lambda: _render_row(plan, row)
+        )
+
+    return await cache.acached_response(request, 'retrieve', build,
+                                        DataResponse, pk=pk)
+
+
+@_reading
+async def listing_search(request):
+    """
+    Async ``GET /api/listing/search/``.
+    """
+    async def build():
+        params = ListingSearchSerializer(data=request.query_params)
+        if not params.is_valid():
+            return DataResponse(params.errors,
+                                status=status.HTTP_400_BAD_REQUEST)
+        queryset = params.filter_queryset(ListingViewSet.queryset.all())
+        return await _list(request,
+                           queryset.order_by(*ListingViewSet.keyset_ordering))
+
+    return await cache.acached_response(request, 'search', build,
+                                        DataResponse)
@@ -0,0 +1,18 @@
+"""
+MySQL backend drawing connections from a process-wide pool; see
+``listings.backends.pool``. Meant for ASGI deployments, with
+``CONN_MAX_AGE`` 0 so every request returns its connection.
+"""
+from django.db.backends.mysql import base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+
+    def check_connection(self, connection):
+        try:
+            connection.ping()
+        except self.Database.Error:
+            return False
+        return True
@@ -0,0 +1,202 @@
+"""
+Process-wide connection pool for Django database backends.
+
+Django's MySQL backend has no pool: with ``CONN_MAX_AGE`` it keeps one
+connection per thread, which suits WSGI workers but not ASGI, where
+requests hop between threads and Django closes every connection at the
+end of a request. ``PooledDatabaseWrapperMixin`` turns that close into a
+check-in, so the next request checks the connection out again instead of
+repeating the TCP and authentication handshake.
+
+The pool is configured by the ``POOL`` entry of the database settings:
+``SIZE`` connections at most per process and alias, waiting up to
+``TIMEOUT`` seconds for one to be returned, and closing connections idle
+for longer than ``MAX_IDLE`` seconds. With ``CONN_HEALTH_CHECKS`` an idle
+connection is pinged before it is handed out again.
+"""
+import collections
+import os
+import threading
+import time
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection is returned within the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of raw DB-API connections made by ``connect``.
+    """
+
+    def __init__(self, connect, size=10, timeout=5.0, max_idle=300.0,
+                 check=None, clock=time.monotonic):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        # Called on idle connections before reuse; False discards them.
+        self.check = check
+        self.clock = clock
+        self.stats = collections.Counter()
+        self._idle = collections.deque()
+        self._open = 0
+        self._lock = threading.Condition()
+
+    def acquire(self):
+        """
+        Returns a connection and whether it was used before.
+        """
+        deadline = self.clock() + self.timeout
+        with self._lock:
+            while True:
+                while self._idle:
+                    connection, returned_at = self._idle.pop()
+                    if self.clock() - returned_at <= self.max_idle:
+                        break
+                    self._drop(connection)
+                else:
+                    connection = None
+                if connection is not None:
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - self.clock()
+                if remaining <= 0 or not self._lock.wait(remaining):
+                    self.stats['timeouts'] += 1
+                    raise PoolExhausted(
+                        f"No connection returned within {self.timeout}s "
+                        f"({self.size} in use)"
+                    )
+
+        if connection is not None:
+            if self.check is None or self.check(connection):
+                self.stats['reused'] += 1
+                return connection, True
+            self.discard(connection)
+            return self.acquire()
+
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            raise
+        self.stats['created'] += 1
+        return connection, False
+
+    def release(self, connection):
+        with self._lock:
+            self._idle.append((connection, self.clock()))
+            self._lock.notify()
+
+    def discard(self, connection):
+        with self._lock:
+            self._drop(connection)
+            self._lock.notify()
+
+    def _drop(self, connection):
+        # Called with the lock held.
+        self._open -= 1
+        self.stats['discarded'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        Closes every idle connection.
+        """
+        with self._lock:
+            while self._idle:
+                self._drop(self._idle.pop()[0])
+
+
+# (pid, alias) -> pool; a forked worker starts its own.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    ``DatabaseWrapper`` mixin checking raw connections out of a
+    ``ConnectionPool`` and back in on close.
+    """
+    reused_connection = False
+
+    def get_pool(self, conn_params):
+        key = (os.getpid(), self.alias)
+        with _pools_lock:
+            if key not in _pools:
+                options = self.settings_dict.get('POOL', {})
+                check = (self.check_connection
+                         if self.settings_dict['CONN_HEALTH_CHECKS']
+                         else None)
+                _pools[key] = ConnectionPool(
+                    lambda: super(PooledDatabaseWrapperMixin,
+                                  self).get_new_connection(conn_params),
+                    size=options.get('SIZE', 10),
+                    timeout=options.get('TIMEOUT', 5.0),
+                    max_idle=options.get('MAX_IDLE', 300.0),
+                    check=check,
+                )
+            return _pools[key]
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection, self.reused_connection = (
+                self.get_pool(conn_params).acquire()
+            )
+        except PoolExhausted as exc:
+            raise self.Database.OperationalError(str(exc)) from exc
+        return connection
+
+    def init_connection_state(self):
+        # Session state survives check-in; only new connections need it.
+        if not self.reused_connection:
+            super().init_connection_state()
+
+    def check_connection(self, connection):
+        try:
+            connection.cursor().execute('SELECT 1')
+        except self.Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with _pools_lock:
+            pool = _pools.get((os.getpid(), self.alias))
+        if pool is None:
+            # Inherited from the parent of a forked process.
+            return super()._close()
+        # Connections left mid-transaction, in an unknown state or with
+        # autocommit changed are not handed to another request.
+        if (self.in_atomic_block or self.errors_occurred or
+                self.autocommit != self.settings_dict['AUTOCOMMIT']):
+            pool.discard(self.connection)
+        else:
+            pool.release(self.connection)
+
+
+def pooled(wrapper_class):
+    """
+    Returns a pooled subclass of the backend ``wrapper_class``.
+    """
+    return type(f'Pooled{wrapper_class.__name__}',
+                (PooledDatabaseWrapperMixin, wrapper_class), {})
+
+
+def close_pools():
+    """
+    Closes the idle connections of this process's pools.
+    """
+    with _pools_lock:
+        pools = [pool for (pid, _), pool in _pools.items()
+                 if pid == os.getpid()]
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,92 @@
+"""
+Shared helpers for the ``bench_*`` management commands.
+"""
+import math
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+def percentile(values, pct):
+    """
+    Returns the ``pct`` percentile of ``values`` (nearest-rank method).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """
+    Reduces a list of latencies (seconds) to milliseconds percentiles.
+    """
+    return {
+        'count': len(samples),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3)
+        if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+@contextmanager
+def stopwatch(samples):
+    """
+    Appends the wall time of the wrapped block to ``samples``.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append(time.perf_counter() - start)
+
+
+def explain(queryset):
+    """
+    Returns the backend's query plan for ``queryset`` and whether it is a
+    full table scan.
+    """
+    plan = queryset.explain()
+    vendor = connections[queryset.db].vendor
+    lines = [line.strip() for line in plan.splitlines()]
+    table = queryset.model._meta.db_table
+
+    if vendor == 'mysql':
+        # Traditional EXPLAIN output: "id select_type table ... type ...".
+        full_scan = any(f' {table} ' in f' {line} ' and ' ALL ' in f' {line} '
+                        for line in lines)
+    elif vendor == 'sqlite':
+        full_scan = any(line.endswith(f'SCAN {table}') for line in lines)
+    else:
+        full_scan = 'Seq Scan' in plan
+    return plan, full_scan
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Lists regressions of ``results`` against ``baseline`` (both
+    ``{scale: {scenario: metrics}}``): a p95 latency more than
+    ``tolerance`` above the baseline or more queries per request.
+    """
+    regressions = []
+    for scale, scenarios in results.items():
+        for name, metrics in scenarios.items():
+            before = baseline.get(scale, {}).get(name)
+            if before is None:
+                continue
+            label = f"{name} at scale {scale}"
+            if metrics['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f"{label}: p95 {metrics['p95_ms']} ms, baseline "
+                    f"{before['p95_ms']} ms"
+                )
+            if metrics['queries_max'] > before['queries_max']:
+                regressions.append(
+                    f"{label}: {metrics['queries_max']} queries per "
+                    f"request, baseline {before['queries_max']}"
+                )
+    return regressions
@@ -0,0 +1,171 @@
+"""
+Versioned response cache for anonymous listing reads.
+
+Every cached response is keyed on a global listings version plus the
+normalized request. Writes never delete entries: they bump the version
+(see ``listings.signals``) and stale entries simply age out. Misses are
+read from the primary, never a replica. The cache is fail-open, so an
+unreachable Redis degrades to uncached reads.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import replicas
+from .conditional import headers_not_modified
+from .metrics import CACHE_OPERATIONS
+
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'listings:version'
+
+# Validator headers stored alongside cached data.
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified')
+
+
+def get_cache():
+    return caches[settings.LISTINGS_CACHE_ALIAS]
+
+
+def _new_version():
+    # Time-based so a version lost to eviction never reuses old keys.
+    return int(time.time() * 1000)
+
+
+def current_version(cache):
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def acurrent_version(cache):
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, _new_version(), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """
+    Makes every cached listing response stale.
+    """
+    cache = get_cache()
+    try:
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, _new_version(), timeout=None)
+    except Exception:
+        CACHE_OPERATIONS.labels('error').inc()
+        logger.warning("Could not invalidate the listings cache",
+                       exc_info=True)
+
+
+def cache_key(version, request, action, pk=None):
+    # The path keeps endpoints apart whose bodies link back to themselves,
+    # such as the sync and async pagination links.
+    params = sorted((name, sorted(values))
+                    for name, values in request.query_params.lists())
+    digest = hashlib.sha256(
+        repr((request.get_host(), request.path, params)).encode()
+    ).hexdigest()[:32]
+    return f'listings:{version}:{action}:{pk or ""}:{digest}'
+
+
+def cached_response(request, action, build, pk=None):
+    """
+    Returns the cached response for an anonymous read (a 304 when the
+    client's validators still match), or calls ``build`` and caches its
+    data and validators when the response is a 200.
+    """
+    timeout = settings.LISTINGS_CACHE_TIMEOUT
+    if not timeout or request.user.is_authenticated:
+        return build()
+
+    cache = get_cache()
+    try:
+        key = cache_key(current_version(cache), request, action, pk)
+        data = cache.get(key)
+    except Exception:
+        CACHE_OPERATIONS.labels('error').inc()
+        logger.warning("Listings cache unavailable", exc_info=True)
+        return build()
+
+    if data is not None:
+        CACHE_OPERATIONS.labels('hit').inc()
+        headers = dict(data['headers'], **{'X-Cache': 'HIT'})
+        if headers_not_modified(request, headers):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers=headers)
+        return Response(data['data'], headers=headers)
+
+    CACHE_OPERATIONS.labels('miss').inc()
+    # Entries outlive the version bump of the write they follow, so they
+    # are read from the primary: a lagging replica's rows would be served
+    # for the whole timeout.
+    with replicas.reads_from(None):
+        response = build()
+    if response.status_code == status.HTTP_200_OK:
+        headers = {name: response[name] for name in VALIDATOR_HEADERS
+                   if name in response}
+        try:
+            cache.set(key, {'data': response.data, 'headers': headers},
+                      timeout)
+        except Exception:
+            CACHE_OPERATIONS.labels('error').inc()
+            logger.warning("Could not store listings response",
+                           exc_info=True)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+async def acached_response(request, action, build, response_class, pk=None):
+    """
+    ``cached_response`` for async views: ``build`` is a coroutine function
+    and hits are answered with ``response_class``.
+    """
+    timeout = settings.LISTINGS_CACHE_TIMEOUT
+    if not timeout or (await request.auser()).is_authenticated:
+        return await build()
+
+    cache = get_cache()
+    try:
+        key = cache_key(await acurrent_version(cache), request, action, pk)
+        data = await cache.aget(key)
+    except Exception:
+        CACHE_OPERATIONS.labels('error').inc()
+        logger.warning("Listings cache unavailable", exc_info=True)
+        return await build()
+
+    if data is not None:
+        CACHE_OPERATIONS.labels('hit').inc()
+        headers = dict(data['headers'], **{'X-Cache': 'HIT'})
+        if headers_not_modified(request, headers):
+            return response_class(status=status.HTTP_304_NOT_MODIFIED,
+                                  headers=headers)
+        return response_class(data['data'], headers=headers)
+
+    CACHE_OPERATIONS.labels('miss').inc()
+    with replicas.reads_from(None):
+        response = await build()
+    if response.status_code == status.HTTP_200_OK:
+        headers = {name: response[name] for name in VALIDATOR_HEADERS
+                   if name in response}
+        try:
+            await cache.aset(key, {'data': response.data,
+                                   'headers': headers}, timeout)
+        except Exception:
+            CACHE_OPERATIONS.labels('error').inc()
+            logger.warning("Could not store listings response",
+                           exc_info=True)
+    response['X-Cache'] = 'MISS'
+    return response
@@ -0,0 +1,157 @@
+"""
+Conditional GET (ETag / Last-Modified) support for the viewsets.
+
+Validators come from ``updated_at`` and the ``updated_at`` of the related
+rows a representation embeds (``validator_fields``). Keyset pages use the
+``(pk, updated_at)`` rows of the requested page, so a page costs the same
+whatever its position; unpaginated lists use ``max(updated_at)`` and the
+row count of the filtered queryset, and detail views the row's own
+values. An unchanged resource is answered with a 304 without serializing
+anything.
+"""
+import functools
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Max
+from django.db.models.functions import Greatest
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from .pagination import KeysetPagination
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def latest(fields):
+    """
+    Returns an expression for the latest of the ``updated_at`` paths in
+    ``fields``.
+    """
+    expressions = [F(name) for name in fields]
+    return Greatest(*expressions) if len(expressions) > 1 else expressions[0]
+
+
+def page_validators(request, rows, page_size):
+    """
+    Returns the ETag and Last-Modified of a page from its ``(pk, stamp)``
+    rows, plus the one past the page that tells whether a next page exists.
+    """
+    page = rows[:page_size]
+    last_modified = max((stamp for _, stamp in page), default=None)
+    etag = make_etag(request.get_full_path(), page, len(rows) > page_size)
+    return etag, last_modified
+
+
+def _opaque(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def is_not_modified(request, etag, last_modified=None):
+    """
+    Evaluates If-None-Match (weak comparison) or, failing that,
+    If-Modified-Since against the given validators. ``last_modified`` is
+    a Unix timestamp.
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        if if_none_match.strip() == '*':
+            return True
+        return _opaque(etag) in {_opaque(tag)
+                                 for tag in parse_etags(if_none_match)}
+
+    if_modified_since = parse_http_date_safe(
+        request.headers.get('If-Modified-Since', '')
+    )
+    return (if_modified_since is not None and last_modified is not None and
+            int(last_modified) <= if_modified_since)
+
+
+def headers_not_modified(request, headers):
+    """
+    ``is_not_modified`` for validators stored as response headers.
+    """
+    if 'ETag' not in headers:
+        return False
+    return is_not_modified(
+        request, headers['ETag'],
+        parse_http_date_safe(headers.get('Last-Modified', ''))
+    )
+
+
+def conditional_response(request, etag, last_modified, build):
+    """
+    Answers 304 when the client's validators match, otherwise calls
+    ``build`` and stamps the validators on its response.
+    """
+    timestamp = last_modified.timestamp() if last_modified else None
+    if is_not_modified(request, etag, timestamp):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Adds weak ETag / Last-Modified validators to list and retrieve.
+    Models must carry an ``updated_at`` field; ``validator_fields`` adds
+    those of the related rows the representation embeds.
+    """
+    validator_fields = ('updated_at',)
+
+    def list_validators(self, request, queryset):
+        stamp = latest(self.validator_fields)
+        if isinstance(self.paginator, KeysetPagination):
+            page = self.paginator.page_queryset(
+                queryset.values_list('pk', stamp), request, self
+            )
+            if page is not None:
+                return page_validators(request, list(page),
+                                       self.paginator.page_size)
+        validators = queryset.order_by().aggregate(
+            last_modified=Max(stamp), count=Count('pk')
+        )
+        etag = make_etag(request.get_full_path(),
+                         validators['last_modified'], validators['count'])
+        return etag, validators['last_modified']
+
+    def conditional_list(self, request, queryset, build):
+        etag, last_modified = self.list_validators(request, queryset)
+        return conditional_response(request, etag, last_modified, build)
+
+    def conditional_retrieve(self, request, build):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            row = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            ).values_list('pk', latest(self.validator_fields)).first()
+        except (TypeError, ValueError, ValidationError):
+            # Malformed lookups (e.g. not a UUID) 404 in the view itself.
+            row = None
+        if row is None:
+            return build()
+        pk, updated_at = row
+        return conditional_response(request, make_etag(str(pk), updated_at),
+                                    updated_at, build)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(
+            request, self.filter_queryset(self.get_queryset()),
+            functools.partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(
+            request,
+            functools.partial(super().retrieve, request, *args, **kwargs)
+        )
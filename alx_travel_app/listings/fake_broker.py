@@ -0,0 +1,124 @@
+"""
+In-process broker stand-in for tests and ``bench_*`` commands.
+
+Messages are routed by a real Celery app's router, so ``task_routes``,
+``task_queues`` and route priorities are the ones under test. Each queue
+delivers its highest-priority message first, like RabbitMQ with
+``x-max-priority``. Worker nodes follow a worker profile: ``concurrency``
+threads sharing a buffer of up to ``concurrency * prefetch_multiplier``
+reserved messages, which are not reordered once reserved.
+
+Handlers run in the worker threads instead of Celery's execution pool, so
+the latencies measured are queueing delays, not task overhead.
+"""
+import collections
+import heapq
+import itertools
+import threading
+
+
+class FakeBroker:
+    """
+    Usage::
+
+        broker = FakeBroker(app, {'listings.tasks.send_notifications': send})
+        with broker.worker(queues=['email'], concurrency=4,
+                           prefetch_multiplier=4):
+            broker.send_task('listings.tasks.send_notifications', [batch])
+            broker.join()
+    """
+
+    def __init__(self, app, handlers):
+        # Task name -> callable run in place of the task.
+        self.app = app
+        self.handlers = handlers
+        self.queues = collections.defaultdict(list)
+        self._order = itertools.count()
+        self._lock = threading.Condition()
+        self._pending = 0
+
+    def route(self, name):
+        """
+        Returns the queue name and priority Celery would use for ``name``.
+        """
+        options = self.app.amqp.router.route({}, name)
+        priority = options.get('priority')
+        if priority is None:
+            priority = self.app.conf.task_default_priority or 0
+        return options['queue'].name, priority
+
+    def send_task(self, name, args=(), kwargs=None):
+        queue, priority = self.route(name)
+        with self._lock:
+            heapq.heappush(self.queues[queue], (
+                -priority, next(self._order), name, list(args), kwargs or {}
+            ))
+            self._pending += 1
+            self._lock.notify_all()
+
+    def join(self, timeout=None):
+        """
+        Waits until every message sent so far has been handled.
+        """
+        with self._lock:
+            if not self._lock.wait_for(lambda: not self._pending, timeout):
+                raise TimeoutError(f"{self._pending} messages unhandled")
+
+    def worker(self, queues, concurrency=1, prefetch_multiplier=1):
+        return _Worker(self, queues, concurrency,
+                       concurrency * prefetch_multiplier)
+
+    def _reserve(self, queues, reserved, capacity):
+        # Called with the lock held: top up the node's buffer, best
+        # priority first across its queues.
+        while len(reserved) < capacity:
+            heads = [name for name in queues if self.queues[name]]
+            if not heads:
+                return
+            best = min(heads, key=lambda name: self.queues[name][0])
+            reserved.append(heapq.heappop(self.queues[best]))
+
+    def _handled(self):
+        with self._lock:
+            self._pending -= 1
+            self._lock.notify_all()
+
+
+class _Worker:
+    def __init__(self, broker, queues, concurrency, capacity):
+        self.broker = broker
+        self.queues = queues
+        self.capacity = capacity
+        self.reserved = collections.deque()
+        self.stopping = False
+        self.threads = [threading.Thread(target=self.run, daemon=True)
+                        for _ in range(concurrency)]
+
+    def run(self):
+        broker = self.broker
+        while True:
+            with broker._lock:
+                broker._reserve(self.queues, self.reserved, self.capacity)
+                while not self.reserved and not self.stopping:
+                    broker._lock.wait()
+                    broker._reserve(self.queues, self.reserved,
+                                    self.capacity)
+                if not self.reserved:
+                    return
+                _, _, name, args, kwargs = self.reserved.popleft()
+            try:
+                broker.handlers[name](*args, **kwargs)
+            finally:
+                broker._handled()
+
+    def __enter__(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.broker._lock:
+            self.stopping = True
+            self.broker._lock.notify_all()
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,117 @@
+"""
+Local stand-in for the Chapa API, for tests and ``bench_*`` commands.
+
+Runs a threaded HTTP server on 127.0.0.1 that answers the initialize and
+verify endpoints. Latency, failing statuses and verification outcomes can
+be changed while it runs to simulate a degraded upstream.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeChapaServer:
+    """
+    Usage::
+
+        with FakeChapaServer() as chapa:
+            chapa.delay = 0.5
+            ChapaClient(chapa.url, 'key').verify('tx-1')
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        # Statuses served (in order) before normal answers resume.
+        self.failures = []
+        # tx_ref -> 'success' | 'failed'; unknown refs verify as success.
+        self.outcomes = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                           self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/v1/'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _next_failure(self):
+        with self._lock:
+            return self.failures.pop(0) if self.failures else None
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; without this,
+            # delayed ACKs add ~40ms to every keep-alive response.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.handle_call()
+
+            def do_POST(self):
+                self.handle_call()
+
+            def handle_call(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                with fake._lock:
+                    fake.requests.append((self.command, self.path))
+                if fake.delay:
+                    time.sleep(fake.delay)
+
+                failure = fake._next_failure()
+                if failure:
+                    return self.reply(failure, {'status': 'failed'})
+                if self.path.endswith('/transaction/initialize'):
+                    return self.reply(200, {
+                        'status': 'success',
+                        'data': {'checkout_url':
+                                 f"https://checkout.example/{body['tx_ref']}"}
+                    })
+                if '/transaction/verify/' in self.path:
+                    tx_ref = self.path.rsplit('/', 1)[-1]
+                    outcome = fake.outcomes.get(tx_ref, 'success')
+                    return self.reply(200, {
+                        'status': 'success',
+                        'data': {'id': f'chapa-{tx_ref}', 'tx_ref': tx_ref,
+                                 'status': outcome}
+                    })
+                self.reply(404, {'status': 'failed'})
+
+            def reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up (read timeout) before we answered.
+                    pass
+
+        return Handler
@@ -0,0 +1,109 @@
+"""
+Local SMTP stand-in for tests and ``bench_*`` commands.
+
+Speaks just enough SMTP for ``smtplib`` and Django's SMTP backend: it
+counts connections and accepted messages, can slow down every new session
+(``delay``, like a TLS/auth handshake) and refuses recipients in
+``rejected``.
+"""
+import socketserver
+import threading
+import time
+
+
+class FakeSMTPServer:
+    """
+    Usage::
+
+        with FakeSMTPServer() as smtp:
+            get_connection('django.core.mail.backends.smtp.EmailBackend',
+                           host=smtp.host, port=smtp.port)
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self.rejected = set()
+        self.connections = 0
+        self.messages = []
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0), self._handler_class()
+        )
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def reply(self, line):
+                self.wfile.write(line.encode() + b'\r\n')
+
+            def handle(self):
+                with fake._lock:
+                    fake.connections += 1
+                if fake.delay:
+                    time.sleep(fake.delay)
+                self.reply('220 localhost fake ESMTP')
+                recipients = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode(errors='replace').strip()
+                    verb = command[:4].upper()
+                    if verb in ('EHLO', 'HELO'):
+                        self.reply('250 localhost')
+                    elif verb == 'MAIL':
+                        recipients = []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        address = command.split(':', 1)[1].strip(' <>')
+                        if address in fake.rejected:
+                            self.reply('550 No such user')
+                        else:
+                            recipients.append(address)
+                            self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        data = []
+                        for data_line in iter(self.rfile.readline, b''):
+                            if data_line in (b'.\r\n', b'.\n'):
+                                break
+                            data.append(data_line)
+                        with fake._lock:
+                            fake.messages.append((recipients, b''.join(data)))
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        # RSET, NOOP and anything else.
+                        self.reply('250 OK')
+
+        return Handler
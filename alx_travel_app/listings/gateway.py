@@ -0,0 +1,213 @@
+"""
+Chapa payment gateway client.
+
+All outbound Chapa calls go through one pooled ``requests.Session`` with
+strict connect/read timeouts, jittered retries for transient failures and
+a circuit breaker, so a slow or failing gateway costs each worker a
+bounded amount of time instead of blocking it indefinitely.
+"""
+import functools
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import quote
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses worth another attempt. POSTs are only retried on 502,
+# 503 and 504, where the request is known not to have been processed.
+RETRY_STATUSES = {500, 502, 503, 504}
+SAFE_RETRY_STATUSES = {502, 503, 504}
+
+
+class GatewayError(Exception):
+    """Base class for payment gateway failures."""
+
+
+class GatewayUnavailable(GatewayError):
+    """Raised when the gateway is down, too slow or the circuit is open."""
+
+
+class GatewayResponse(namedtuple('GatewayResponse', 'status_code data')):
+    """Decoded gateway response."""
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return (self.status_code == 200 and
+                self.data.get('status') == 'success')
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive upstream failures and
+    rejects calls for ``reset_timeout`` seconds. It then lets a single
+    probe through (half-open); the probe's outcome closes or re-opens it.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (self.state == self.OPEN and
+                    self.clock() - self.opened_at >= self.reset_timeout):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN or
+                    self.failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    logger.warning("Chapa circuit breaker opened")
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+class ChapaClient:
+    """
+    Thread-safe client for the Chapa transaction API.
+    """
+
+    def __init__(self, base_url, secret_key, connect_timeout=3.05,
+                 read_timeout=10.0, max_retries=2, backoff=0.2,
+                 backoff_cap=2.0, pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Authorization'] = f"Bearer {secret_key}"
+
+    def initialize(self, payload):
+        """
+        Starts a hosted checkout for ``payload``.
+        """
+        return self._request('initialize', 'POST', 'transaction/initialize',
+                             idempotent=False, json=payload)
+
+    def verify(self, tx_ref):
+        """
+        Looks up the outcome of the transaction ``tx_ref``.
+        """
+        return self._request('verify', 'GET',
+                             f'transaction/verify/{quote(tx_ref, safe="")}',
+                             idempotent=True)
+
+    def _request(self, operation, method, path, idempotent, **kwargs):
+        # ``operation`` labels the call's metrics; paths carry tx refs.
+        if not self.breaker.allow():
+            metrics.GATEWAY_CALLS.labels(operation, 'circuit_open').inc()
+            raise GatewayUnavailable("Payment gateway circuit is open")
+
+        start = time.perf_counter()
+        outcome = 'unavailable'
+        try:
+            response = self._send(operation, method, path, idempotent,
+                                  **kwargs)
+            outcome = response.status_code
+            return response
+        finally:
+            metrics.GATEWAY_LATENCY.labels(operation).observe(
+                time.perf_counter() - start
+            )
+            metrics.GATEWAY_CALLS.labels(operation, outcome).inc()
+
+    def _send(self, operation, method, path, idempotent, **kwargs):
+        url = self.base_url + path
+        retry_statuses = RETRY_STATUSES if idempotent else SAFE_RETRY_STATUSES
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                metrics.GATEWAY_RETRIES.labels(operation).inc()
+                time.sleep(random.uniform(
+                    0, min(self.backoff_cap, self.backoff * 2 ** attempt)
+                ))
+            try:
+                response = self.session.request(method, url,
+                                                timeout=self.timeout,
+                                                **kwargs)
+            except requests.ConnectionError as exc:
+                # Covers connect timeouts: the request never reached Chapa.
+                error = exc
+                continue
+            except requests.RequestException as exc:
+                # Read timeouts and broken responses: Chapa may have acted.
+                error = exc
+                if idempotent:
+                    continue
+                break
+
+            if response.status_code in retry_statuses:
+                error = GatewayError(f"Chapa answered {response.status_code}")
+                continue
+
+            self.breaker.record_success()
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            return GatewayResponse(response.status_code, data)
+
+        self.breaker.record_failure()
+        logger.warning("Chapa %s %s failed: %s", method, path, error)
+        raise GatewayUnavailable(str(error)) from error
+
+
+@functools.lru_cache(maxsize=None)
+def get_client():
+    """
+    Returns the process-wide client configured from settings.
+    """
+    return ChapaClient(
+        base_url=settings.CHAPA_BASE_URL,
+        secret_key=settings.CHAPA_SECRET_KEY,
+        connect_timeout=settings.CHAPA_CONNECT_TIMEOUT,
+        read_timeout=settings.CHAPA_READ_TIMEOUT,
+        max_retries=settings.CHAPA_MAX_RETRIES,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.CHAPA_BREAKER_THRESHOLD,
+            reset_timeout=settings.CHAPA_BREAKER_RESET_TIMEOUT
+        )
+    )
+
+
+@receiver(setting_changed)
+def reset_client(setting, **kwargs):
+    if setting.startswith('CHAPA_'):
+        get_client.cache_clear()
@@ -0,0 +1,127 @@
+"""
+Idempotency-Key support for unsafe endpoints.
+
+The first request with a given key runs normally and its response is
+stored with a fingerprint of the request (method, path and body) for
+``IDEMPOTENCY_TTL`` seconds. Retries with the same key get the stored
+response back without touching the database or the payment gateway. A
+key reused for a different request is rejected with 422, and a retry that
+arrives while the first request is still running gets a 409.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http.request import RawPostDataException
+from rest_framework import status
+from rest_framework.response import Response
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Headers replayed along with stored data.
+STORED_HEADERS = ('Location',)
+
+
+def get_cache():
+    return caches[settings.IDEMPOTENCY_CACHE_ALIAS]
+
+
+def fingerprint(request):
+    try:
+        body = request.body
+    except RawPostDataException:
+        # Multipart bodies are consumed by the parser; use the parsed form.
+        body = repr(sorted(request.data.lists())).encode()
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), body):
+        digest.update(part)
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def cache_key(request, scope, key):
+    # Keys are only unique per client, so they are namespaced by user.
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+    return f'idempotency:{scope}:{user}:{digest}'
+
+
+def _error(message, status_code):
+    return Response({'error': message}, status=status_code)
+
+
+def _replay(entry, request_fingerprint):
+    if entry['fingerprint'] != request_fingerprint:
+        return _error(f"{HEADER} was already used for a different request",
+                      status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if 'status' not in entry:
+        return _error(f"A request with this {HEADER} is still in progress",
+                      status.HTTP_409_CONFLICT)
+    headers = dict(entry['headers'], **{'Idempotent-Replayed': 'true'})
+    return Response(entry['data'], status=entry['status'], headers=headers)
+
+
+def idempotent_response(request, scope, build):
+    """
+    Returns the stored response for a repeated ``Idempotency-Key`` or calls
+    ``build`` and stores its response. Requests without the header, and
+    every request while the cache is unreachable, just call ``build``.
+    """
+    key = request.headers.get(HEADER)
+    if key is None:
+        return build()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return _error(f"{HEADER} must be 1-{MAX_KEY_LENGTH} characters",
+                      status.HTTP_400_BAD_REQUEST)
+
+    cache = get_cache()
+    request_fingerprint = fingerprint(request)
+    entry_key = cache_key(request, scope, key)
+    try:
+        # Reserve the key; the short timeout frees it if this worker dies.
+        reserved = cache.add(entry_key, {'fingerprint': request_fingerprint},
+                             timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        entry = None if reserved else cache.get(entry_key)
+    except Exception:
+        logger.warning("Idempotency cache unavailable", exc_info=True)
+        return build()
+    if entry is not None:
+        return _replay(entry, request_fingerprint)
+    if not reserved:
+        # The reservation expired between add() and get(); run normally.
+        return build()
+
+    try:
+        response = build()
+    except Exception:
+        _release(cache, entry_key)
+        raise
+
+    if response.status_code >= 500:
+        # Server-side failures are not final; let the client retry.
+        _release(cache, entry_key)
+        return response
+
+    try:
+        cache.set(entry_key, {
+            'fingerprint': request_fingerprint,
+            'status': response.status_code,
+            'data': response.data,
+            'headers': {name: response[name] for name in STORED_HEADERS
+                        if name in response},
+        }, settings.IDEMPOTENCY_TTL)
+    except Exception:
+        logger.warning("Could not store idempotent response", exc_info=True)
+    return response
+
+
+def _release(cache, entry_key):
+    try:
+        cache.delete(entry_key)
+    except Exception:
+        logger.warning("Could not release idempotency key", exc_info=True)
@@ -0,0 +1,225 @@
+import itertools
+import json
+import platform
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+from io import StringIO
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from listings.benchmarks import compare, percentile, summarize
+from listings.models import Listing
+
+
+User = get_user_model()
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench-api',
+    }
+}
+
+# Lists are unpaginated unless the client asks; every list scenario
+# fetches the first page a client would.
+PAGE_SIZE = 50
+
+
+class Rollback(Exception):
+    """Raised to discard the seeded rows once a scale is measured."""
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the listings API endpoints through the test client "
+            "at fixed dataset scales: latency percentiles, queries and "
+            "allocations per request, optionally against a baseline")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='10,100',
+                            help="Comma-separated seed --scale values")
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Timed requests per endpoint")
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--alloc-requests', type=int, default=20,
+                            help="Requests traced with tracemalloc")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--response-cache', action='store_true',
+                            help="Keep the anonymous listings response "
+                                 "cache on (off: measure the DB path)")
+        parser.add_argument('--output', help="Write results as JSON here")
+        parser.add_argument('--baseline',
+                            help="JSON from an earlier --output to "
+                                 "compare against")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed p95 slowdown against the "
+                                 "baseline, as a fraction")
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(value) for value in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError("--scales takes integers, e.g. 10,100")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)['results']
+
+        cache_timeout = {} if options['response_cache'] else {
+            'LISTINGS_CACHE_TIMEOUT': 0
+        }
+        results = {}
+        with override_settings(CACHES=LOCMEM_CACHES, **cache_timeout):
+            for scale in scales:
+                results[str(scale)] = self.run_scale(scale, options)
+
+        report = {
+            'meta': {
+                'vendor': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'requests': options['requests'],
+                'seed': options['seed'],
+                'response_cache': options['response_cache'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n"
+                                   + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS(
+                "No regressions against the baseline"
+            ))
+
+    def run_scale(self, scale, options):
+        self.stdout.write(f"Seeding scale {scale}...")
+        try:
+            with transaction.atomic():
+                call_command('seed', scale=scale, seed=options['seed'],
+                             stdout=StringIO())
+                results = {}
+                for name, request in self.scenarios(options['seed']):
+                    results[name] = self.measure(request, options)
+                    self.write(scale, name, results[name])
+                raise Rollback
+        except Rollback:
+            return results
+
+    def scenarios(self, seed):
+        rng = random.Random(seed)
+        anonymous = APIClient()
+        client = APIClient()
+        client.force_authenticate(User.objects.order_by('pk').first())
+        routes = list(Listing.objects.values_list('pk', 'origin',
+                                                  'destination'))
+        bookable = itertools.cycle(
+            Listing.objects.filter(available_seats__gt=0)
+            .order_by('-available_seats')
+            .values_list('pk', flat=True)[:100]
+        )
+        passengers = itertools.count()
+        today = timezone.now().replace(hour=0, minute=0, second=0,
+                                       microsecond=0)
+        page = {'page_size': PAGE_SIZE}
+
+        def listing_search():
+            _, origin, destination = rng.choice(routes)
+            start = today + timedelta(days=rng.randint(-30, 60))
+            return anonymous.get('/api/listing/search/', {
+                'origin': origin, 'destination': destination,
+                'departure_after': start.isoformat(),
+                'departure_before': (start + timedelta(days=30)).isoformat(),
+                **page,
+            })
+
+        def booking_create():
+            n = next(passengers)
+            return client.post('/api/booking/', {
+                'listing_id': str(next(bookable)),
+                'passenger_name': f'Bench passenger {n}',
+                'passenger_email': f'bench-{n}@example.com',
+                'num_seats': 1,
+                'booking_date': timezone.now().isoformat(),
+                'amount_paid': '15000.00',
+            })
+
+        return [
+            ('listing-list', lambda: anonymous.get('/api/listing/', page)),
+            ('listing-search', listing_search),
+            ('listing-detail', lambda: anonymous.get(
+                f'/api/listing/{rng.choice(routes)[0]}/')),
+            ('booking-create', booking_create),
+            ('review-list', lambda: anonymous.get('/api/review/', page)),
+        ]
+
+    def measure(self, request, options):
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        def call():
+            response = request()
+            if response.status_code >= 400:
+                raise CommandError(f"{response.status_code}: "
+                                   f"{response.content[:200]!r}")
+
+        for _ in range(options['warmup']):
+            call()
+
+        samples = []
+        query_counts = []
+        with connection.execute_wrapper(count_queries):
+            for _ in range(options['requests']):
+                queries = 0
+                start = time.perf_counter()
+                call()
+                samples.append(time.perf_counter() - start)
+                query_counts.append(queries)
+
+        # Traced separately: tracemalloc slows every allocation down.
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(options['alloc_requests']):
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                call()
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+
+        metrics = summarize(samples)
+        metrics.update(
+            queries_mean=round(sum(query_counts) / len(query_counts), 2),
+            queries_max=max(query_counts),
+            alloc_peak_kib_p50=round(percentile(peaks, 50) / 1024, 1),
+            alloc_peak_kib_max=round(max(peaks, default=0) / 1024, 1),
+        )
+        return metrics
+
+    def write(self, scale, name, metrics):
+        self.stdout.write(
+            f"  {name:>15}: p50 {metrics['p50_ms']:7.2f} ms, "
+            f"p95 {metrics['p95_ms']:7.2f} ms, "
+            f"p99 {metrics['p99_ms']:7.2f} ms, "
+            f"{metrics['queries_mean']:5.1f} queries, "
+            f"{metrics['alloc_peak_kib_p50']:8.1f} KiB peak"
+        )
@@ -0,0 +1,198 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.benchmarks import summarize
+
+
+HOST = '127.0.0.1'
+
+# (label, server, path) combinations measured. Async views under WSGI
+# would run in a fresh event loop per request, so they are left out.
+RUNS = (
+    ('gunicorn gthread, sync view', 'wsgi', '/api/listing/'),
+    ('uvicorn, sync view', 'asgi', '/api/listing/'),
+    ('uvicorn, async view', 'asgi', '/api/async/listing/'),
+)
+
+
+class Command(BaseCommand):
+    help = ("Compare concurrent listing read throughput of the WSGI "
+            "deployment (gunicorn, threads) with uvicorn serving the sync "
+            "and the async listing views, with slow clients")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1,
+                            help="seed --scale run (and kept) first")
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=64,
+                            help="Concurrent keep-alive clients")
+        parser.add_argument('--slow-client', type=float, default=0.05,
+                            help="Seconds each client pauses halfway "
+                                 "through sending its request")
+        parser.add_argument('--workers', type=int, default=2,
+                            help="Server processes of each deployment")
+        parser.add_argument('--threads', type=int, default=8,
+                            help="Threads per gunicorn worker")
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--response-cache', action='store_true',
+                            help="Keep the anonymous listings response "
+                                 "cache on (off: measure the DB path)")
+
+    def handle(self, *args, **options):
+        # The servers are other processes: the rows must be committed.
+        call_command('seed', scale=options['scale'], stdout=StringIO())
+        self.stdout.write(
+            f"{options['requests']} requests, {options['concurrency']} "
+            f"clients pausing {options['slow_client'] * 1000:.0f} ms, "
+            f"{options['workers']} workers"
+        )
+        for label, server, path in RUNS:
+            with self.server(server, options) as port:
+                url = f"{path}?page_size={options['page_size']}"
+                samples, errors, elapsed = asyncio.run(
+                    self.load(port, url, options)
+                )
+            metrics = summarize(samples)
+            self.stdout.write(
+                f"{label:>28}: {len(samples) / elapsed:8,.0f} req/s, "
+                f"p50 {metrics['p50_ms']:8.2f} ms, "
+                f"p99 {metrics['p99_ms']:8.2f} ms, {errors} errors"
+            )
+
+    @contextmanager
+    def server(self, kind, options):
+        with socket.socket() as probe:
+            probe.bind((HOST, 0))
+            port = probe.getsockname()[1]
+        if kind == 'wsgi':
+            command = ['gunicorn', 'alx_travel_app.wsgi:application',
+                       '--worker-class', 'gthread',
+                       '--threads', str(options['threads']),
+                       '--bind', f'{HOST}:{port}']
+        else:
+            command = ['uvicorn', 'alx_travel_app.asgi:application',
+                       '--host', HOST, '--port', str(port),
+                       '--no-access-log']
+        command += ['--workers', str(options['workers']),
+                    '--log-level', 'warning']
+        env = dict(os.environ,
+                   DJANGO_SETTINGS_MODULE=os.environ.get(
+                       'DJANGO_SETTINGS_MODULE', 'alx_travel_app.settings'
+                   ))
+        if not options['response_cache']:
+            # Otherwise every run but the first reads the shared cache.
+            env['LISTINGS_CACHE_TIMEOUT'] = '0'
+        process = subprocess.Popen(
+            [sys.executable, '-m', *command], cwd=settings.BASE_DIR, env=env
+        )
+        try:
+            self.wait_for(process, port)
+            yield port
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def wait_for(self, process, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"{process.args[2]} exited with "
+                                   f"{process.returncode}")
+            try:
+                socket.create_connection((HOST, port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError(f"{process.args[2]} did not start in {timeout}s")
+
+    async def load(self, port, url, options):
+        head = f'GET {url} HTTP/1.1\r\n'.encode()
+        rest = f'Host: {HOST}:{port}\r\nAccept: application/json\r\n\r\n'
+        rest = rest.encode()
+
+        async def run(requests):
+            remaining = requests
+            samples = []
+            errors = 0
+
+            async def client():
+                nonlocal remaining, errors
+                reader = writer = None
+                while remaining > 0:
+                    remaining -= 1
+                    start = time.perf_counter()
+                    try:
+                        if writer is None:
+                            reader, writer = await asyncio.open_connection(
+                                HOST, port
+                            )
+                        # A slow client: the server waits for the rest of
+                        # the request, holding the connection (and, under
+                        # WSGI, a thread).
+                        writer.write(head)
+                        await writer.drain()
+                        await asyncio.sleep(options['slow_client'])
+                        writer.write(rest)
+                        await writer.drain()
+                        status, keep_alive = await read_response(reader)
+                    except (OSError, asyncio.IncompleteReadError,
+                            ValueError):
+                        status, keep_alive = None, False
+                    if status == 200:
+                        samples.append(time.perf_counter() - start)
+                    else:
+                        errors += 1
+                    if not keep_alive and writer is not None:
+                        writer.close()
+                        reader = writer = None
+                if writer is not None:
+                    writer.close()
+
+            await asyncio.gather(*(client()
+                                   for _ in range(options['concurrency'])))
+            return samples, errors
+
+        # One request per client first, so every worker is warm.
+        await run(options['concurrency'])
+        started = time.perf_counter()
+        samples, errors = await run(options['requests'])
+        return samples, errors, time.perf_counter() - started
+
+
+async def read_response(reader):
+    """
+    Reads one HTTP/1.1 response; returns its status and whether the
+    connection stays open.
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    return status, headers.get('connection', '').lower() != 'close'
@@ -0,0 +1,90 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.utils import load_backend
+
+from listings.backends.pool import PooledDatabaseWrapperMixin, pooled
+from listings.benchmarks import summarize
+
+
+QUERY = 'SELECT 1'
+
+
+class Command(BaseCommand):
+    help = ("Measure the connection cost of a one-query request: a new "
+            "connection per request, persistent connections with and "
+            "without health checks, and the connection pool")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        settings_dict = connections[options['database']].settings_dict
+        wrapper_class = load_backend(settings_dict['ENGINE']).DatabaseWrapper
+        # Compare against the plain backend when the pool is configured.
+        plain = next(cls for cls in wrapper_class.__mro__
+                     if not issubclass(cls, PooledDatabaseWrapperMixin))
+        modes = (
+            ('connect per request', plain,
+             {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+            ('persistent', plain,
+             {'CONN_MAX_AGE': None, 'CONN_HEALTH_CHECKS': False}),
+            ('persistent + checks', plain,
+             {'CONN_MAX_AGE': None, 'CONN_HEALTH_CHECKS': True}),
+            ('pooled + checks', pooled(plain),
+             {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True}),
+        )
+
+        results = {}
+        for label, cls, overrides in modes:
+            wrapper = cls(dict(settings_dict, **overrides),
+                          alias=f'bench-{label}')
+            results[label] = self.run(wrapper, options['requests'])
+            opened, metrics = results[label]
+            self.stdout.write(
+                f"{label:>20}: {metrics['count'] / metrics['total_s']:9,.0f}"
+                f" req/s, p50 {metrics['p50_ms']:6.3f} ms, "
+                f"p95 {metrics['p95_ms']:6.3f} ms, {opened} connections"
+            )
+
+        baseline = results['connect per request'][1]['mean_ms']
+        for label in ('persistent + checks', 'pooled + checks'):
+            saved = baseline - results[label][1]['mean_ms']
+            self.stdout.write(f"{label} saves {saved:.3f} ms per request")
+
+    def run(self, wrapper, requests):
+        opened = 0
+
+        def count(sender, connection, **kwargs):
+            # Pool check-outs send it too; only count real opens.
+            nonlocal opened
+            opened += (connection is wrapper and
+                       not getattr(wrapper, 'reused_connection', False))
+
+        samples = []
+        connection_created.connect(count)
+        started = time.perf_counter()
+        try:
+            for _ in range(requests):
+                start = time.perf_counter()
+                # What request_started and request_finished do around a
+                # request that runs a single query.
+                wrapper.close_if_unusable_or_obsolete()
+                with wrapper.cursor() as cursor:
+                    cursor.execute(QUERY)
+                    cursor.fetchone()
+                wrapper.close_if_unusable_or_obsolete()
+                samples.append(time.perf_counter() - start)
+        finally:
+            total = time.perf_counter() - started
+            connection_created.disconnect(count)
+            wrapper.close()
+            if isinstance(wrapper, PooledDatabaseWrapperMixin):
+                wrapper.get_pool(None).close()
+
+        metrics = summarize(samples)
+        metrics['total_s'] = total
+        return opened, metrics
@@ -0,0 +1,99 @@
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from listings import notifications, rendering
+from listings.models import Booking, Listing, Payment
+
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic rows once the benchmark is done."""
+
+
+class Command(BaseCommand):
+    help = ("Measure notification render throughput with the per-locale "
+            "template cache and batched context fetch")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--locales', default='en-us,fr',
+                            help="Comma-separated locales to cycle through")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                batch = self.insert_bookings(options['messages'],
+                                             options['locales'].split(','))
+                self.run(batch, options['batch_size'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def insert_bookings(self, count, locales):
+        operator = User.objects.create_user(
+            username=f'bench-{uuid.uuid4().hex[:8]}',
+            email=f'bench-{uuid.uuid4().hex[:8]}@example.com'
+        )
+        listing = Listing.objects.create(
+            operator=operator, name='Bench route',
+            departure_time=timezone.now() + timedelta(days=1),
+            price=Decimal('100.00'), available_seats=0, total_seats=count
+        )
+        bookings = Booking.objects.bulk_create([
+            Booking(listing=listing, passenger_name=f'Passenger {i}',
+                    passenger_email=f'p{i}@example.com', num_seats=1,
+                    booking_date=timezone.now(), amount_paid=Decimal('100'))
+            for i in range(count)
+        ], batch_size=1000)
+        Payment.objects.bulk_create([
+            Payment(booking=booking, tx_ref=f'tx-bench-{i}',
+                    amount=Decimal('100'), status='completed')
+            for i, booking in enumerate(bookings)
+        ], batch_size=1000)
+        return [
+            notifications.payment_confirmation(booking.booking_id,
+                                               locales[i % len(locales)])
+            for i, booking in enumerate(bookings)
+        ]
+
+    def run(self, batch, batch_size):
+        def per_message():
+            # A template lookup and a query for every message.
+            for notification in batch:
+                rendering.get_templates.cache_clear()
+                booking = Booking.objects.select_related(
+                    'listing', 'payment'
+                ).get(pk=notification['booking_id'])
+                notifications.build_message(notification, booking).message()
+
+        def batched():
+            rendering.get_templates.cache_clear()
+            for start in range(0, len(batch), batch_size):
+                chunk = batch[start:start + batch_size]
+                bookings = notifications.fetch_bookings(chunk)
+                for notification in chunk:
+                    notifications.build_message(
+                        notification, bookings[notification['booking_id']]
+                    ).message()
+
+        for label, func in (('per message', per_message),
+                            (f'batch of {batch_size}', batched)):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label:>13}: {len(batch) / elapsed:9,.0f} messages/s "
+                f"({len(queries)} queries, {elapsed:.2f}s for {len(batch)})"
+            )
@@ -0,0 +1,102 @@
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from listings import notifications
+from listings.fake_smtp import FakeSMTPServer
+from listings.models import Booking, Listing
+
+
+User = get_user_model()
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic rows once the benchmark is done."""
+
+
+class Command(BaseCommand):
+    help = ("Compare messages/second of one SMTP connection per email "
+            "against batched sends over a local SMTP stand-in")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--handshake', type=float, default=0.01,
+                            help="Seconds the stand-in takes to open a "
+                                 "session (TLS/auth on a real relay)")
+        parser.add_argument('--batch-sizes', default='10,50,200',
+                            help="Comma-separated batch sizes")
+
+    def handle(self, *args, **options):
+        try:
+            batch_sizes = [int(value) for value in
+                           options['batch_sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--batch-sizes takes integers, e.g. 10,50")
+
+        try:
+            with transaction.atomic():
+                pending = self.insert_bookings(options['messages'])
+                self.run(pending, options['handshake'], batch_sizes)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def insert_bookings(self, count):
+        operator = User.objects.create_user(
+            username=f'bench-{uuid.uuid4().hex[:8]}',
+            email=f'bench-{uuid.uuid4().hex[:8]}@example.com'
+        )
+        listing = Listing.objects.create(
+            operator=operator, name='Bench route',
+            departure_time=timezone.now() + timedelta(days=1),
+            price=Decimal('100.00'), available_seats=0, total_seats=count
+        )
+        bookings = Booking.objects.bulk_create([
+            Booking(listing=listing, passenger_name=f'Passenger {i}',
+                    passenger_email=f'p{i}@example.com', num_seats=1,
+                    booking_date=timezone.now(), amount_paid=Decimal('100'))
+            for i in range(count)
+        ], batch_size=1000)
+        return [notifications.booking_confirmation(booking.booking_id)
+                for booking in bookings]
+
+    def run(self, pending, handshake, batch_sizes):
+        with FakeSMTPServer() as smtp:
+            smtp.delay = handshake
+
+            def connection():
+                return get_connection(SMTP_BACKEND, host=smtp.host,
+                                      port=smtp.port, timeout=10)
+
+            def per_message():
+                for notification in pending:
+                    notifications.send_batch([notification], connection())
+
+            self.report('per message', smtp, per_message)
+            for size in batch_sizes:
+                def batched():
+                    for start in range(0, len(pending), size):
+                        notifications.send_batch(
+                            pending[start:start + size], connection()
+                        )
+                self.report(f'batch of {size}', smtp, batched)
+
+    def report(self, label, smtp, func):
+        smtp.connections = 0
+        smtp.messages.clear()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        sent = len(smtp.messages)
+        self.stdout.write(f"{label:>14}: {sent / elapsed:9,.0f} messages/s "
+                          f"({smtp.connections} connections, "
+                          f"{elapsed:.2f}s for {sent})")
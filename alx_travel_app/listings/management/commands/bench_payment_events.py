@@ -0,0 +1,129 @@
+import json
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from listings import payments
+from listings.benchmarks import stopwatch, summarize
+from listings.fake_gateway import FakeChapaServer
+from listings.gateway import ChapaClient
+from listings.models import Booking, Listing, Payment, PaymentEvent
+from listings.views import chapa_webhook
+
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic rows once the benchmark is done."""
+
+
+class Command(BaseCommand):
+    help = ("Measure webhook intake latency and queued verification "
+            "throughput against a local stand-in for Chapa")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=1000,
+                            help="Pending payments to confirm")
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help="Seconds the stand-in gateway takes "
+                                 "per call")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--concurrency', default='1,8,32',
+                            help="Comma-separated verify concurrencies")
+
+    def handle(self, *args, **options):
+        try:
+            concurrencies = [int(value) for value in
+                             options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency takes integers, e.g. 1,8,32")
+
+        with FakeChapaServer() as chapa, \
+                override_settings(CHAPA_WEBHOOK_SECRET='bench'):
+            chapa.delay = options['latency']
+            client = ChapaClient(chapa.url, 'bench', read_timeout=30,
+                                 max_retries=0,
+                                 pool_size=max(concurrencies))
+            try:
+                with transaction.atomic():
+                    tx_refs = self.insert_payments(options['events'])
+                    self.intake(tx_refs)
+                    for concurrency in concurrencies:
+                        self.drain(client, concurrency,
+                                   options['batch_size'])
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def insert_payments(self, count):
+        operator = User.objects.create_user(
+            username=f'bench-{uuid.uuid4().hex[:8]}',
+            email=f'bench-{uuid.uuid4().hex[:8]}@example.com'
+        )
+        listing = Listing.objects.create(
+            operator=operator, name='Bench route',
+            departure_time=timezone.now() + timedelta(days=1),
+            price=Decimal('100.00'), available_seats=count, total_seats=count
+        )
+        bookings = Booking.objects.bulk_create([
+            Booking(listing=listing, passenger_name=f'Passenger {i}',
+                    passenger_email=f'p{i}@example.com', num_seats=1,
+                    booking_date=timezone.now(), amount_paid=Decimal('100'))
+            for i in range(count)
+        ], batch_size=1000)
+        tx_refs = [f'tx-bench-{i}' for i in range(count)]
+        Payment.objects.bulk_create([
+            Payment(booking=booking, tx_ref=tx_ref, amount=Decimal('100'))
+            for booking, tx_ref in zip(bookings, tx_refs)
+        ], batch_size=1000)
+        return tx_refs
+
+    def intake(self, tx_refs):
+        factory = RequestFactory()
+        samples = []
+        for tx_ref in tx_refs:
+            body = json.dumps({'event': 'charge.success', 'tx_ref': tx_ref,
+                               'status': 'success'}).encode()
+            request = factory.post(
+                '/api/payments/webhook/', body,
+                content_type='application/json',
+                HTTP_CHAPA_SIGNATURE=payments.sign(body)
+            )
+            with stopwatch(samples):
+                response = chapa_webhook(request)
+            if response.status_code != 200:
+                raise CommandError(f"Webhook answered {response.status_code}")
+
+        stats = summarize(samples)
+        self.stdout.write(
+            f"webhook intake: p50 {stats['p50_ms']} ms, "
+            f"p99 {stats['p99_ms']} ms over {stats['count']} events"
+        )
+
+    def drain(self, client, concurrency, batch_size):
+        # Re-queue every event against pending payments for each run.
+        Payment.objects.update(status='pending', chapa_transaction_id=None)
+        Booking.objects.update(status='pending')
+        PaymentEvent.objects.update(status=PaymentEvent.RECEIVED,
+                                    claimed_at=None, processed_at=None)
+
+        start = time.perf_counter()
+        stats = payments.drain(max_batches=10 ** 6, batch_size=batch_size,
+                               concurrency=concurrency, client=client)
+        elapsed = time.perf_counter() - start
+        if stats['completed'] != stats['claimed']:
+            raise CommandError(f"Unexpected outcomes: {dict(stats)}")
+        self.stdout.write(
+            f"drain concurrency={concurrency:<3}: "
+            f"{stats['completed'] / elapsed:9,.1f} payments/s "
+            f"({elapsed:.2f}s for {stats['completed']})"
+        )
@@ -0,0 +1,110 @@
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from listings.benchmarks import explain, stopwatch, summarize
+from listings.models import Listing, STATES, TRANSPORT_CHOICES
+from listings.serializers import ListingSearchSerializer
+
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic rows once the benchmark is done."""
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the route search query and show whether it runs as "
+            "an index range scan or a full table scan")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=0,
+                            help="Synthetic listings to insert first "
+                                 "(rolled back unless --keep)")
+        parser.add_argument('--repeat', type=int, default=200,
+                            help="Number of timed searches")
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep the synthetic listings")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['rows']:
+                    self.insert_listings(options['rows'], options['seed'])
+                self.run(options['repeat'], options['seed'])
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            pass
+
+    def insert_listings(self, rows, seed):
+        rng = random.Random(seed)
+        codes = [code for code, _ in STATES]
+        transports = [value for value, _ in TRANSPORT_CHOICES]
+        operator = User.objects.create_user(
+            username=f'bench-{uuid.uuid4().hex[:8]}',
+            email=f'bench-{uuid.uuid4().hex[:8]}@example.com',
+        )
+        now = timezone.now()
+
+        self.stdout.write(f"Inserting {rows} listings...")
+        batch = []
+        for _ in range(rows):
+            total = rng.randint(20, 60)
+            batch.append(Listing(
+                operator=operator,
+                transport_type=rng.choice(transports),
+                description='Benchmark listing',
+                origin=rng.choice(codes),
+                destination=rng.choice(codes),
+                departure_time=now + timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+                price=Decimal(rng.randint(5000, 30000)),
+                available_seats=rng.randint(0, total),
+                total_seats=total,
+            ))
+            if len(batch) == 1000:
+                Listing.objects.bulk_create(batch)
+                batch = []
+        Listing.objects.bulk_create(batch)
+
+    def run(self, repeat, seed):
+        rng = random.Random(seed)
+        codes = [code for code, _ in STATES]
+        now = timezone.now()
+
+        def build_query():
+            start = now + timedelta(days=rng.randint(0, 80))
+            params = ListingSearchSerializer(data={
+                'origin': rng.choice(codes),
+                'destination': rng.choice(codes),
+                'departure_after': start,
+                'departure_before': start + timedelta(days=7),
+                'min_seats': 1,
+            })
+            params.is_valid(raise_exception=True)
+            return params.filter_queryset(Listing.objects.all()).order_by(
+                'departure_time', 'listing_id')
+
+        plan, full_scan = explain(build_query())
+        self.stdout.write("Query plan:")
+        self.stdout.write(plan)
+
+        samples = []
+        for _ in range(repeat):
+            queryset = build_query()
+            with stopwatch(samples):
+                list(queryset[:50])
+
+        self.stdout.write(f"Latency: {summarize(samples)}")
+        if full_scan:
+            self.stdout.write(self.style.ERROR("Full table scan"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Index range scan"))
@@ -0,0 +1,98 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from listings.models import Listing
+from listings.serializers import ListingSerializer
+from listings.views import ListingViewSet
+
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic rows once the benchmark is done."""
+
+
+class Command(BaseCommand):
+    help = ("Compare rows/second of ListingSerializer against the compiled "
+            "listing read plan and check both render identical JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000,
+                            help="Synthetic listings to serialize")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.insert_listings(options['rows'])
+                self.run(options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def insert_listings(self, rows):
+        rng = random.Random(7)
+        operators = [
+            User.objects.create_user(
+                username=f'bench-{uuid.uuid4().hex[:8]}',
+                email=f'bench-{uuid.uuid4().hex[:8]}@example.com',
+                first_name='Bench', last_name=str(i)
+            )
+            for i in range(20)
+        ]
+        now = timezone.now()
+        Listing.objects.bulk_create([
+            Listing(
+                operator=rng.choice(operators),
+                name=f'Route {i}' if i % 10 else None,
+                description='Benchmark listing ' * 10,
+                departure_time=now + timedelta(minutes=rng.randint(0, 10 ** 5)),
+                price=Decimal(rng.randint(500000, 3000000)) / 100,
+                available_seats=rng.randint(0, 40),
+                total_seats=40,
+            )
+            for i in range(rows)
+        ], batch_size=1000)
+
+    def run(self, repeat):
+        renderer = JSONRenderer()
+        queryset = ListingViewSet.queryset.order_by('departure_time',
+                                                    'listing_id')
+        plan = ListingViewSet.read_plan
+
+        def serializer_path():
+            return renderer.render(
+                ListingSerializer(queryset.all(), many=True).data
+            )
+
+        def plan_path():
+            return renderer.render(
+                plan.render(plan.values_list(queryset.all()))
+            )
+
+        if serializer_path() != plan_path():
+            raise CommandError("Read plan output differs from "
+                               "ListingSerializer")
+
+        rows = queryset.count()
+        for label, func in (('ListingSerializer', serializer_path),
+                            ('ReadPlan', plan_path)):
+            best = min(self.timed(func) for _ in range(repeat))
+            self.stdout.write(f"{label:>17}: {rows / best:12,.0f} rows/s "
+                              f"({best * 1000:.1f} ms for {rows} rows)")
+
+    @staticmethod
+    def timed(func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
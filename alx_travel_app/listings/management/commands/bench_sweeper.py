@@ -0,0 +1,118 @@
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from listings import sweeper
+from listings.benchmarks import explain
+from listings.fake_gateway import FakeChapaServer
+from listings.gateway import ChapaClient
+from listings.models import Booking, Listing, Payment
+
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic rows once the benchmark is done."""
+
+
+class Command(BaseCommand):
+    help = ("Time a stale payment sweep over a large payments table, "
+            "verifying against a local stand-in for Chapa")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000,
+                            help="Settled payments (and bookings) in the "
+                                 "table")
+        parser.add_argument('--stale', type=int, default=2000,
+                            help="Stale pending payments to reconcile")
+        parser.add_argument('--latency', type=float, default=0.01,
+                            help="Seconds the stand-in gateway takes "
+                                 "per call")
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        with FakeChapaServer() as chapa:
+            chapa.delay = options['latency']
+            client = ChapaClient(chapa.url, 'bench', read_timeout=30,
+                                 max_retries=0,
+                                 pool_size=options['concurrency'])
+            try:
+                with transaction.atomic():
+                    self.insert_rows(chapa, options['rows'],
+                                     options['stale'])
+                    self.run(client, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def insert_rows(self, chapa, rows, stale):
+        start = time.perf_counter()
+        operator = User.objects.create_user(
+            username=f'bench-{uuid.uuid4().hex[:8]}',
+            email=f'bench-{uuid.uuid4().hex[:8]}@example.com'
+        )
+        listing = Listing.objects.create(
+            operator=operator, name='Bench route',
+            departure_time=timezone.now() + timedelta(days=1),
+            price=Decimal('100.00'), available_seats=0,
+            total_seats=rows + stale
+        )
+
+        batch = 10000
+        for offset in range(0, rows + stale, batch):
+            count = min(batch, rows + stale - offset)
+            settled = [offset + i < rows for i in range(count)]
+            bookings = Booking.objects.bulk_create([
+                Booking(listing=listing,
+                        passenger_name=f'Passenger {offset + i}',
+                        passenger_email=f'p{offset + i}@example.com',
+                        num_seats=1, booking_date=timezone.now(),
+                        amount_paid=Decimal('100'),
+                        status='confirmed' if done else 'pending')
+                for i, done in enumerate(settled)
+            ])
+            Payment.objects.bulk_create([
+                Payment(booking=booking, tx_ref=f'tx-bench-{offset + i}',
+                        amount=Decimal('100'),
+                        status='completed' if done else 'pending')
+                for i, (booking, done) in enumerate(zip(bookings, settled))
+            ])
+            self.stdout.write(f"\rinserted {offset + count:,} payments",
+                              ending='')
+            self.stdout.flush()
+
+        # auto_now_add ignores explicit values, so age the rows afterwards.
+        Payment.objects.filter(status='pending').update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        # Half of the stale checkouts were abandoned.
+        for tx_ref in Payment.objects.filter(status='pending').values_list(
+                'tx_ref', flat=True)[::2]:
+            chapa.outcomes[tx_ref] = 'failed'
+        self.stdout.write(f"\nseeded in {time.perf_counter() - start:.1f}s")
+
+    def run(self, client, options):
+        plan, full_scan = explain(
+            Payment.objects.filter(
+                status='pending', created_at__lt=timezone.now()
+            ).order_by('created_at', 'pk')
+            .values('pk')[:options['chunk_size']]
+        )
+        access = 'FULL SCAN' if full_scan else 'index'
+        self.stdout.write(f"chunk query plan ({access}):")
+        self.stdout.write(plan)
+
+        report = sweeper.sweep(chunk_size=options['chunk_size'],
+                               limit=options['stale'] * 2,
+                               concurrency=options['concurrency'],
+                               client=client)
+        for name in sweeper.COUNTERS + ('seconds', 'rows_per_second'):
+            self.stdout.write(f"{name:>20}: {report[name]}")
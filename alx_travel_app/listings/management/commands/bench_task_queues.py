@@ -0,0 +1,86 @@
+import time
+from contextlib import ExitStack
+
+from celery import Celery
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.benchmarks import summarize
+from listings.fake_broker import FakeBroker
+
+
+EMAIL_TASK = 'listings.tasks.send_notifications'
+PAYMENT_TASK = 'listings.tasks.process_payment_events'
+
+
+class Command(BaseCommand):
+    help = ("Measure queue latency of payment tasks while email tasks "
+            "flood the broker, with one shared queue and with the "
+            "configured queues, routes and worker profiles")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=1000,
+                            help="Email tasks queued up front")
+        parser.add_argument('--email-time', type=float, default=0.02,
+                            help="Seconds an email task runs (SMTP)")
+        parser.add_argument('--payments', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=0.02,
+                            help="Seconds between payment tasks")
+
+    def handle(self, *args, **options):
+        profiles = {name: settings.WORKER_PROFILES[name]
+                    for name in ('payments', 'email')}
+        # The same processes in total, all consuming one queue.
+        shared = {'default': {
+            'queues': ['default'],
+            'concurrency': sum(profile['concurrency']
+                               for profile in profiles.values()),
+            'prefetch_multiplier': settings.CELERY_WORKER_PREFETCH_MULTIPLIER,
+        }}
+        for label, routes, workers in (
+                ('shared queue', {}, shared),
+                ('routed', settings.CELERY_TASK_ROUTES, profiles)):
+            latencies = self.run(routes, workers, options)
+            report = summarize(latencies)
+            self.stdout.write(
+                f"{label:>12}: payment wait p50 {report['p50_ms']:8.1f} ms, "
+                f"p95 {report['p95_ms']:8.1f} ms, "
+                f"p99 {report['p99_ms']:8.1f} ms ({report['count']} tasks)"
+            )
+
+    def make_app(self, routes):
+        app = Celery('bench', set_as_current=False)
+        app.conf.update(
+            task_default_queue=settings.CELERY_TASK_DEFAULT_QUEUE,
+            task_default_priority=settings.CELERY_TASK_DEFAULT_PRIORITY,
+            task_queues=settings.CELERY_TASK_QUEUES,
+            task_routes=routes,
+        )
+        return app
+
+    def run(self, routes, workers, options):
+        latencies = []
+
+        def send_notifications(notifications):
+            time.sleep(options['email_time'])
+
+        def process_payment_events(queued_at):
+            latencies.append(time.monotonic() - queued_at)
+
+        broker = FakeBroker(self.make_app(routes), {
+            EMAIL_TASK: send_notifications,
+            PAYMENT_TASK: process_payment_events,
+        })
+        with ExitStack() as stack:
+            for profile in workers.values():
+                stack.enter_context(broker.worker(
+                    profile['queues'], profile['concurrency'],
+                    profile['prefetch_multiplier']
+                ))
+            for _ in range(options['emails']):
+                broker.send_task(EMAIL_TASK, [[]])
+            for _ in range(options['payments']):
+                broker.send_task(PAYMENT_TASK, [time.monotonic()])
+                time.sleep(options['interval'])
+            broker.join()
+        return latencies
@@ -0,0 +1,70 @@
+import uuid
+
+from celery.app.trace import build_tracer
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django_celery_results.backends import DatabaseBackend
+
+from listings.tasks import send_notifications
+
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class Rollback(Exception):
+    """Raised to discard the stored results once the benchmark is done."""
+
+
+class Command(BaseCommand):
+    help = ("Count database writes per task run by a worker with the "
+            "previous result settings (django-db backend, every result "
+            "stored) and with the current per-task policies")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        task = send_notifications
+        app = task.app
+        # What every task ran with before: results and STARTED states
+        # written to django_celery_results.
+        before = {'ignore_result': False, 'track_started': True,
+                  'backend': DatabaseBackend(app=app, url='django-db')}
+        current = {name: getattr(task, name) for name in before}
+
+        for label, policy in (('django-db, stored', before),
+                              ('current policy', current)):
+            writes = self.run(task, policy, options['tasks'])
+            self.stdout.write(
+                f"{label:>17}: {writes:7,} DB writes per "
+                f"{options['tasks']:,} {task.name} runs "
+                f"(ignore_result={policy['ignore_result']})"
+            )
+
+    def run(self, task, policy, count):
+        saved = {name: getattr(task, name) for name in policy}
+        for name, value in policy.items():
+            setattr(task, name, value)
+        try:
+            # The tracer is what a worker runs for each message, with the
+            # same result bookkeeping but no broker.
+            tracer = build_tracer(task.name, task, eager=False,
+                                  propagate=True, app=task.app)
+            writes = 0
+
+            def count_writes(execute, sql, params, many, context):
+                nonlocal writes
+                writes += sql.lstrip().upper().startswith(WRITES)
+                return execute(sql, params, many, context)
+
+            with transaction.atomic(), \
+                    connection.execute_wrapper(count_writes):
+                for _ in range(count):
+                    tracer(str(uuid.uuid4()), [[]], {},
+                           {'delivery_info': {}})
+                raise Rollback
+        except Rollback:
+            return writes
+        finally:
+            for name, value in saved.items():
+                setattr(task, name, value)
@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from listings.models import Listing, Review
+
+
+class Command(BaseCommand):
+    help = ("Recompute review_count, rating_sum and rating_avg on every "
+            "listing from its reviews, in batches")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Listings recomputed per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = None
+        done = 0
+
+        while True:
+            with transaction.atomic():
+                queryset = Listing.objects.order_by('pk')
+                if last_pk is not None:
+                    queryset = queryset.filter(pk__gt=last_pk)
+                # Lock the batch so concurrent review writes queue behind
+                # the recount instead of being overwritten by it.
+                listings = list(
+                    queryset.select_for_update().only(
+                        'pk', 'review_count', 'rating_sum', 'rating_avg'
+                    )[:batch_size]
+                )
+                if not listings:
+                    break
+
+                totals = {
+                    row['listing_id']: row for row in
+                    Review.objects.filter(listing__in=listings)
+                    .values('listing_id')
+                    .annotate(count=Count('pk'), total=Sum('rating'))
+                }
+                for listing in listings:
+                    row = totals.get(listing.pk, {'count': 0, 'total': 0})
+                    listing.review_count = row['count']
+                    listing.rating_sum = row['total']
+                    listing.rating_avg = (
+                        round(Decimal(row['total']) / row['count'], 2)
+                        if row['count'] else Decimal('0')
+                    )
+                Listing.objects.bulk_update(
+                    listings, ['review_count', 'rating_sum', 'rating_avg']
+                )
+
+            last_pk = listings[-1].pk
+            done += len(listings)
+            self.stdout.write(f"Rebuilt ratings for {done} listings...")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt ratings for {done} listings."
+        ))
@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from listings import outbox
+
+
+class Command(BaseCommand):
+    help = ("Publish committed outbox rows to the Celery broker in batches "
+            "until interrupted")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            default=settings.OUTBOX_RELAY_INTERVAL,
+                            help="Seconds to wait when the outbox is empty")
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument('--once', action='store_true',
+                            help="Relay what is pending and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            try:
+                stats = outbox.relay_all(options['batch_size'])
+            except Exception as exc:
+                # Broker or database down: keep the rows and try again.
+                self.stderr.write(f"Outbox relay failed: {exc}")
+                stats = {}
+            if stats.get('relayed') and options['verbosity'] > 1:
+                self.stdout.write(f"Relayed {stats['relayed']} rows as "
+                                  f"{stats['published']} task messages")
+            if options['once']:
+                return
+            if not stats.get('relayed'):
+                time.sleep(options['interval'])
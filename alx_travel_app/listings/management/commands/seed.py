@@ -1,69 +1,211 @@
 import random
-from django_seed import Seed
-from django.utils import timezone
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
-from django.core.management.base import BaseCommand
-from alx_travel_app.listings.models import (
-    Listing,
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from listings.models import (
     Booking,
-    Review
+    Listing,
+    Payment,
+    Review,
+    STATES,
+    TRANSPORT_CHOICES
 )
 
 
 User = get_user_model()
 
+# Rows per unit of --scale; --scale 1 is the original small sample.
+VOLUMES = {'users': 5, 'listings': 10, 'bookings': 20, 'reviews': 30}
+
+FIRST_NAMES = ('Ada', 'Bola', 'Chidi', 'Dayo', 'Emeka', 'Funke', 'Gbenga',
+               'Halima', 'Ifeoma', 'Jide', 'Kemi', 'Lola', 'Musa', 'Ngozi',
+               'Obinna', 'Simi', 'Tunde', 'Uche', 'Yemi', 'Zainab')
+LAST_NAMES = ('Adeyemi', 'Bello', 'Chukwu', 'Danjuma', 'Eze', 'Fashola',
+              'Ibrahim', 'Nwosu', 'Okafor', 'Olawale', 'Sani', 'Yusuf')
+COMMENTS = ('Smooth trip.', 'Left on time.', 'Comfortable seats.',
+            'Late departure.', 'Friendly crew.', 'Would book again.')
 
-def run():
-    seeder = Seed.seeder()
-
-    print("Creating 5 Users...")
-    seeder.add_entity(User, 5, {
-        "first_name": lambda x: seeder.faker.first_name(),
-        "last_name": lambda x: seeder.faker.last_name(),
-        "email": lambda x: seeder.faker.unique.email(),
-        "username": lambda x: seeder.faker.unique.user_name()
-    })
-
-    print("Creating 10 Listing instances...")
-    seeder.add_entity(Listing, 10, {
-        "operator": lambda x: User.objects.order_by("?").first(),
-        "transport_type": lambda x: random.choice(['bus', 'train', 'flight', 'boat']),
-        "name": lambda x: seeder.faker.city(),
-        "description": lambda x: seeder.faker.text(max_nb_char=200),
-        "origin": lambda x: "NG-LA",
-        "destination": lambda x: "NG-CR",
-        "departure_time": lambda x: timezone.now(),
-        "price": lambda x: round(random.uniform(5000, 30000), 2),
-        "total_seats": lambda x: random.randint(20, 60),
-        "available_seats": lambda x: random.randint(5, 30),
-        "status": lambda x: random.choice(["active", "confirmed", "cancelled"]),
-    })
-
-    print("Creating 20 Booking instances...")
-    seeder.add_entity(Booking, 20, {
-        "listing": lambda x: Listing.objects.order_by("?").first(),
-        "passenger_name": lambda x: seeder.faker.name(),
-        "passenger_email": lambda x: seeder.faker.email(),
-        "num_seats": lambda x: random.randint(1, 4),
-        "booking_date": lambda x: timezone.now(),
-        "amount_paid": lambda x: round(random.uniform(3000, 20000), 2),
-        "status": lambda x: random.choice(["pending", "confirmed", "cancelled"]),
-    })
-
-    print("Creating 30 Review instances...")
-    seeder.add_entity(Review, 30, {
-        "listing": lambda x: Listing.objects.order_by("?").first(),
-        "reviewer_name": lambda x: seeder.faker.name(),
-        "rating": lambda x: random.randint(1, 5),
-        "comment": lambda x: seeder.faker.sentence(),
-    })
-
-    seeder.execute()
-    print("Database seeded successfully!")
+# Booking status -> status of its payment.
+PAYMENT_STATUS = {'pending': 'pending', 'confirmed': 'completed',
+                  'cancelled': 'failed'}
 
 
 class Command(BaseCommand):
-    help = "Seed database with initial data"
+    help = ("Seed the database with synthetic users, listings, bookings, "
+            "payments and reviews; --scale multiplies the sample size")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1,
+                            help="Multiplier of %s" % ', '.join(
+                                f'{count} {name}'
+                                for name, count in VOLUMES.items()))
+        parser.add_argument('--seed', type=int, default=42,
+                            help="Same seed, same rows: re-running it "
+                                 "inserts nothing new")
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help="Rows per bulk_create and transaction")
+        parser.add_argument('--password', default='password',
+                            help="Password of every seeded user")
+
+    def handle(self, *args, **options):
+        if options['scale'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--scale and --chunk-size must be positive")
+        self.rng = random.Random(options['seed'])
+        self.tag = f"seed{options['seed']}"
+        self.chunk_size = options['chunk_size']
+        self.counts = dict.fromkeys(('users', 'listings', 'bookings',
+                                     'payments', 'reviews'), 0)
+        self.started = time.perf_counter()
+        volumes = {name: count * options['scale']
+                   for name, count in VOLUMES.items()}
+
+        user_ids = self.seed_users(volumes['users'], options['password'])
+        self.seed_listings(volumes, user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Database seeded in {time.perf_counter() - self.started:.1f}s: "
+            + ', '.join(f'{count} {name}'
+                        for name, count in self.counts.items())
+        ))
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def progress(self, done, total, label):
+        elapsed = time.perf_counter() - self.started
+        rows = sum(self.counts.values())
+        self.stdout.write(f"{label} {done}/{total} "
+                          f"({rows} rows, {rows / elapsed:,.0f} rows/s)")
+
+    def seed_users(self, total, password):
+        # Hashing is deliberately slow; every seeded user shares one hash.
+        password = make_password(password)
+        user_ids = []
+        for start in range(0, total, self.chunk_size):
+            users = []
+            for i in range(start, min(start + self.chunk_size, total)):
+                user_ids.append(self.uuid())
+                users.append(User(
+                    user_id=user_ids[-1],
+                    username=f'{self.tag}-user{i}',
+                    email=f'{self.tag}-user{i}@example.com',
+                    first_name=self.rng.choice(FIRST_NAMES),
+                    last_name=self.rng.choice(LAST_NAMES),
+                    password=password,
+                ))
+            User.objects.bulk_create(users, ignore_conflicts=True)
+            self.counts['users'] += len(users)
+            self.progress(len(user_ids), total, "Users")
+        return user_ids
+
+    def seed_listings(self, volumes, user_ids):
+        """
+        Inserts listings a chunk at a time together with their bookings,
+        payments and reviews, so seat counts and rating aggregates are
+        known before each listing is written.
+        """
+        total = volumes['listings']
+        booking_mean = volumes['bookings'] / total
+        review_mean = volumes['reviews'] / total
+        codes = [code for code, _ in STATES]
+        names = dict(STATES)
+        transports = [value for value, _ in TRANSPORT_CHOICES]
+        today = timezone.now().replace(hour=0, minute=0, second=0,
+                                       microsecond=0)
+        rows = {Listing: [], Booking: [], Payment: [], Review: []}
+
+        for i in range(total):
+            origin, destination = self.rng.sample(codes, 2)
+            total_seats = self.rng.randint(20, 60)
+            listing = Listing(
+                listing_id=self.uuid(),
+                operator_id=self.rng.choice(user_ids),
+                transport_type=self.rng.choice(transports),
+                name=f'{names[origin]} to {names[destination]}',
+                description=f'{names[origin]} to {names[destination]} '
+                            f'service',
+                origin=origin,
+                destination=destination,
+                departure_time=today + timedelta(
+                    minutes=self.rng.randint(-30 * 24 * 60, 90 * 24 * 60)
+                ),
+                price=Decimal(self.rng.randrange(5000, 30000, 50)),
+                total_seats=total_seats,
+                available_seats=total_seats,
+                status=self.rng.choices(('active', 'confirmed', 'cancelled'),
+                                        (90, 5, 5))[0],
+            )
+            rows[Listing].append(listing)
+            self.add_bookings(listing, i, self.count(booking_mean), rows)
+            self.add_reviews(listing, self.count(review_mean), rows)
+
+            if len(rows[Listing]) == self.chunk_size or i == total - 1:
+                self.flush(rows)
+                self.progress(i + 1, total, "Listings")
+
+    def count(self, mean):
+        # Between 0 and twice the mean, so the totals match on average.
+        return self.rng.randint(0, round(2 * mean))
+
+    def add_bookings(self, listing, index, count, rows):
+        for n in range(count):
+            seats = self.rng.randint(1, 4)
+            status = self.rng.choices(('pending', 'confirmed', 'cancelled'),
+                                      (15, 75, 10))[0]
+            if status != 'cancelled':
+                if seats > listing.available_seats:
+                    break
+                listing.available_seats -= seats
+            booking = Booking(
+                booking_id=self.uuid(),
+                listing_id=listing.listing_id,
+                passenger_name=(f'{self.rng.choice(FIRST_NAMES)} '
+                                f'{self.rng.choice(LAST_NAMES)}'),
+                passenger_email=f'{self.tag}-l{index}-p{n}@example.com',
+                num_seats=seats,
+                booking_date=listing.departure_time - timedelta(
+                    days=self.rng.randint(1, 30)
+                ),
+                amount_paid=listing.price * seats,
+                status=status,
+            )
+            rows[Booking].append(booking)
+            rows[Payment].append(Payment(
+                payment_id=self.uuid(),
+                booking_id=booking.booking_id,
+                tx_ref=f'{self.tag}-tx-{booking.booking_id.hex}',
+                amount=booking.amount_paid,
+                status=PAYMENT_STATUS[status],
+            ))
+
+    def add_reviews(self, listing, count, rows):
+        ratings = self.rng.choices(range(1, 6), (5, 5, 15, 35, 40), k=count)
+        for rating in ratings:
+            rows[Review].append(Review(
+                review_id=self.uuid(),
+                listing_id=listing.listing_id,
+                reviewer_name=self.rng.choice(FIRST_NAMES),
+                rating=rating,
+                comment=self.rng.choice(COMMENTS),
+            ))
+        listing.review_count = count
+        listing.rating_sum = sum(ratings)
+        if count:
+            listing.rating_avg = round(Decimal(listing.rating_sum) / count, 2)
 
-    def handle(self, *args, **kwargs):
-        run()
+    def flush(self, rows):
+        # Parents before children; ignore_conflicts makes a re-run with
+        # the same seed a no-op instead of an IntegrityError.
+        with transaction.atomic():
+            for model, objs in rows.items():
+                model.objects.bulk_create(objs, batch_size=self.chunk_size,
+                                          ignore_conflicts=True)
+                self.counts[model._meta.verbose_name_plural] += len(objs)
+                objs.clear()
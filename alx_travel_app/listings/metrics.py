@@ -0,0 +1,208 @@
+"""
+Prometheus metrics for the API, the Chapa client and Celery tasks.
+
+``MetricsMiddleware`` times every request by view name (``listing-list``,
+``payment-verify``, ...), the listings cache counts its hits and misses,
+the Chapa client times each call including its retries, the stale payment
+sweeper counts the rows it handles, and Celery's task signals time every
+task run. ``/metrics`` serves them together with the sampled profiles of
+``listings.profiling``.
+
+Gunicorn and Celery's prefork pool run several processes, each with its
+own counters. Set the ``PROMETHEUS_MULTIPROC_DIR`` environment variable to
+a directory shared by the processes of a host, emptied before they start:
+every process then writes its samples there and a scrape of any of them
+aggregates all of them. Gunicorn's ``child_exit`` hook should call
+``mark_process_dead(worker.pid)``; Celery pool processes do so themselves.
+The profiling percentiles stay per process.
+"""
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown
+)
+from django.conf import settings
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server
+)
+
+
+HTTP_REQUESTS = Counter(
+    'listings_http_requests', "Requests handled, by view and status",
+    ['view', 'method', 'status']
+)
+HTTP_LATENCY = Histogram(
+    'listings_http_request_duration_seconds', "Request latency by view",
+    ['view', 'method'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+)
+HTTP_IN_PROGRESS = Gauge(
+    'listings_http_requests_in_progress', "Requests being handled",
+    multiprocess_mode='livesum'
+)
+
+CACHE_OPERATIONS = Counter(
+    'listings_cache_operations', "Listings response cache reads by "
+    "outcome ('hit', 'miss') and failed cache calls ('error')", ['outcome']
+)
+
+GATEWAY_CALLS = Counter(
+    'listings_chapa_calls', "Chapa calls by operation and outcome: the "
+    "HTTP status, 'unavailable' or 'circuit_open'",
+    ['operation', 'outcome']
+)
+GATEWAY_RETRIES = Counter(
+    'listings_chapa_retries', "Chapa attempts after the first",
+    ['operation']
+)
+GATEWAY_LATENCY = Histogram(
+    'listings_chapa_call_duration_seconds',
+    "Chapa call latency, retries and backoff included", ['operation'],
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 25)
+)
+
+SWEEP_ROWS = Counter(
+    'listings_payment_sweep_rows', "Rows scanned, settled, cancelled and "
+    "seats released by stale payment sweeps", ['counter']
+)
+SWEEP_DURATION = Histogram(
+    'listings_payment_sweep_duration_seconds', "Stale payment sweep time",
+    buckets=(.1, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+TASK_RUNS = Counter(
+    'listings_celery_task_runs', "Task runs by final state",
+    ['task', 'state']
+)
+TASK_LATENCY = Histogram(
+    'listings_celery_task_duration_seconds', "Task run time", ['task'],
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300)
+)
+
+
+def multiprocess_mode():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def collector_registry():
+    """
+    Returns the registry a scrape reads: every process's samples in
+    multiprocess mode, this process's otherwise.
+    """
+    if not multiprocess_mode():
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def exposition():
+    """
+    Returns the body and content type of a scrape.
+    """
+    from . import profiling
+
+    body = (generate_latest(collector_registry())
+            + profiling.registry.export().encode())
+    return body, CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """
+    Drops the live gauges of the exited process ``pid``.
+    """
+    if multiprocess_mode():
+        multiprocess.mark_process_dead(pid)
+
+
+class MetricsMiddleware:
+    """
+    Counts and times every request by resolved view name.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        status = 500
+        with HTTP_IN_PROGRESS.track_inprogress():
+            try:
+                response = self.get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                self.observe(request, status, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        status = 500
+        with HTTP_IN_PROGRESS.track_inprogress():
+            try:
+                response = await self.get_response(request)
+                status = response.status_code
+                return response
+            finally:
+                self.observe(request, status, start)
+
+    def observe(self, request, status, start):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        HTTP_LATENCY.labels(view, request.method).observe(
+            time.perf_counter() - start
+        )
+        HTTP_REQUESTS.labels(view, request.method, status).inc()
+
+
+# Celery task runs. Prerun and postrun fire in the process running the
+# task, so start times are kept per task id in that process.
+_started = {}
+_started_lock = threading.Lock()
+
+
+@task_prerun.connect
+def _task_started(task_id, task, **kwargs):
+    with _started_lock:
+        _started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _task_finished(task_id, task, state=None, **kwargs):
+    with _started_lock:
+        start = _started.pop(task_id, None)
+    if start is not None:
+        TASK_LATENCY.labels(task.name).observe(time.perf_counter() - start)
+    TASK_RUNS.labels(task.name, (state or 'unknown').lower()).inc()
+
+
+@worker_init.connect
+def _serve_worker_metrics(**kwargs):
+    # The worker's main process serves its pool's samples when asked to.
+    if settings.WORKER_METRICS_PORT:
+        start_http_server(settings.WORKER_METRICS_PORT,
+                          registry=collector_registry())
+
+
+@worker_process_shutdown.connect
+def _pool_process_exited(pid=None, **kwargs):
+    mark_process_dead(pid or os.getpid())
@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_alter_listing_destination_alter_listing_origin'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['created_at', 'booking_id'], name='listings_bo_created_e53fa5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['departure_time', 'listing_id'], name='listings_li_departu_85cfbf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at', 'review_id'], name='listings_re_created_9fbceb_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 19:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['origin', 'destination', 'departure_time', 'status'], name='listings_li_origin_3e21c1_idx'),
+        ),
+    ]
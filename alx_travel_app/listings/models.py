@@ -32,6 +32,8 @@ class User(AbstractUser):
     """Custom model representation of a <User> instance."""
     user_id = models.UUIDField(primary_key=True,
                           default=uuid.uuid4, editable=False)
+    # Validates the listings that embed this user as their operator.
+    updated_at = models.DateTimeField(auto_now=True)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -44,6 +46,13 @@ class User(AbstractUser):
             models.UniqueConstraint(fields=['email'], name='unique_email')
         ]
 
+    def save(self, *args, **kwargs):
+        # Partial saves move updated_at too, except login bookkeeping.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) - {'last_login'}:
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """String representation of a <User> instance."""
         return self.username
@@ -70,9 +79,20 @@ class Listing(models.Model):
     total_seats = models.PositiveIntegerField()
     status = models.CharField(max_length=50, choices=LISTING_STATUS,
                               default='active', blank=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2,
+                                     default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['departure_time', 'listing_id']),
+            models.Index(fields=['origin', 'destination',
+                                 'departure_time', 'status'])
+        ]
+
     def __str__(self):
         """String representation of a <Listing> instance."""
         return "{} - {}: ({}) - [{}]".format(self.origin, self.destination,
@@ -97,6 +117,10 @@ class Booking(models.Model):
 
     class Meta:
         unique_together = ('listing', 'passenger_name', 'passenger_email')
+        indexes = [
+            models.Index(fields=['created_at', 'booking_id']),
+            models.Index(fields=['status', 'created_at'])
+        ]
 
     def __str__(self):
         """String representation of a <Booking> instance."""
@@ -116,6 +140,11 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'review_id'])
+        ]
+
     def __str__(self):
         """String representation of a <Review> instance."""
         return f"Review by {self.reviewer_name} for {self.listing}"
@@ -162,7 +191,73 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'])
+        ]
+
     def __str__(self):
         """String representation of a <Payment> instance."""
         return f"Payment for {self.tx_ref} - {self.status}"
 
+
+
+class PaymentEvent(models.Model):
+    """
+    Model representation of a <PaymentEvent> instance.
+    Records a Chapa webhook or callback once; replays of the same event
+    collide on dedupe_key and are dropped.
+    """
+
+    RECEIVED = 'received'
+    PROCESSING = 'processing'
+    PROCESSED = 'processed'
+    EVENT_STATUS = (
+        (RECEIVED, 'Received'),
+        (PROCESSING, 'Processing'),
+        (PROCESSED, 'Processed')
+    )
+
+    event_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    dedupe_key = models.CharField(max_length=64, unique=True)
+    tx_ref = models.CharField(max_length=255)
+    event = models.CharField(max_length=50, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=20,
+        choices=EVENT_STATUS,
+        default=RECEIVED
+    )
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+
+    def __str__(self):
+        """String representation of a <PaymentEvent> instance."""
+        return f"{self.event or 'event'} for {self.tx_ref} - {self.status}"
+
+
+class OutboxMessage(models.Model):
+    """
+    Model representation of an <OutboxMessage> instance.
+    A Celery task call written in the caller's transaction and published
+    by the outbox relay once committed.
+    """
+
+    task = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """String representation of an <OutboxMessage> instance."""
+        return f"{self.task} ({self.created_at})"
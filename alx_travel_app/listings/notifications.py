@@ -0,0 +1,112 @@
+"""
+Batched confirmation emails.
+
+Views and payment processing write notifications to the outbox instead
+of enqueueing one Celery task per email. The outbox relay merges them into
+``send_notifications`` calls of up to ``NOTIFICATION_BATCH_SIZE`` messages,
+and each call delivers its batch over one mail connection and retries only
+the recipients that failed.
+
+Notifications are plain dicts (kind, booking id and locale) so they
+survive JSON task serialization; the task renders them from the current
+rows, fetched once per batch.
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import translation
+
+from . import outbox, rendering
+from .models import Booking
+
+
+logger = logging.getLogger(__name__)
+
+
+# Notification kind -> template name (see listings.rendering).
+MESSAGES = {
+    'booking': 'booking_confirmation',
+    'payment': 'payment_confirmation',
+}
+
+
+def _notification(kind, booking_id, locale):
+    return {'kind': kind, 'booking_id': str(booking_id),
+            'locale': locale or translation.get_language() or
+            settings.LANGUAGE_CODE}
+
+
+def booking_confirmation(booking_id, locale=None):
+    return _notification('booking', booking_id, locale)
+
+
+def payment_confirmation(booking_id, locale=None):
+    return _notification('payment', booking_id, locale)
+
+
+def fetch_bookings(notifications):
+    """
+    Loads the bookings of a batch with their listing and payment in one
+    query, keyed by booking id string.
+    """
+    bookings = Booking.objects.select_related('listing', 'payment').in_bulk(
+        {notification['booking_id'] for notification in notifications}
+    )
+    return {str(pk): booking for pk, booking in bookings.items()}
+
+
+def build_message(notification, booking):
+    """
+    Renders a notification for ``booking`` into an <EmailMultiAlternatives>
+    with plain-text and HTML bodies.
+    """
+    subject, text, html = rendering.render(
+        MESSAGES[notification['kind']], rendering.booking_context(booking),
+        notification['locale']
+    )
+    message = EmailMultiAlternatives(subject, text,
+                                     settings.DEFAULT_FROM_EMAIL,
+                                     [booking.passenger_email])
+    message.attach_alternative(html, 'text/html')
+    return message
+
+
+def send_batch(notifications, connection=None):
+    """
+    Sends ``notifications`` over one mail connection and returns the ones
+    that could not be delivered. A failure only costs its own message: the
+    connection is reset and the rest of the batch carries on.
+    """
+    bookings = fetch_bookings(notifications)
+    connection = connection or get_connection(fail_silently=False)
+    failed = []
+    try:
+        for notification in notifications:
+            booking = bookings.get(notification['booking_id'])
+            if booking is None:
+                logger.info("Booking %s is gone, not emailing it",
+                            notification['booking_id'])
+                continue
+            try:
+                # A no-op while the session is open.
+                connection.open()
+                connection.send_messages([build_message(notification,
+                                                        booking)])
+            except Exception:
+                logger.warning("Could not email booking %s",
+                               notification['booking_id'], exc_info=True)
+                failed.append(notification)
+                # The session may be broken; reconnect for the next one.
+                connection.close()
+    finally:
+        connection.close()
+    return failed
+
+
+def notify(*notifications):
+    """
+    Queues notifications for batched delivery. They are written to the
+    outbox, so they are only sent if the current transaction commits.
+    """
+    outbox.publish('listings.tasks.send_notifications', [list(notifications)])
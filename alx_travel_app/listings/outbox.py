@@ -0,0 +1,105 @@
+"""
+Transactional outbox for Celery task calls.
+
+Request handlers never talk to the broker. ``publish`` writes an
+<OutboxMessage> in the caller's transaction, so a rollback discards the
+call along with the data it was about, and the relay (``relay_outbox``
+command or the beat-scheduled task) publishes committed rows in batches
+over one broker connection and deletes them.
+
+Delivery is at-least-once: if the relay dies between publishing and
+deleting, the batch is published again, so tasks must tolerate repeats.
+"""
+import json
+import logging
+from collections import Counter
+
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+# Tasks whose first argument is a list: consecutive rows are merged into
+# calls of at most NOTIFICATION_BATCH_SIZE items.
+MERGEABLE = {'listings.tasks.send_notifications'}
+
+
+def publish(task, args=(), kwargs=None):
+    """
+    Records a call of ``task`` (its registered name) to be published once
+    the current transaction commits.
+    """
+    return OutboxMessage.objects.create(task=task, args=list(args),
+                                        kwargs=kwargs or {})
+
+
+def coalesce(messages):
+    """
+    Reduces outbox rows to the task calls to publish: identical calls are
+    sent once and lists for ``MERGEABLE`` tasks are concatenated.
+    """
+    calls = []
+    seen = set()
+    merged = {}
+    for message in messages:
+        if message.task in MERGEABLE and not message.kwargs:
+            items = merged.setdefault(message.task, [])
+            items.extend(message.args[0])
+            continue
+        key = (message.task, json.dumps([message.args, message.kwargs],
+                                        sort_keys=True))
+        if key not in seen:
+            seen.add(key)
+            calls.append((message.task, message.args, message.kwargs))
+
+    size = settings.NOTIFICATION_BATCH_SIZE
+    for task, items in merged.items():
+        calls.extend((task, [items[start:start + size]], {})
+                     for start in range(0, len(items), size))
+    return calls
+
+
+def relay(batch_size=None, app=None):
+    """
+    Publishes one batch of committed outbox rows and deletes them. Returns
+    counts of rows relayed and task messages sent.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    app = app or current_app
+    stats = Counter()
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .order_by('pk')[:batch_size]
+        )
+        if not messages:
+            return stats
+        calls = coalesce(messages)
+        with app.producer_or_acquire() as producer:
+            for task, args, kwargs in calls:
+                app.send_task(task, args=args, kwargs=kwargs,
+                              producer=producer)
+        OutboxMessage.objects.filter(
+            pk__in=[message.pk for message in messages]
+        ).delete()
+    stats['relayed'] = len(messages)
+    stats['published'] = len(calls)
+    return stats
+
+
+def relay_all(batch_size=None, max_batches=100, app=None):
+    """
+    Relays batches until the outbox is empty or ``max_batches`` is reached.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    stats = Counter()
+    for _ in range(max_batches):
+        batch = relay(batch_size, app)
+        stats.update(batch)
+        if batch['relayed'] < batch_size:
+            break
+    return stats
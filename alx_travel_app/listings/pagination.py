@@ -0,0 +1,190 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in keyset (cursor) pagination over a composite ordering.
+
+    Pages are selected with a ``WHERE (a, b) > (x, y)`` style predicate on
+    the view's ``keyset_ordering`` instead of an OFFSET, so every page costs
+    the same index range scan as the first one. Clients opt in by sending
+    ``page_size`` or ``cursor``; requests without either keep the plain
+    unpaginated list.
+    """
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('created_at', 'pk')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        ``paginate_queryset`` for async views.
+        """
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._set_page([row async for row in queryset])
+
+    def page_queryset(self, queryset, request, view=None):
+        """
+        Returns ``queryset`` narrowed to the requested page plus one row
+        telling whether another page follows, or None when the request is
+        not paginated.
+        """
+        params = request.query_params
+        if (self.page_size_query_param not in params and
+                self.cursor_query_param not in params):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        self.fields = [self._get_field(queryset.model, name)
+                       for name in self.ordering]
+        self.page_size = self.get_page_size(request)
+
+        self.position, self.reverse = self.decode_cursor(request)
+        if self.reverse:
+            order_by = ['-' + name for name in self.ordering]
+        else:
+            order_by = list(self.ordering)
+
+        queryset = queryset.order_by(*order_by)
+        if self.position is not None:
+            queryset = queryset.filter(
+                self._keyset_filter(self.position, self.reverse)
+            )
+        return queryset[:self.page_size + 1]
+
+    def _set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True,
+                             'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self._position(self.page[0]), True)
+
+    def encode_cursor(self, position, reverse):
+        values = [_to_json(value) for value in position]
+        payload = json.dumps({'p': values, 'r': int(reverse)},
+                             separators=(',', ':'))
+        token = urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   token.rstrip('='))
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+
+        try:
+            token += '=' * (-len(token) % 4)
+            payload = json.loads(urlsafe_b64decode(token.encode('ascii')))
+            values = payload['p']
+            reverse = bool(payload.get('r'))
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [field.to_python(value)
+                        for field, value in zip(self.fields, values)]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def _keyset_filter(self, position, reverse):
+        """
+        Expands ``(f1, f2, ...) > (v1, v2, ...)`` into an OR of prefix
+        equalities, which every backend can satisfy from a composite index.
+        """
+        lookup = 'lt' if reverse else 'gt'
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            term = Q(**{f'{name}__{lookup}': position[i]})
+            for prev_name, prev_value in zip(self.ordering[:i], position[:i]):
+                term &= Q(**{prev_name: prev_value})
+            condition |= term
+        return condition
+
+    def _position(self, row):
+        if isinstance(row, dict):
+            return [row[name] for name in self.ordering]
+        return [getattr(row, field.attname) for field in self.fields]
+
+    @staticmethod
+    def _get_field(model, name):
+        if name == 'pk':
+            return model._meta.pk
+        return model._meta.get_field(name)
+
+
+def _to_json(value):
+    """
+    Returns a JSON-safe representation of a keyset value.
+    """
+    if value is None or isinstance(value, (int, float, str, bool)):
+        return value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
@@ -0,0 +1,204 @@
+"""
+Queued payment confirmation.
+
+Chapa webhooks and checkout callbacks are only recorded as <PaymentEvent>
+rows (replays collide on their dedupe key) and answered immediately. A
+Celery task then drains the queue in batches: it claims events, verifies
+each distinct pending tx_ref with the gateway concurrently and settles the
+<Payment> and <Booking> with conditional updates, so re-processing an
+event never changes an already settled payment.
+"""
+import hashlib
+import hmac
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import notifications, outbox
+from .gateway import GatewayUnavailable, get_client
+from .models import Booking, Payment, PaymentEvent
+
+
+PAYMENT_FIELDS = ('pk', 'tx_ref', 'status', 'booking_id')
+
+
+def sign(body, secret=None):
+    """
+    Returns the hex HMAC-SHA256 of ``body`` as Chapa sends it.
+    """
+    secret = settings.CHAPA_WEBHOOK_SECRET if secret is None else secret
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def valid_signature(body, signature):
+    """
+    Checks a webhook signature; fails closed when no secret is configured.
+    """
+    if not settings.CHAPA_WEBHOOK_SECRET or not signature:
+        return False
+    return hmac.compare_digest(sign(body), signature)
+
+
+def dedupe_key(*parts):
+    return hashlib.sha256(
+        '\x1f'.join(str(part) for part in parts).encode()
+    ).hexdigest()
+
+
+def record_event(tx_ref, event, payload, key):
+    """
+    Stores an event unless one with the same ``key`` was already received,
+    together with an outbox call to drain it. Returns whether it was new.
+    """
+    try:
+        with transaction.atomic():
+            PaymentEvent.objects.create(
+                dedupe_key=key, tx_ref=tx_ref, event=event, payload=payload
+            )
+            # The relay publishes one drain per batch however many events
+            # arrived in it.
+            outbox.publish('listings.tasks.process_payment_events')
+    except IntegrityError:
+        return False
+    return True
+
+
+def claim_events(batch_size, lease=None):
+    """
+    Marks up to ``batch_size`` unprocessed events (or events whose claim
+    lease expired) as processing and returns their ``(pk, tx_ref)``.
+    """
+    lease = settings.PAYMENT_EVENT_LEASE if lease is None else lease
+    now = timezone.now()
+    claimable = (
+        Q(status=PaymentEvent.RECEIVED) |
+        Q(status=PaymentEvent.PROCESSING,
+          claimed_at__lt=now - timedelta(seconds=lease))
+    )
+    with transaction.atomic():
+        events = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(claimable)
+            .order_by('received_at')
+            .values_list('pk', 'tx_ref')[:batch_size]
+        )
+        PaymentEvent.objects.filter(
+            pk__in=[pk for pk, _ in events]
+        ).update(status=PaymentEvent.PROCESSING, claimed_at=now)
+    return events
+
+
+def apply_verification(payment, response):
+    """
+    Settles ``payment`` (a row of ``PAYMENT_FIELDS``) from a verify
+    response if it is still pending. Returns 'completed', 'failed' or
+    'unchanged' when another worker settled it first.
+    """
+    now = timezone.now()
+    pending = Payment.objects.filter(pk=payment['pk'], status='pending')
+    data = response.data.get('data') or {}
+    with transaction.atomic():
+        if not (response.ok and data.get('status') == 'success'):
+            return 'failed' if pending.update(status='failed',
+                                              updated_at=now) else 'unchanged'
+
+        if not pending.update(status='completed',
+                              chapa_transaction_id=data.get('id'),
+                              updated_at=now):
+            return 'unchanged'
+        Booking.objects.filter(pk=payment['booking_id'],
+                               status='pending').update(status='confirmed',
+                                                        updated_at=now)
+        notifications.notify(
+            notifications.payment_confirmation(payment['booking_id'])
+        )
+    return 'completed'
+
+
+def _verify(client, tx_ref):
+    try:
+        return client.verify(tx_ref)
+    except GatewayUnavailable:
+        return None
+
+
+def verify_many(tx_refs, concurrency, client):
+    """
+    Verifies ``tx_refs`` with up to ``concurrency`` calls in flight and
+    yields ``(tx_ref, response)`` pairs in order; ``response`` is None when
+    the gateway was unavailable.
+    """
+    tx_refs = list(tx_refs)
+    if not tx_refs:
+        return
+    with ThreadPoolExecutor(max_workers=min(concurrency,
+                                            len(tx_refs))) as pool:
+        yield from zip(tx_refs,
+                       pool.map(lambda ref: _verify(client, ref), tx_refs))
+
+
+def process_batch(batch_size=None, concurrency=None, client=None):
+    """
+    Claims and settles one batch of events. Events whose verification
+    could not reach the gateway are released for a later drain.
+    """
+    batch_size = batch_size or settings.PAYMENT_EVENT_BATCH_SIZE
+    concurrency = concurrency or settings.PAYMENT_VERIFY_CONCURRENCY
+    client = client or get_client()
+    stats = Counter()
+
+    events = claim_events(batch_size)
+    stats['claimed'] = len(events)
+    if not events:
+        return stats
+
+    tx_refs = {tx_ref for _, tx_ref in events}
+    # Only pending payments are worth a gateway call; events for settled or
+    # unknown transactions are just marked processed.
+    pending = {
+        payment['tx_ref']: payment
+        for payment in Payment.objects.filter(tx_ref__in=tx_refs)
+        .values(*PAYMENT_FIELDS)
+    }
+    stats['unknown'] = len(tx_refs - pending.keys())
+    pending = {tx_ref: payment for tx_ref, payment in pending.items()
+               if payment['status'] == 'pending'}
+    stats['unchanged'] = len(tx_refs) - stats['unknown'] - len(pending)
+
+    deferred = set()
+    for tx_ref, response in verify_many(pending, concurrency, client):
+        if response is None:
+            deferred.add(tx_ref)
+            continue
+        stats[apply_verification(pending[tx_ref], response)] += 1
+
+    done = [pk for pk, tx_ref in events if tx_ref not in deferred]
+    PaymentEvent.objects.filter(pk__in=done).update(
+        status=PaymentEvent.PROCESSED, processed_at=timezone.now()
+    )
+    if deferred:
+        PaymentEvent.objects.filter(
+            pk__in=[pk for pk, tx_ref in events if tx_ref in deferred]
+        ).update(status=PaymentEvent.RECEIVED, claimed_at=None)
+        stats['deferred'] = len(deferred)
+    return stats
+
+
+def drain(max_batches=50, **kwargs):
+    """
+    Processes batches until the queue is empty, ``max_batches`` is reached
+    or the gateway starts failing.
+    """
+    stats = Counter()
+    batch_size = kwargs.get('batch_size') or settings.PAYMENT_EVENT_BATCH_SIZE
+    for _ in range(max_batches):
+        batch = process_batch(**kwargs)
+        stats.update(batch)
+        if batch['claimed'] < batch_size or batch['deferred']:
+            break
+    return stats
@@ -0,0 +1,81 @@
+"""
+Denormalized rating aggregates on <Listing> instances.
+
+Every review write adjusts review_count and rating_sum with a relative
+UPDATE and recomputes rating_avg from them in the same transaction, so
+listings never have to aggregate their reviews on read.
+"""
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from .models import Listing
+from .reservations import retry_on_lock_timeout
+from .signals import listings_updated
+
+
+def adjust_rating(listing_id, count_delta, sum_delta):
+    """
+    Adds ``count_delta`` reviews totalling ``sum_delta`` stars to a
+    listing's aggregates, then recomputes its average from them.
+    """
+    if not count_delta and not sum_delta:
+        return
+    listing = Listing.objects.filter(pk=listing_id)
+    with transaction.atomic():
+        listing.update(
+            review_count=F('review_count') + count_delta,
+            rating_sum=F('rating_sum') + sum_delta,
+            updated_at=timezone.now()
+        )
+        # MySQL applies SET assignments left to right, so an average set
+        # in the same UPDATE would see the adjusted columns there and the
+        # old ones elsewhere. A second UPDATE reads the adjusted columns
+        # on every backend.
+        listing.update(rating_avg=Case(
+            When(review_count__gt=0,
+                 then=Round(Cast(F('rating_sum'), FloatField())
+                            / F('review_count'), 2)),
+            default=Value(0.0),
+            output_field=FloatField()
+        ))
+    listings_updated.send(sender=Listing, pks=[listing_id])
+
+
+@retry_on_lock_timeout()
+def record_review(save):
+    """
+    Persists a new review through ``save`` and counts it.
+    """
+    with transaction.atomic():
+        review = save()
+        adjust_rating(review.listing_id, 1, review.rating)
+        return review
+
+
+@retry_on_lock_timeout()
+def rerate_review(save, old):
+    """
+    Persists an edited review through ``save``, moving its contribution
+    from ``old`` (a ``(listing_id, rating)`` pair) to its new values.
+    """
+    with transaction.atomic():
+        review = save()
+        listing_id, rating = old
+        if review.listing_id == listing_id:
+            adjust_rating(listing_id, 0, review.rating - rating)
+        else:
+            adjust_rating(listing_id, -1, -rating)
+            adjust_rating(review.listing_id, 1, review.rating)
+        return review
+
+
+@retry_on_lock_timeout()
+def remove_review(delete, listing_id, rating):
+    """
+    Removes a review through ``delete`` and uncounts it.
+    """
+    with transaction.atomic():
+        delete()
+        adjust_rating(listing_id, -1, -rating)
@@ -0,0 +1,67 @@
+"""
+Template rendering for notification emails.
+
+Every message has a subject, a plain-text body and an HTML body under
+``listings/email/``, optionally overridden per locale in
+``listings/email/<locale>/``. The compiled templates picked for each
+(message, locale) pair are kept in memory, so rendering a batch costs no
+template lookups, only the render itself.
+"""
+import functools
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template.loader import select_template
+from django.utils import translation
+
+
+PARTS = ('subject.txt', 'txt', 'html')
+
+
+def _candidates(name, suffix, locale):
+    filename = (f'{name}_{suffix}' if suffix == 'subject.txt'
+                else f'{name}.{suffix}')
+    language = translation.to_language(locale)
+    locales = dict.fromkeys([language, language.split('-')[0]])
+    return [f'listings/email/{code}/{filename}' for code in locales] + [
+        f'listings/email/{filename}'
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def get_templates(name, locale):
+    """
+    Returns the compiled (subject, text, html) templates of message
+    ``name`` for ``locale``, falling back to the default templates.
+    """
+    return tuple(select_template(_candidates(name, suffix, locale))
+                 for suffix in PARTS)
+
+
+@receiver(setting_changed)
+def reset_templates(setting, **kwargs):
+    if setting in ('TEMPLATES', 'LANGUAGE_CODE'):
+        get_templates.cache_clear()
+
+
+def render(name, context, locale):
+    """
+    Renders message ``name`` with ``context`` in ``locale`` and returns its
+    subject, text body and HTML body.
+    """
+    subject, text, html = get_templates(name, locale)
+    with translation.override(locale):
+        return (' '.join(subject.render(context).split()),
+                text.render(context), html.render(context))
+
+
+def booking_context(booking):
+    """
+    Template context of a <Booking> fetched with its listing and payment.
+    """
+    return {
+        'booking': booking,
+        'listing': booking.listing,
+        # Reverse one-to-one: missing until a payment is initiated.
+        'payment': getattr(booking, 'payment', None),
+    }
@@ -0,0 +1,184 @@
+"""
+Read-replica routing for listing and review reads.
+
+Viewsets using ``ReplicaReadMixin`` read from one of the
+``DATABASE_REPLICAS`` aliases on safe-method requests; every other query
+and every write uses ``default``. A request that writes reads the primary
+from then on, and ``ReplicaPinMiddleware`` pins a client to the primary
+for ``REPLICA_PIN_SECONDS`` after any unsafe request, so it reads its own
+writes while the replicas catch up.
+
+Each replica is pinged at most every ``REPLICA_HEALTH_INTERVAL`` seconds
+per process. One that fails is skipped until it answers again, and with
+no healthy replica reads fall back to the primary. Uncached reads can be
+stale by up to the replica's lag. The listings response cache fills its
+misses from the primary, so cached responses are not.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connections
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'primary_pin'
+
+# Alias reads of the current request go to; None is the primary.
+_reads = contextvars.ContextVar('listings_replica_reads', default=None)
+
+# Replica alias -> (healthy, monotonic time of the check).
+_health = {}
+_health_lock = threading.Lock()
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica chosen for the request, if any, and pins
+    the rest of the request to the primary once it writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _reads.get()
+
+    def db_for_write(self, model, **hints):
+        _reads.set(None)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        aliases = {'default', *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= aliases:
+            return True
+        return None
+
+
+@contextmanager
+def reads_from(alias):
+    """
+    Routes reads inside the block to ``alias`` (None for the primary).
+    """
+    token = _reads.set(alias)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def _ping(alias):
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError as exc:
+        logger.warning("Replica %s failed its health check: %s", alias, exc)
+        return False
+    return True
+
+
+def is_healthy(alias):
+    now = time.monotonic()
+    with _health_lock:
+        state = _health.get(alias)
+    if state and now - state[1] < settings.REPLICA_HEALTH_INTERVAL:
+        return state[0]
+    healthy = _ping(alias)
+    with _health_lock:
+        _health[alias] = (healthy, now)
+    return healthy
+
+
+def choose_replica():
+    """
+    Returns a healthy replica alias at random, or None for the primary.
+    """
+    replicas = list(settings.DATABASE_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        if is_healthy(alias):
+            return alias
+    return None
+
+
+async def achoose_replica():
+    """
+    ``choose_replica`` for async views; health checks run in a thread.
+    """
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return await sync_to_async(choose_replica)()
+
+
+def is_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaReadMixin:
+    """
+    Viewset mixin reading from a replica on safe-method requests from
+    clients that have not just written.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        alias = None
+        if request.method in SAFE_METHODS and not is_pinned(request):
+            alias = choose_replica()
+        with reads_from(alias):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ReplicaPinMiddleware:
+    """
+    Pins clients to the primary for ``REPLICA_PIN_SECONDS`` after an
+    unsafe request. Removed at startup when no replica is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS:
+            # The expiry is in the value too: API clients often keep
+            # cookies past their max-age.
+            seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, f'{time.time() + seconds:.3f}',
+                                max_age=seconds, httponly=True,
+                                samesite='Lax')
+        return response
+
+
+@receiver(setting_changed)
+def reset_health(setting=None, **kwargs):
+    if setting is None or setting.startswith(('DATABASE', 'REPLICA_')):
+        with _health_lock:
+            _health.clear()
@@ -0,0 +1,198 @@
+"""
+Seat inventory for <Listing> instances.
+
+Seats are taken with a single conditional UPDATE, so the availability
+check and the decrement happen atomically in the database and concurrent
+bookings can never oversell a listing.
+"""
+import functools
+import random
+import time
+
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from .models import Booking, Listing
+from .signals import listings_updated
+
+
+# MySQL "Lock wait timeout exceeded" and "Deadlock found".
+LOCK_ERROR_CODES = (1205, 1213)
+
+
+class SeatsUnavailable(Exception):
+    """Raised when a listing has fewer available seats than requested."""
+
+
+def held_seats(status, num_seats):
+    """
+    Returns the number of seats a booking with ``status`` holds.
+    """
+    return 0 if status == 'cancelled' else num_seats
+
+
+def is_lock_error(exc):
+    """
+    Returns True for transient lock contention errors worth retrying.
+    """
+    if not isinstance(exc, OperationalError):
+        return False
+    if exc.args and exc.args[0] in LOCK_ERROR_CODES:
+        return True
+    # SQLite reports contention as "database is locked".
+    return 'locked' in str(exc)
+
+
+def retry_on_lock_timeout(attempts=4, backoff=0.05):
+    """
+    Retries the decorated callable on lock timeouts and deadlocks with
+    exponential backoff and full jitter.
+
+    The callable must own its transaction: a lock error aborts the whole
+    transaction, so retrying inside it would be meaningless.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as exc:
+                    if not is_lock_error(exc) or attempt == attempts - 1:
+                        raise
+                    time.sleep(random.uniform(0, backoff * 2 ** attempt))
+        return wrapper
+    return decorator
+
+
+def reserve_seats(listing_id, seats):
+    """
+    Takes ``seats`` from a listing, raising SeatsUnavailable when it does
+    not have enough left. Must run inside the booking's transaction.
+    """
+    if seats <= 0:
+        return
+    updated = Listing.objects.filter(
+        pk=listing_id,
+        available_seats__gte=seats
+    ).update(
+        available_seats=F('available_seats') - seats,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        raise SeatsUnavailable(
+            f"Not enough seats available for {seats} passenger(s)."
+        )
+    listings_updated.send(sender=Listing, pks=[listing_id])
+
+
+def release_seats(listing_id, seats):
+    """
+    Returns ``seats`` to a listing, never beyond its total capacity.
+    """
+    if seats <= 0:
+        return
+    Listing.objects.filter(pk=listing_id).update(
+        available_seats=Least(F('available_seats') + seats,
+                              F('total_seats')),
+        updated_at=timezone.now()
+    )
+    listings_updated.send(sender=Listing, pks=[listing_id])
+
+
+@retry_on_lock_timeout()
+def book(save, listing_id, seats):
+    """
+    Reserves seats and persists the booking through ``save`` in one
+    transaction. Returns whatever ``save`` returns.
+    """
+    with transaction.atomic():
+        reserve_seats(listing_id, seats)
+        return save()
+
+
+@retry_on_lock_timeout()
+def rebook(save, old, new):
+    """
+    Moves a booking's seat hold from ``old`` to ``new``, both given as
+    ``(listing_id, seats)``, and persists it through ``save``.
+    """
+    with transaction.atomic():
+        release_seats(*old)
+        reserve_seats(*new)
+        return save()
+
+
+@retry_on_lock_timeout()
+def cancel(delete, listing_id, seats):
+    """
+    Releases a booking's seats and removes it through ``delete``.
+    """
+    with transaction.atomic():
+        release_seats(listing_id, seats)
+        return delete()
+
+
+@retry_on_lock_timeout()
+def book_many(bookings, on_created=None):
+    """
+    Reserves seats for a batch of unsaved bookings with one UPDATE per
+    listing and inserts the successful ones with a single bulk_create.
+    ``on_created`` is called with the created bookings inside the same
+    transaction.
+
+    Seats are granted per listing as a whole: if a listing cannot hold
+    every seat requested for it in the batch, none of its bookings are
+    created. Returns the created bookings and the ids of the listings
+    that were short of seats.
+    """
+    requested = {}
+    for booking in bookings:
+        requested[booking.listing_id] = (
+            requested.get(booking.listing_id, 0)
+            + held_seats(booking.status, booking.num_seats)
+        )
+
+    with transaction.atomic():
+        sold_out = set()
+        for listing_id, seats in requested.items():
+            try:
+                reserve_seats(listing_id, seats)
+            except SeatsUnavailable:
+                sold_out.add(listing_id)
+
+        created = Booking.objects.bulk_create([
+            booking for booking in bookings
+            if booking.listing_id not in sold_out
+        ])
+        if on_created is not None:
+            on_created(created)
+    return created, sold_out
+
+
+@retry_on_lock_timeout()
+def expire(booking_ids):
+    """
+    Cancels the bookings in ``booking_ids`` that are still pending and
+    returns their seats with one UPDATE per listing. Returns the number of
+    bookings cancelled and of seats released.
+    """
+    with transaction.atomic():
+        rows = list(
+            Booking.objects.select_for_update()
+            .filter(pk__in=booking_ids, status='pending')
+            .values_list('pk', 'listing_id', 'num_seats')
+        )
+        if not rows:
+            return 0, 0
+        Booking.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+            status='cancelled', updated_at=timezone.now()
+        )
+        released = {}
+        for _, listing_id, seats in rows:
+            released[listing_id] = released.get(listing_id, 0) + seats
+        for listing_id, seats in released.items():
+            release_seats(listing_id, seats)
+    return len(rows), sum(released.values())
@@ -1,12 +1,21 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Listing, Booking, Review
+from .models import (
+    Listing,
+    Booking,
+    Review,
+    STATES,
+    TRANSPORT_CHOICES,
+    LISTING_STATUS
+)
+from .profiling import TimedRepresentationMixin
 
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedRepresentationMixin,
+                     serializers.ModelSerializer):
     """."""
     class Meta:
         model = User
@@ -17,7 +26,8 @@ class UserSerializer(serializers.ModelSerializer):
         ]
 
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(TimedRepresentationMixin,
+                        serializers.ModelSerializer):
     """."""
     operator = UserSerializer(read_only=True)
     class Meta:
@@ -27,12 +37,71 @@ class ListingSerializer(serializers.ModelSerializer):
             'transport_type', 'name',
             'description', 'departure_time',
             'price', 'available_seats',
-            'total_seats', 'status'
+            'total_seats', 'status',
+            'review_count', 'rating_avg'
         ]
         read_only_fields = ['operator']
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class ListingSearchSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the route search endpoint.
+    """
+    origin = serializers.ChoiceField(choices=STATES, required=False)
+    destination = serializers.ChoiceField(choices=STATES, required=False)
+    departure_after = serializers.DateTimeField(required=False)
+    departure_before = serializers.DateTimeField(required=False)
+    transport_type = serializers.ChoiceField(choices=TRANSPORT_CHOICES,
+                                             required=False)
+    status = serializers.ChoiceField(choices=LISTING_STATUS,
+                                     default='active')
+    min_seats = serializers.IntegerField(min_value=1, required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2,
+                                         min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2,
+                                         min_value=0, required=False)
+
+    LOOKUPS = {
+        'origin': 'origin',
+        'destination': 'destination',
+        'departure_after': 'departure_time__gte',
+        'departure_before': 'departure_time__lt',
+        'transport_type': 'transport_type',
+        'status': 'status',
+        'min_seats': 'available_seats__gte',
+        'min_price': 'price__gte',
+        'max_price': 'price__lte',
+    }
+
+    def validate(self, attrs):
+        after = attrs.get('departure_after')
+        before = attrs.get('departure_before')
+        if after and before and after >= before:
+            raise serializers.ValidationError(
+                {'departure_before': 'Must be later than departure_after.'}
+            )
+
+        min_price = attrs.get('min_price')
+        max_price = attrs.get('max_price')
+        if (min_price is not None and max_price is not None and
+                min_price > max_price):
+            raise serializers.ValidationError(
+                {'max_price': 'Must not be lower than min_price.'}
+            )
+        return attrs
+
+    def filter_queryset(self, queryset):
+        """
+        Applies the validated parameters to a <Listing> queryset.
+        """
+        return queryset.filter(**{
+            self.LOOKUPS[name]: value
+            for name, value in self.validated_data.items()
+        })
+
+
+class BookingSerializer(TimedRepresentationMixin,
+                        serializers.ModelSerializer):
     """."""
     listing_id = serializers.PrimaryKeyRelatedField(
         queryset=Listing.objects.all(),
@@ -48,9 +117,34 @@ class BookingSerializer(serializers.ModelSerializer):
             'num_seats', 'booking_date',
             'amount_paid', 'status'
         ]
+        extra_kwargs = {
+            'num_seats': {'min_value': 1}
+        }
+
+
+class BulkBookingItemSerializer(serializers.ModelSerializer):
+    """
+    Validates one passenger of a bulk booking request without touching
+    the database; listings are resolved for the whole batch at once.
+    """
+    listing_id = serializers.UUIDField()
+
+    class Meta:
+        model = Booking
+        fields = [
+            'listing_id', 'passenger_name',
+            'passenger_email', 'num_seats',
+            'booking_date', 'amount_paid',
+            'status'
+        ]
+        extra_kwargs = {
+            'num_seats': {'min_value': 1}
+        }
+        validators = []
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedRepresentationMixin,
+                       serializers.ModelSerializer):
     """."""
     listing_id = serializers.PrimaryKeyRelatedField(
         queryset=Listing.objects.all(),
@@ -69,6 +163,9 @@ class ReviewSerializer(serializers.ModelSerializer):
 
     def get_listing_name(self, obj):
         """
-        Returns name of the <Listing> instance.
+        Returns name of the <Listing> instance, preferring the
+        ``listing_name`` annotation over a per-row lookup.
         """
+        if hasattr(obj, 'listing_name'):
+            return obj.listing_name
         return obj.listing.name
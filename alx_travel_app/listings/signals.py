@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import cache
+from .models import Listing
+
+
+User = get_user_model()
+
+# User fields rendered inside every listing (see UserSerializer).
+OPERATOR_FIELDS = {'user_id', 'first_name', 'last_name', 'email', 'username'}
+
+# Sent by queryset.update() writes to <Listing> rows (seat and rating
+# counters), which bypass the model save signals.
+listings_updated = Signal()
+
+
+def invalidate_on_commit():
+    # Invalidating before commit would let a concurrent read re-cache the
+    # old rows under the new version.
+    transaction.on_commit(cache.invalidate)
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+@receiver(listings_updated)
+def invalidate_listing_cache(sender, **kwargs):
+    invalidate_on_commit()
+
+
+@receiver(post_save, sender=User)
+def invalidate_operator_listings(sender, instance, created, update_fields,
+                                 **kwargs):
+    """
+    Listings embed their operator, so operator edits make them stale.
+    Saves that touch no rendered field, such as last_login, are ignored.
+    """
+    if created:
+        return
+    if update_fields is not None and not OPERATOR_FIELDS & set(update_fields):
+        return
+    invalidate_on_commit()
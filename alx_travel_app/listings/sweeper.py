@@ -0,0 +1,124 @@
+"""
+Reconciliation of stale pending payments and bookings.
+
+A periodic task walks pending <Payment> rows older than
+``PAYMENT_PENDING_TTL`` in keyset-ordered chunks over the
+``(status, created_at)`` index. It verifies each chunk concurrently with
+the gateway and settles them: paid ones are confirmed, anything else
+fails and its booking is cancelled, which returns the seats. Pending
+<Booking> rows older than ``BOOKING_PENDING_TTL`` with no live payment are
+cancelled the same way.
+"""
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import payments, reservations
+from .gateway import get_client
+from .metrics import SWEEP_DURATION, SWEEP_ROWS
+from .models import Booking, Payment
+
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = (
+    'payments_scanned', 'payments_completed', 'payments_failed',
+    'payments_unchanged', 'payments_deferred', 'bookings_scanned',
+    'bookings_cancelled', 'seats_released',
+)
+
+def _chunks(queryset, fields, chunk_size, limit):
+    """
+    Yields lists of ``fields`` rows from ``queryset`` in
+    ``(created_at, pk)`` keyset order, at most ``limit`` rows in total.
+    """
+    queryset = queryset.order_by('created_at', 'pk')
+    seen = 0
+    last = None
+    while seen < limit:
+        page = queryset
+        if last is not None:
+            page = page.filter(Q(created_at__gt=last[0]) |
+                               Q(created_at=last[0], pk__gt=last[1]))
+        rows = list(page.values(*fields, 'created_at')
+                    [:min(chunk_size, limit - seen)])
+        if not rows:
+            return
+        seen += len(rows)
+        last = (rows[-1]['created_at'], rows[-1]['pk'])
+        yield rows
+
+
+def sweep_payments(cutoff, chunk_size, limit, concurrency, client, result):
+    pending = Payment.objects.filter(status='pending', created_at__lt=cutoff)
+    for rows in _chunks(pending, payments.PAYMENT_FIELDS, chunk_size, limit):
+        result['payments_scanned'] += len(rows)
+        by_ref = {row['tx_ref']: row for row in rows}
+        expired = []
+        for tx_ref, response in payments.verify_many(by_ref, concurrency,
+                                                     client):
+            if response is None:
+                result['payments_deferred'] += 1
+                continue
+            outcome = payments.apply_verification(by_ref[tx_ref], response)
+            result[f'payments_{outcome}'] += 1
+            if outcome == 'failed':
+                expired.append(by_ref[tx_ref]['booking_id'])
+
+        cancelled, seats = reservations.expire(expired)
+        result['bookings_cancelled'] += cancelled
+        result['seats_released'] += seats
+        if result['payments_deferred']:
+            # The gateway is failing; leave the rest for the next sweep.
+            return
+
+
+def sweep_bookings(cutoff, chunk_size, limit, result):
+    abandoned = Booking.objects.filter(
+        Q(payment__isnull=True) | Q(payment__status='failed'),
+        status='pending', created_at__lt=cutoff
+    )
+    for rows in _chunks(abandoned, ('pk',), chunk_size, limit):
+        result['bookings_scanned'] += len(rows)
+        cancelled, seats = reservations.expire([row['pk'] for row in rows])
+        result['bookings_cancelled'] += cancelled
+        result['seats_released'] += seats
+
+
+def sweep(now=None, chunk_size=None, limit=None, concurrency=None,
+          client=None):
+    """
+    Runs one reconciliation pass and returns its counters, including the
+    rows scanned per second.
+    """
+    now = now or timezone.now()
+    chunk_size = chunk_size or settings.PAYMENT_SWEEP_CHUNK_SIZE
+    limit = limit or settings.PAYMENT_SWEEP_LIMIT
+    result = Counter(dict.fromkeys(COUNTERS, 0))
+
+    start = time.perf_counter()
+    sweep_payments(
+        now - timedelta(seconds=settings.PAYMENT_PENDING_TTL), chunk_size,
+        limit, concurrency or settings.PAYMENT_VERIFY_CONCURRENCY,
+        client or get_client(), result
+    )
+    sweep_bookings(
+        now - timedelta(seconds=settings.BOOKING_PENDING_TTL), chunk_size,
+        limit, result
+    )
+    elapsed = time.perf_counter() - start
+
+    SWEEP_DURATION.observe(elapsed)
+    for counter, value in result.items():
+        SWEEP_ROWS.labels(counter).inc(value)
+    scanned = result['payments_scanned'] + result['bookings_scanned']
+    report = dict(result, seconds=round(elapsed, 3),
+                  rows_per_second=round(scanned / elapsed, 1)
+                  if elapsed else 0.0)
+    logger.info("Stale payment sweep: %s", report)
+    return report
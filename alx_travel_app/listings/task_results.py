@@ -0,0 +1,37 @@
+"""
+Retention of stored Celery task results.
+
+Tasks ignore their results unless they opt in (``CELERY_TASK_IGNORE_RESULT``)
+and the few that keep one store it in the Redis result backend, which
+expires it after ``CELERY_RESULT_EXPIRES``. Rows in the
+django_celery_results tables, written while ``django-db`` was the result
+backend, are purged here after ``TASK_RESULT_TTL`` in primary-key chunks
+so no single DELETE holds locks for long.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django_celery_results.models import GroupResult, TaskResult
+
+
+def purge(ttl=None, chunk_size=None, now=None):
+    """
+    Deletes task and group results finished more than ``ttl`` seconds ago
+    and returns the number of rows deleted per model.
+    """
+    ttl = settings.TASK_RESULT_TTL if ttl is None else ttl
+    chunk_size = chunk_size or settings.TASK_RESULT_PURGE_CHUNK_SIZE
+    cutoff = (now or timezone.now()) - timedelta(seconds=ttl)
+    deleted = Counter()
+    for model in (TaskResult, GroupResult):
+        # date_done is indexed on both tables.
+        expired = model.objects.filter(date_done__lt=cutoff).order_by()
+        while True:
+            pks = list(expired.values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                break
+            count, _ = model.objects.filter(pk__in=pks).delete()
+            deleted[model._meta.model_name] += count
+    return deleted
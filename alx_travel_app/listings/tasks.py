@@ -1,43 +1,108 @@
+import logging
+
 from celery import shared_task
-from django.core.mail import send_mail
+from celery.exceptions import MaxRetriesExceededError
 from django.conf import settings
 
 
+logger = logging.getLogger(__name__)
+
+
+def _current_args(booking_id, locale):
+    """
+    Maps the signatures queued before templated emails, ``(email,
+    booking_id, amount)`` and ``(email, booking_id)``, onto ``(booking_id,
+    locale)``. Drop once no such messages are left in the broker.
+    """
+    if isinstance(booking_id, str) and '@' in booking_id:
+        return locale, None
+    return booking_id, locale
+
+
 @shared_task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3, 'countdown': 5})
-def send_payment_confirmation_email(self, email, booking_id, amount):
-    subject = "Payment Confirmation - Travel Booking"
-    message = (
-        f"Dear Customer,\n\n"
-        f"Your payment was successful.\n\n"
-        f"Booking ID: {booking_id}\n"
-        f"Amount Paid: {amount}\n\n"
-        f"Thank you for booking with us."
-    )
-
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [email],
-        fail_silently=False
-    )
+def send_payment_confirmation_email(self, booking_id, locale=None, *legacy):
+    from . import notifications
+
+    booking_id, locale = _current_args(booking_id, locale)
+
+    if notifications.send_batch(
+            [notifications.payment_confirmation(booking_id, locale)]):
+        raise RuntimeError(f"Could not email booking {booking_id}")
 
     return "Email Sent ✅"
 
-@shared_task
-def send_booking_confirmation_email(passenger_email, booking_id):
-    subject = "Booking Created Successfully"
-    message = (
-        f"Your booking with ID {booking_id} has been created successfully."
-        f"You will receive another email once payment is confirmed."
-    )
-
-    send_email(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [passenger_email],
-        fail_silently=False
-    )
+@shared_task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3, 'countdown': 5})
+def send_booking_confirmation_email(self, booking_id, locale=None):
+    from . import notifications
+
+    booking_id, locale = _current_args(booking_id, locale)
+
+    if notifications.send_batch(
+            [notifications.booking_confirmation(booking_id, locale)]):
+        raise RuntimeError(f"Could not email booking {booking_id}")
 
     return "Email Sent ✅"
+
+
+@shared_task(bind=True, max_retries=3)
+def send_notifications(self, notifications):
+    """
+    Sends a batch of notification dicts over a single mail connection and
+    retries only the ones that failed.
+    """
+    from . import notifications as batching
+
+    failed = batching.send_batch(notifications)
+    if failed:
+        try:
+            raise self.retry(args=[failed],
+                             countdown=5 * 2 ** self.request.retries)
+        except MaxRetriesExceededError:
+            logger.error("Giving up on %d notifications", len(failed))
+    return f"{len(notifications) - len(failed)} Emails Sent ✅"
+
+
+@shared_task(bind=True, max_retries=5)
+def process_payment_events(self):
+    """
+    Drains queued payment events; retries later while the gateway is
+    unavailable.
+    """
+    from . import payments
+
+    stats = payments.drain()
+    if stats['deferred']:
+        raise self.retry(countdown=settings.CHAPA_BREAKER_RESET_TIMEOUT)
+    return dict(stats)
+
+
+@shared_task(ignore_result=False)
+def sweep_stale_payments():
+    """
+    Settles payments and bookings left pending past their TTL. Its report
+    is kept as the task result.
+    """
+    from . import sweeper
+
+    return sweeper.sweep()
+
+
+@shared_task
+def relay_outbox():
+    """
+    Publishes committed outbox rows; see the relay_outbox command for a
+    low-latency relay process.
+    """
+    from . import outbox
+
+    return dict(outbox.relay_all())
+
+
+@shared_task
+def purge_task_results():
+    """
+    Deletes stored task results older than TASK_RESULT_TTL.
+    """
+    from . import task_results
+
+    return dict(task_results.purge())
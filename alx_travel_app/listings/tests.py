@@ -1,3 +1,2099 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.utils import load_backend
+from django.db.models import Count, Q, Sum
+from django.template.loader import select_template
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail import get_connection
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_celery_results.models import GroupResult, TaskResult
+from prometheus_client import REGISTRY
+from requests.exceptions import ChunkedEncodingError
+from rest_framework.test import APIClient
+
+from . import (
+    cache,
+    metrics,
+    notifications,
+    outbox,
+    payments,
+    profiling,
+    ratings,
+    rendering,
+    replicas,
+    reservations,
+    sweeper,
+    task_results
+)
+from alx_travel_app.celery import app as celery_app
+
+from .backends.pool import ConnectionPool, PoolExhausted, pooled
+from .benchmarks import compare, percentile, stopwatch
+from .fake_broker import FakeBroker
+from .fake_gateway import FakeChapaServer
+from .fake_smtp import FakeSMTPServer
+from .fast_read import ReadPlan
+from .gateway import ChapaClient, CircuitBreaker, GatewayUnavailable
+from .models import (
+    Booking,
+    Listing,
+    OutboxMessage,
+    Payment,
+    PaymentEvent,
+    Review
+)
+from .serializers import ReviewSerializer
+from .tasks import (
+    relay_outbox,
+    send_booking_confirmation_email,
+    send_notifications,
+    send_payment_confirmation_email,
+    sweep_stale_payments
+)
+from .views import BookingViewSet
+
+
+User = get_user_model()
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+def make_user(username='operator'):
+    return User.objects.create_user(username=username,
+                                    email=f'{username}@example.com',
+                                    password='pass1234')
+
+
+def make_listing(operator, **kwargs):
+    fields = {
+        'operator': operator,
+        'transport_type': 'bus',
+        'name': 'Lagos Express',
+        'description': 'Daily coach',
+        'origin': 'NG-LA',
+        'destination': 'NG-CR',
+        'departure_time': timezone.now() + timedelta(days=1),
+        'price': Decimal('15000.00'),
+        'available_seats': 30,
+        'total_seats': 40,
+    }
+    fields.update(kwargs)
+    return Listing.objects.create(**fields)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ListingsTestCase(TestCase):
+    """
+    Runs against a local-memory cache, emptied before every test.
+    """
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+
+
+class KeysetPaginationTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        operator = make_user()
+        start = timezone.now()
+        # Pairs of listings share a departure time to exercise the tie-breaker.
+        cls.listings = [
+            make_listing(operator, departure_time=start + timedelta(hours=i // 2))
+            for i in range(7)
+        ]
+        cls.expected = [
+            str(listing.listing_id) for listing in
+            sorted(cls.listings,
+                   key=lambda l: (l.departure_time, l.listing_id))
+        ]
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get('/api/listing/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 7)
+
+    def test_walks_forward_and_back_without_gaps(self):
+        seen = []
+        url = '/api/listing/?page_size=3'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            seen.extend(row['listing_id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, self.expected)
+        self.assertIsNone(pages[0]['previous'])
+
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(
+            [row['listing_id'] for row in response.data['results']],
+            self.expected[3:6]
+        )
+
+    def test_page_query_count_is_constant(self):
+        first = self.client.get('/api/listing/?page_size=2')
+        # The ETag aggregate plus the keyset page itself.
+        with self.assertNumQueries(2):
+            self.client.get(first.data['next'])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get('/api/listing/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class ListingSearchTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        operator = make_user()
+        cls.start = timezone.now() + timedelta(days=2)
+        cls.match = make_listing(operator, departure_time=cls.start,
+                                 available_seats=5, price=Decimal('9000'))
+        make_listing(operator, departure_time=cls.start, origin='NG-KN')
+        make_listing(operator, departure_time=cls.start, available_seats=1)
+        make_listing(operator, departure_time=cls.start,
+                     price=Decimal('50000'))
+        make_listing(operator, departure_time=cls.start + timedelta(days=30))
+        make_listing(operator, departure_time=cls.start, status='cancelled')
+
+    def search(self, **params):
+        return APIClient().get('/api/listing/search/', params)
+
+    def test_filters_by_route_window_seats_and_price(self):
+        response = self.search(
+            origin='NG-LA', destination='NG-CR',
+            departure_after=(self.start - timedelta(hours=1)).isoformat(),
+            departure_before=(self.start + timedelta(days=1)).isoformat(),
+            transport_type='bus', min_seats=2, max_price='20000'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['listing_id'] for row in response.data],
+                         [str(self.match.listing_id)])
+
+    def test_only_active_listings_by_default(self):
+        response = self.search(origin='NG-LA', destination='NG-CR')
+        self.assertEqual(len(response.data), 4)
+        response = self.search(status='cancelled')
+        self.assertEqual(len(response.data), 1)
+
+    def test_rejects_inverted_ranges(self):
+        response = self.search(min_price='10', max_price='5')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('max_price', response.data)
+
+        response = self.search(origin='XX-00')
+        self.assertEqual(response.status_code, 400)
+
+    def test_paginates_with_keyset_cursor(self):
+        response = self.search(origin='NG-LA', page_size=2)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+
+class SeatReservationTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        cls.listing = make_listing(cls.operator, available_seats=3,
+                                   total_seats=10)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.operator)
+        patcher = mock.patch('listings.notifications.notify')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def book(self, seats, email='ada@example.com', **extra):
+        return self.client.post('/api/booking/', {
+            'listing_id': str(self.listing.listing_id),
+            'passenger_name': email.split('@')[0],
+            'passenger_email': email,
+            'num_seats': seats,
+            'booking_date': timezone.now().isoformat(),
+            'amount_paid': '15000.00',
+            **extra,
+        })
+
+    def test_booking_takes_seats(self):
+        response = self.book(2)
+        self.assertEqual(response.status_code, 201)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.available_seats, 1)
+
+    def test_overbooking_is_rejected_without_side_effects(self):
+        response = self.book(4)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('num_seats', response.data)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.available_seats, 3)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_update_and_delete_move_seats(self):
+        booking_id = self.book(1).data['booking_id']
+        url = f'/api/booking/{booking_id}/'
+
+        self.assertEqual(self.client.patch(url, {'num_seats': 3}).status_code,
+                         200)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.available_seats, 0)
+
+        self.client.patch(url, {'status': 'cancelled'})
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.available_seats, 3)
+
+        self.client.patch(url, {'status': 'pending', 'num_seats': 2})
+        self.client.delete(url)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.available_seats, 3)
+
+    def test_cancelled_booking_holds_no_seats(self):
+        response = self.book(3, status='cancelled')
+        self.assertEqual(response.status_code, 201)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.available_seats, 3)
+
+        url = f"/api/booking/{response.data['booking_id']}/"
+        self.client.patch(url, {'status': 'pending'})
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.available_seats, 0)
+        self.client.delete(url)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.available_seats, 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConcurrentReservationTests(TransactionTestCase):
+    threads = 12
+    seats = 5
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Needs a test database shared across threads")
+        self.listing = make_listing(make_user(),
+                                    available_seats=self.seats,
+                                    total_seats=self.seats)
+
+    def test_last_seats_are_never_oversold(self):
+        barrier = threading.Barrier(self.threads)
+        outcomes = []
+
+        def attempt(i):
+            try:
+                barrier.wait()
+                reservations.book(
+                    lambda: Booking.objects.create(
+                        listing=self.listing,
+                        passenger_name=f'Passenger {i}',
+                        passenger_email=f'p{i}@example.com',
+                        num_seats=1,
+                        booking_date=timezone.now(),
+                        amount_paid=Decimal('15000.00'),
+                    ),
+                    self.listing.pk, 1
+                )
+                outcomes.append('booked')
+            except reservations.SeatsUnavailable:
+                outcomes.append('sold out')
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=attempt, args=(i,))
+                   for i in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.listing.refresh_from_db()
+        self.assertEqual(outcomes.count('booked'), self.seats)
+        self.assertEqual(outcomes.count('sold out'),
+                         self.threads - self.seats)
+        self.assertEqual(self.listing.available_seats, 0)
+        self.assertEqual(Booking.objects.count(), self.seats)
+
+
+class BulkBookingTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        cls.roomy = make_listing(cls.operator, available_seats=50)
+        cls.tight = make_listing(cls.operator, available_seats=2)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.operator)
+        patcher = mock.patch('listings.notifications.notify')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def item(self, listing, n, seats=1):
+        return {
+            'listing_id': str(listing.listing_id),
+            'passenger_name': f'Passenger {n}',
+            'passenger_email': f'p{n}@example.com',
+            'num_seats': seats,
+            'booking_date': timezone.now().isoformat(),
+            'amount_paid': '15000.00',
+        }
+
+    def post(self, items):
+        return self.client.post('/api/booking/bulk/', items, format='json')
+
+    def test_reports_each_item(self):
+        items = [
+            self.item(self.roomy, 1),
+            self.item(self.tight, 2, seats=2),
+            self.item(self.tight, 3),
+            self.item(self.roomy, 1),
+            dict(self.item(self.roomy, 4), num_seats=0),
+        ]
+        response = self.post(items)
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['created'], 1)
+        statuses = [r['status'] for r in response.data['results']]
+        self.assertEqual(statuses,
+                         ['created', 'error', 'error', 'error', 'error'])
+        self.assertIn('num_seats', response.data['results'][1]['errors'])
+        self.assertIn('non_field_errors',
+                      response.data['results'][3]['errors'])
+
+        self.roomy.refresh_from_db()
+        self.tight.refresh_from_db()
+        self.assertEqual(self.roomy.available_seats, 49)
+        self.assertEqual(self.tight.available_seats, 2)
+        self.send.assert_called_once()
+
+    def test_query_count_does_not_grow_with_batch(self):
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(
+                self.post([self.item(self.roomy, n) for n in range(2)])
+                .status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(
+                self.post([self.item(self.roomy, n) for n in range(2, 40)])
+                .status_code, 201)
+        self.assertEqual(len(small), len(large))
+        self.roomy.refresh_from_db()
+        self.assertEqual(self.roomy.available_seats, 10)
+
+    def test_cancelled_items_hold_no_seats(self):
+        response = self.post([
+            dict(self.item(self.tight, 1, seats=2), status='cancelled'),
+            self.item(self.tight, 2, seats=2),
+        ])
+        self.assertEqual(response.data['created'], 2)
+        self.tight.refresh_from_db()
+        self.assertEqual(self.tight.available_seats, 0)
+
+    def test_rejects_non_list_and_oversized_batches(self):
+        self.assertEqual(self.post({'listing_id': 'x'}).status_code, 400)
+        with mock.patch.object(BookingViewSet, 'bulk_max_size', 1):
+            response = self.post([self.item(self.roomy, n) for n in range(2)])
+        self.assertEqual(response.status_code, 400)
+
+
+class RatingAggregateTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        cls.listing = make_listing(cls.operator)
+        cls.other = make_listing(cls.operator)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.operator)
+
+    def review(self, listing, rating):
+        response = self.client.post('/api/review/', {
+            'listing_id': str(listing.listing_id),
+            'reviewer_name': 'Ada',
+            'rating': rating,
+            'comment': 'Fine trip',
+        })
+        self.assertEqual(response.status_code, 201)
+        return f"/api/review/{response.data['review_id']}/"
+
+    def aggregates(self, listing):
+        listing.refresh_from_db()
+        return (listing.review_count, listing.rating_sum,
+                listing.rating_avg)
+
+    def test_writes_keep_aggregates_in_step(self):
+        first = self.review(self.listing, 5)
+        self.review(self.listing, 2)
+        self.assertEqual(self.aggregates(self.listing),
+                         (2, 7, Decimal('3.50')))
+
+        self.client.patch(first, {'rating': 4})
+        self.assertEqual(self.aggregates(self.listing),
+                         (2, 6, Decimal('3.00')))
+
+        self.client.patch(first, {'listing_id': str(self.other.listing_id)})
+        self.assertEqual(self.aggregates(self.listing),
+                         (1, 2, Decimal('2.00')))
+        self.assertEqual(self.aggregates(self.other),
+                         (1, 4, Decimal('4.00')))
+
+        self.client.delete(first)
+        self.assertEqual(self.aggregates(self.other), (0, 0, Decimal('0')))
+
+        response = self.client.get(f'/api/listing/{self.listing.listing_id}/')
+        self.assertEqual(response.data['review_count'], 1)
+        self.assertEqual(response.data['rating_avg'], '2.00')
+
+    def test_average_follows_a_run_of_writes(self):
+        steps = []
+        first = self.review(self.listing, 5)
+        steps.append(self.aggregates(self.listing))
+        second = self.review(self.listing, 3)
+        steps.append(self.aggregates(self.listing))
+        self.review(self.listing, 4)
+        steps.append(self.aggregates(self.listing))
+        self.client.patch(second, {'rating': 1})
+        steps.append(self.aggregates(self.listing))
+        self.client.delete(first)
+        steps.append(self.aggregates(self.listing))
+        self.assertEqual(steps, [
+            (1, 5, Decimal('5.00')),
+            (2, 8, Decimal('4.00')),
+            (3, 12, Decimal('4.00')),
+            (3, 10, Decimal('3.33')),
+            (2, 5, Decimal('2.50')),
+        ])
+
+    def test_average_is_computed_from_the_columns(self):
+        # Setting the average next to the deltas would double them on
+        # MySQL, which evaluates SET assignments left to right.
+        with CaptureQueriesContext(connection) as queries:
+            ratings.adjust_rating(self.listing.pk, 1, 3)
+        updates = [q['sql'] for q in queries.captured_queries
+                   if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        average = next(sql for sql in updates if 'rating_avg' in sql)
+        for column in ('review_count', 'rating_sum'):
+            self.assertNotIn(f'{connection.ops.quote_name(column)} =',
+                             average)
+        self.assertEqual(self.aggregates(self.listing),
+                         (1, 3, Decimal('3.00')))
+
+    def test_rebuild_command_matches_reviews(self):
+        for rating in (1, 2, 2):
+            Review.objects.create(listing=self.listing, reviewer_name='Bo',
+                                  rating=rating, comment='Direct insert')
+        Listing.objects.filter(pk=self.other.pk).update(review_count=9,
+                                                        rating_sum=40)
+
+        call_command('rebuild_ratings', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(self.aggregates(self.listing),
+                         (3, 5, Decimal('1.67')))
+        self.assertEqual(self.aggregates(self.other), (0, 0, Decimal('0')))
+
+
+class ListQueryCountTests(ListingsTestCase):
+    """
+    List endpoints must run a fixed number of queries however many rows
+    they return; a growing count means an N+1 crept into a serializer.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        operators = [make_user(f'operator{i}') for i in range(3)]
+        for i in range(12):
+            listing = make_listing(operators[i % 3], name=f'Route {i}')
+            Booking.objects.create(
+                listing=listing, passenger_name=f'Passenger {i}',
+                passenger_email=f'p{i}@example.com', num_seats=1,
+                booking_date=timezone.now(), amount_paid=Decimal('100')
+            )
+            Review.objects.create(listing=listing, reviewer_name='Ada',
+                                  rating=4, comment='Good')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, path):
+        small = self.count_queries(f'{path}?page_size=2')
+        large = self.count_queries(f'{path}?page_size=12')
+        self.assertEqual(small, large,
+                         f"{path} query count grows with page size")
+        self.assertEqual(self.count_queries(path), large)
+
+    def test_listing_list(self):
+        self.assertConstantQueries('/api/listing/')
+
+    def test_listing_search(self):
+        self.assertConstantQueries('/api/listing/search/')
+
+    def test_booking_list(self):
+        self.assertConstantQueries('/api/booking/')
+
+    def test_review_list(self):
+        self.assertConstantQueries('/api/review/')
+        response = APIClient().get('/api/review/?page_size=1')
+        self.assertTrue(
+            response.data['results'][0]['listing_name'].startswith('Route')
+        )
+
+
+class FastReadTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        operator = make_user()
+        cls.listings = [
+            make_listing(operator, name=None if i == 0 else f'Route {i}',
+                         price=Decimal('1234.5') + i,
+                         departure_time=timezone.now() + timedelta(hours=i))
+            for i in range(4)
+        ]
+        Listing.objects.filter(pk=cls.listings[1].pk).update(
+            review_count=3, rating_sum=13, rating_avg=Decimal('4.33'))
+
+    def fetch_both(self, url):
+        client = APIClient()
+        with self.settings(LISTINGS_FAST_READ=False,
+                           LISTINGS_CACHE_TIMEOUT=0):
+            slow = client.get(url)
+        with self.settings(LISTINGS_FAST_READ=True,
+                           LISTINGS_CACHE_TIMEOUT=0):
+            fast = client.get(url)
+        self.assertEqual(slow.status_code, fast.status_code)
+        return slow.content, fast.content
+
+    def test_output_is_byte_identical(self):
+        pk = self.listings[0].listing_id
+        for url in ('/api/listing/', '/api/listing/?page_size=2',
+                    f'/api/listing/{pk}/',
+                    '/api/listing/search/?origin=NG-LA&page_size=3'):
+            slow, fast = self.fetch_both(url)
+            self.assertEqual(slow, fast, url)
+
+    def test_missing_listing_is_404(self):
+        self.assertEqual(
+            APIClient().get(f'/api/listing/{uuid.uuid4()}/').status_code, 404
+        )
+        self.assertEqual(
+            APIClient().get('/api/listing/not-a-uuid/').status_code, 404
+        )
+
+    def test_rejects_serializers_needing_instances(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ReadPlan(ReviewSerializer).paths
+
+
+class ListingCacheTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        cls.listing = make_listing(cls.operator, available_seats=10)
+
+    def get(self, url):
+        return APIClient().get(url)
+
+    def lookups(self, outcome):
+        return REGISTRY.get_sample_value('listings_cache_operations_total',
+                                         {'outcome': outcome}) or 0
+
+    def test_hits_after_first_read(self):
+        url = f'/api/listing/{self.listing.listing_id}/'
+        before = {outcome: self.lookups(outcome)
+                  for outcome in ('hit', 'miss')}
+        self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['available_seats'], 10)
+        self.assertEqual(self.lookups('hit') - before['hit'], 1)
+        self.assertEqual(self.lookups('miss') - before['miss'], 1)
+
+    def test_query_parameters_are_normalized(self):
+        self.get('/api/listing/search/?origin=NG-LA&min_seats=1')
+        response = self.get('/api/listing/search/?min_seats=1&origin=NG-LA')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_writes_invalidate(self):
+        url = '/api/listing/'
+        self.get(url)
+
+        # Invalidation waits for the writing transaction to commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.name = 'Renamed'
+            self.listing.save()
+            self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data[0]['name'], 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservations.reserve_seats(self.listing.pk, 4)
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data[0]['available_seats'], 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.delete()
+        self.assertEqual(self.get(url).data, [])
+
+    def test_authenticated_reads_bypass_cache(self):
+        client = APIClient()
+        client.force_authenticate(self.operator)
+        client.get('/api/listing/')
+        self.assertNotIn('X-Cache', client.get('/api/listing/'))
+
+    def test_cache_outage_serves_uncached(self):
+        with mock.patch.object(cache, 'get_cache') as get_cache, \
+                self.assertLogs('listings.cache', 'WARNING'):
+            get_cache.return_value.get.side_effect = ConnectionError
+            response = self.get('/api/listing/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+
+class ConditionalGetTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        cls.listing = make_listing(cls.operator)
+        cls.review = Review.objects.create(listing=cls.listing,
+                                           reviewer_name='Ada', rating=5,
+                                           comment='Great')
+        Booking.objects.create(listing=cls.listing, passenger_name='Ada',
+                               passenger_email='ada@example.com',
+                               num_seats=1, booking_date=timezone.now(),
+                               amount_paid=Decimal('100'))
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        # Authenticated reads skip the response cache.
+        self.client.force_authenticate(self.operator)
+
+    def revalidate(self, url, **headers):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', first)
+        return first, self.client.get(url, headers=headers or {
+            'If-None-Match': first['ETag']
+        })
+
+    def test_unchanged_resources_are_not_modified(self):
+        for url in ('/api/listing/', f'/api/listing/{self.listing.pk}/',
+                    '/api/listing/search/?origin=NG-LA',
+                    '/api/review/', f'/api/review/{self.review.pk}/',
+                    '/api/booking/'):
+            first, second = self.revalidate(url)
+            self.assertEqual(second.status_code, 304, url)
+            self.assertEqual(second.content, b'')
+            self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_not_modified_skips_serialization(self):
+        url = '/api/review/'
+        etag = self.client.get(url)['ETag']
+        with mock.patch.object(ReviewSerializer, 'to_representation') as rep:
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        rep.assert_not_called()
+
+    def test_changes_produce_a_new_etag(self):
+        url = '/api/listing/'
+        etag = self.client.get(url)['ETag']
+        reservations.reserve_seats(self.listing.pk, 1)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        make_listing(self.operator)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_listing_renames_change_the_review_etags(self):
+        urls = ('/api/review/', f'/api/review/{self.review.pk}/')
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.listing.name = 'Abuja Express'
+        self.listing.save()
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_operator_edits_change_the_listing_etags(self):
+        urls = ('/api/listing/', f'/api/listing/{self.listing.pk}/')
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.operator.last_name = 'Renamed'
+        self.operator.save(update_fields=['last_name'])
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_page_validators_cover_only_the_page(self):
+        later = make_listing(self.operator,
+                             departure_time=timezone.now() + timedelta(days=9))
+        url = '/api/listing/?page_size=1'
+        with CaptureQueriesContext(connection) as queries:
+            etag = self.client.get(url)['ETag']
+        # No aggregate over the whole list: every query reads one page.
+        table = connection.ops.quote_name(Listing._meta.db_table)
+        listing_queries = [q['sql'] for q in queries.captured_queries
+                           if f'FROM {table}' in q['sql']]
+        self.assertEqual(len(listing_queries), 2)
+        for sql in listing_queries:
+            self.assertNotIn('COUNT(', sql)
+            self.assertIn('LIMIT 2', sql)
+
+        # Changes past the page leave it alone.
+        make_listing(self.operator,
+                     departure_time=timezone.now() + timedelta(days=10))
+        reservations.reserve_seats(later.pk, 1)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        reservations.reserve_seats(self.listing.pk, 1)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        # Losing the next page drops the next link, so it is a change too.
+        etag = response['ETag']
+        Listing.objects.exclude(pk=self.listing.pk).delete()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['next'])
+
+    def test_if_modified_since(self):
+        url = f'/api/listing/{self.listing.pk}/'
+        first, second = self.revalidate(
+            url, **{'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT'}
+        )
+        self.assertEqual(second.status_code, 200)
+        response = self.client.get(url, headers={
+            'If-Modified-Since': first['Last-Modified']
+        })
+        self.assertEqual(response.status_code, 304)
+
+    def test_anonymous_cached_reads_revalidate(self):
+        client = APIClient()
+        url = f'/api/listing/{self.listing.pk}/'
+        etag = client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_missing_rows_still_404(self):
+        self.assertEqual(
+            self.client.get(f'/api/listing/{uuid.uuid4()}/').status_code, 404
+        )
+        self.assertEqual(self.client.get('/api/review/nope/').status_code,
+                         404)
+
+
+class ChapaClientTests(SimpleTestCase):
+    def setUp(self):
+        self.chapa = FakeChapaServer().start()
+        self.addCleanup(self.chapa.stop)
+
+    def client_for(self, **kwargs):
+        options = {'connect_timeout': 0.5, 'read_timeout': 0.2,
+                   'max_retries': 2, 'backoff': 0.01}
+        options.update(kwargs)
+        return ChapaClient(self.chapa.url, 'test-key', **options)
+
+    def test_retries_transient_failures(self):
+        self.chapa.failures = [503, 502]
+        response = self.client_for().verify('tx-1')
+        self.assertTrue(response.ok)
+        self.assertEqual(len(self.chapa.requests), 3)
+
+    def test_posts_are_not_retried_after_read_timeout(self):
+        self.chapa.delay = 0.5
+        with self.assertRaises(GatewayUnavailable):
+            self.client_for().initialize({'tx_ref': 'tx-1'})
+        self.assertEqual(len(self.chapa.requests), 1)
+
+    def test_client_errors_are_returned_not_retried(self):
+        response = self.client_for()._request('verify', 'GET', 'nope',
+                                              idempotent=True)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.ok)
+        self.assertEqual(len(self.chapa.requests), 1)
+
+    def test_circuit_opens_then_probes(self):
+        clock = mock.Mock(return_value=0.0)
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10,
+                                 clock=clock)
+        client = self.client_for(max_retries=0, breaker=breaker)
+        self.chapa.failures = [503, 503]
+        for _ in range(2):
+            with self.assertRaises(GatewayUnavailable):
+                client.verify('tx-1')
+
+        with self.assertRaises(GatewayUnavailable):
+            client.verify('tx-1')
+        self.assertEqual(len(self.chapa.requests), 2)
+
+        clock.return_value = 10.0
+        self.assertTrue(client.verify('tx-1').ok)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_broken_responses_count_as_failures(self):
+        clock = mock.Mock(return_value=0.0)
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10,
+                                 clock=clock)
+        client = self.client_for(max_retries=0, breaker=breaker)
+        self.chapa.failures = [503]
+        with self.assertRaises(GatewayUnavailable):
+            client.verify('tx-1')
+
+        # The half-open probe fails mid-body; the breaker must reopen
+        # instead of keeping the probe slot taken.
+        clock.return_value = 10.0
+        with mock.patch.object(client.session, 'request',
+                               side_effect=ChunkedEncodingError('cut')):
+            with self.assertRaises(GatewayUnavailable):
+                client.verify('tx-1')
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        clock.return_value = 20.0
+        self.assertTrue(client.verify('tx-1').ok)
+
+    def test_p99_stays_bounded_when_upstream_is_degraded(self):
+        # Chapa hangs for 2s per call; timeouts, retries and the breaker
+        # must keep every caller far below that.
+        self.chapa.delay = 2.0
+        client = self.client_for(
+            max_retries=1,
+            breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        )
+        samples = []
+        for _ in range(50):
+            with stopwatch(samples):
+                with self.assertRaises(GatewayUnavailable):
+                    client.verify('tx-1')
+
+        # Two read timeouts plus backoff for the calls that reached Chapa.
+        self.assertLess(percentile(samples, 99), 0.2 * 2 + 0.05 + 0.1)
+        # Once open, the breaker fails fast without touching the network.
+        self.assertLess(percentile(samples, 90), 0.01)
+        self.assertEqual(len(self.chapa.requests), 6)
+
+
+class PaymentViewTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        listing = make_listing(cls.operator)
+        cls.booking = Booking.objects.create(
+            listing=listing, passenger_name='Ada',
+            passenger_email='ada@example.com', num_seats=1,
+            booking_date=timezone.now(), amount_paid=Decimal('15000.00')
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.chapa = FakeChapaServer().start()
+        self.addCleanup(self.chapa.stop)
+        overrides = self.settings(CHAPA_BASE_URL=self.chapa.url,
+                                  CHAPA_READ_TIMEOUT=0.2,
+                                  CHAPA_MAX_RETRIES=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch('listings.notifications.notify')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.operator)
+
+    def initiate(self, **headers):
+        return self.client.post(
+            f'/api/payments/initiate/{self.booking.booking_id}/', **headers
+        )
+
+    def test_initiate_retry_reuses_the_checkout(self):
+        first = self.initiate(HTTP_IDEMPOTENCY_KEY='pay-1')
+        retry = self.initiate(HTTP_IDEMPOTENCY_KEY='pay-1')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(len(self.chapa.requests), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_pending_checkout_is_not_replaced(self):
+        first = self.initiate().data['tx_ref']
+        response = self.initiate()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['tx_ref'], first)
+        self.assertEqual(
+            list(Payment.objects.values_list('tx_ref', flat=True)), [first]
+        )
+
+    def test_new_checkout_takes_over_a_failed_payment(self):
+        first = self.initiate().data['tx_ref']
+        started = timezone.now() - timedelta(hours=2)
+        Payment.objects.update(status='failed', created_at=started)
+
+        second = self.initiate().data['tx_ref']
+        self.assertNotEqual(first, second)
+        payment = Payment.objects.get()
+        self.assertEqual((payment.tx_ref, payment.status), (second, 'pending'))
+        # The sweeper must not expire the restarted checkout right away.
+        self.assertGreater(payment.created_at, started)
+
+    def test_initiate_and_verify(self):
+        response = self.initiate()
+        self.assertEqual(response.status_code, 200)
+        tx_ref = response.data['tx_ref']
+        self.assertTrue(response.data['checkout_url'].endswith(tx_ref))
+
+        response = self.client.get('/api/payments/verify/',
+                                   {'tx_ref': tx_ref})
+        self.assertEqual(response.status_code, 202)
+        # The callback only queues the event; Chapa is not called inline.
+        self.assertEqual(len(self.chapa.requests), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = payments.drain()
+        self.assertEqual(stats['completed'], 1)
+        payment = Payment.objects.get(tx_ref=tx_ref)
+        self.assertEqual(payment.status, 'completed')
+        self.assertEqual(payment.chapa_transaction_id, f'chapa-{tx_ref}')
+        self.assertEqual(payment.booking.status, 'confirmed')
+        self.send.assert_called_once()
+
+        response = self.client.get('/api/payments/verify/',
+                                   {'tx_ref': tx_ref})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unavailable_gateway_leaves_verification_pending(self):
+        tx_ref = self.initiate().data['tx_ref']
+        self.client.get('/api/payments/verify/', {'tx_ref': tx_ref})
+        self.chapa.delay = 0.5
+
+        stats = payments.drain()
+        self.assertEqual(stats['deferred'], 1)
+        self.assertEqual(Payment.objects.get(tx_ref=tx_ref).status,
+                         'pending')
+        self.assertEqual(
+            PaymentEvent.objects.get(tx_ref=tx_ref).status,
+            PaymentEvent.RECEIVED
+        )
+
+        self.chapa.delay = 0
+        self.assertEqual(payments.drain()['completed'], 1)
+
+
+@override_settings(CHAPA_WEBHOOK_SECRET='whsec')
+class PaymentWebhookTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        operator = make_user()
+        listing = make_listing(operator)
+        cls.payments = []
+        for i in range(3):
+            booking = Booking.objects.create(
+                listing=listing, passenger_name=f'Passenger {i}',
+                passenger_email=f'p{i}@example.com', num_seats=1,
+                booking_date=timezone.now(), amount_paid=Decimal('10.00')
+            )
+            cls.payments.append(Payment.objects.create(
+                booking=booking, tx_ref=f'tx-hook-{i}',
+                amount=booking.amount_paid
+            ))
+
+    def setUp(self):
+        super().setUp()
+        self.chapa = FakeChapaServer().start()
+        self.addCleanup(self.chapa.stop)
+        self.gateway = ChapaClient(self.chapa.url, 'key', read_timeout=1,
+                                   max_retries=0)
+
+    def post(self, payload, signature=None):
+        body = json.dumps(payload).encode()
+        return APIClient().post(
+            '/api/payments/webhook/', body, content_type='application/json',
+            HTTP_CHAPA_SIGNATURE=signature or payments.sign(body)
+        )
+
+    def event(self, tx_ref, status='success'):
+        return {'event': 'charge.success', 'tx_ref': tx_ref,
+                'status': status, 'reference': f'ref-{tx_ref}'}
+
+    def test_rejects_bad_signatures(self):
+        response = self.post(self.event('tx-hook-0'), signature='0' * 64)
+        self.assertEqual(response.status_code, 403)
+        with self.settings(CHAPA_WEBHOOK_SECRET=''):
+            response = self.post(self.event('tx-hook-0'))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_replays_are_recorded_once(self):
+        for _ in range(3):
+            self.assertEqual(
+                self.post(self.event('tx-hook-0')).status_code, 200
+            )
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+        self.assertEqual(
+            list(OutboxMessage.objects.values_list('task', flat=True)),
+            ['listings.tasks.process_payment_events']
+        )
+        self.assertEqual(self.chapa.requests, [])
+
+    def test_drain_settles_each_payment_once(self):
+        self.chapa.outcomes['tx-hook-2'] = 'failed'
+        for payment in self.payments:
+            self.post(self.event(payment.tx_ref))
+        # A second, distinct event for an already queued transaction.
+        self.post(self.event('tx-hook-0', status='completed'))
+        self.post(self.event('tx-unknown'))
+
+        with self.assertNumQueries(19):
+            stats = payments.drain(batch_size=10, client=self.gateway)
+        self.assertEqual(stats['claimed'], 5)
+        self.assertEqual(
+            (stats['completed'], stats['failed'], stats['unknown']),
+            (2, 1, 1)
+        )
+        # One verify call per distinct pending tx_ref in the batch.
+        self.assertEqual(len(self.chapa.requests), 3)
+        self.assertEqual(
+            dict(Payment.objects.values_list('tx_ref', 'status')),
+            {'tx-hook-0': 'completed', 'tx-hook-1': 'completed',
+             'tx-hook-2': 'failed'}
+        )
+        self.assertFalse(
+            PaymentEvent.objects.exclude(status=PaymentEvent.PROCESSED)
+            .exists()
+        )
+
+        # Re-delivering the event later does not touch the payment again.
+        self.post(self.event('tx-hook-2', status='retry'))
+        stats = payments.drain(client=self.gateway)
+        self.assertEqual(stats['unchanged'], 1)
+        self.assertEqual(len(self.chapa.requests), 3)
+        self.assertEqual(Payment.objects.get(tx_ref='tx-hook-2').status,
+                         'failed')
+
+    def test_expired_claims_are_reprocessed(self):
+        self.post(self.event('tx-hook-0'))
+        self.assertEqual(len(payments.claim_events(10)), 1)
+        self.assertEqual(payments.claim_events(10), [])
+        self.assertEqual(len(payments.claim_events(10, lease=-1)), 1)
+
+
+class IdempotencyTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        cls.listing = make_listing(cls.operator)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.operator)
+        patcher = mock.patch('listings.notifications.notify')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def book(self, key, seats=1):
+        return self.client.post('/api/booking/', {
+            'listing_id': str(self.listing.listing_id),
+            'passenger_name': 'Ada',
+            'passenger_email': 'ada@example.com',
+            'num_seats': seats,
+            'booking_date': '2030-01-01T10:00:00Z',
+            'amount_paid': '15000.00',
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.book('key-1')
+        self.assertEqual(first.status_code, 201)
+
+        with self.assertNumQueries(0):
+            retry = self.book('key-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.available_seats, 29)
+
+    def test_key_reused_for_another_request(self):
+        self.book('key-1')
+        self.assertEqual(self.book('key-1', seats=2).status_code, 422)
+
+    def test_retry_while_in_flight(self):
+        retries = []
+        book = reservations.book
+
+        def book_during_retry(*args):
+            retries.append(self.book('key-1'))
+            return book(*args)
+
+        with mock.patch('listings.reservations.book',
+                        side_effect=book_during_retry):
+            self.assertEqual(self.book('key-1').status_code, 201)
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertEqual(self.book('key-1').status_code, 201)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_server_errors_are_not_stored(self):
+        with mock.patch('listings.reservations.book',
+                        side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.book('key-1')
+        self.assertEqual(self.book('key-1').status_code, 201)
+
+    def test_keys_are_scoped_per_user(self):
+        self.book('key-1')
+        self.client.force_authenticate(make_user('other'))
+        response = self.book('key-1')
+        # Runs for real and hits the one-booking-per-passenger constraint.
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+
+class StaleSweepTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.listing = make_listing(make_user(), available_seats=20,
+                                   total_seats=40)
+        long_ago = timezone.now() - timedelta(days=2)
+
+        def booking(name, seats, payment=None, stale=True):
+            booking = Booking.objects.create(
+                listing=cls.listing, passenger_name=name,
+                passenger_email=f'{name}@example.com', num_seats=seats,
+                booking_date=timezone.now(), amount_paid=Decimal('10.00')
+            )
+            if payment:
+                Payment.objects.create(booking=booking, tx_ref=f'tx-{name}',
+                                       amount=booking.amount_paid,
+                                       status=payment)
+            if stale:
+                Booking.objects.filter(pk=booking.pk).update(
+                    created_at=long_ago
+                )
+                Payment.objects.filter(booking=booking).update(
+                    created_at=long_ago
+                )
+            return booking
+
+        cls.paid = booking('paid', 2, payment='pending')
+        cls.abandoned = booking('abandoned', 3, payment='pending')
+        cls.declined = booking('declined', 4, payment='failed')
+        cls.unpaid = booking('unpaid', 5)
+        cls.fresh = booking('fresh', 6, payment='pending', stale=False)
+        cls.fresh_unpaid = booking('fresh_unpaid', 7, stale=False)
+
+    def setUp(self):
+        super().setUp()
+        self.chapa = FakeChapaServer().start()
+        self.addCleanup(self.chapa.stop)
+        self.chapa.outcomes['tx-abandoned'] = 'failed'
+        self.gateway = ChapaClient(self.chapa.url, 'key', read_timeout=0.5,
+                                   max_retries=0)
+        patcher = mock.patch('listings.notifications.notify')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def statuses(self):
+        return dict(Booking.objects.values_list('passenger_name', 'status'))
+
+    def test_settles_stale_rows_and_releases_seats(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            report = sweeper.sweep(chunk_size=1, client=self.gateway)
+
+        self.assertEqual(report['payments_scanned'], 2)
+        self.assertEqual(report['payments_completed'], 1)
+        self.assertEqual(report['payments_failed'], 1)
+        self.assertEqual(report['bookings_cancelled'], 3)
+        self.assertEqual(report['seats_released'], 3 + 4 + 5)
+        self.assertEqual(len(self.chapa.requests), 2)
+        self.assertEqual(self.statuses(), {
+            'paid': 'confirmed', 'abandoned': 'cancelled',
+            'declined': 'cancelled', 'unpaid': 'cancelled',
+            'fresh': 'pending', 'fresh_unpaid': 'pending',
+        })
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.available_seats, 32)
+
+        # A second sweep finds nothing left to do.
+        report = sweeper.sweep(client=self.gateway)
+        self.assertEqual(report['payments_scanned'], 0)
+        self.assertEqual(report['seats_released'], 0)
+
+    def test_sweeps_are_exported_as_metrics(self):
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        sweeps = sample('listings_payment_sweep_duration_seconds_count')
+        released = sample('listings_payment_sweep_rows_total',
+                          counter='seats_released')
+        with self.captureOnCommitCallbacks(execute=True):
+            sweeper.sweep(chunk_size=1, client=self.gateway)
+        self.assertEqual(
+            sample('listings_payment_sweep_duration_seconds_count'),
+            sweeps + 1
+        )
+        self.assertEqual(sample('listings_payment_sweep_rows_total',
+                                counter='seats_released'), released + 12)
+
+    def test_unreachable_gateway_defers_payments(self):
+        self.chapa.delay = 1
+        report = sweeper.sweep(chunk_size=1, client=self.gateway)
+        self.assertEqual(report['payments_deferred'], 1)
+        self.assertEqual(len(self.chapa.requests), 1)
+        self.assertEqual(
+            Payment.objects.filter(status='pending').count(), 3
+        )
+        # Bookings without a live payment are still expired.
+        self.assertEqual(report['bookings_cancelled'], 2)
+
+
+class NotificationTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        listing = make_listing(make_user(), name='Lagos <Express>')
+        cls.bookings = [
+            Booking.objects.create(
+                listing=listing, passenger_name=f'Passenger {i}',
+                passenger_email=f'p{i}@example.com', num_seats=1,
+                booking_date=timezone.now(), amount_paid=Decimal('10.00')
+            )
+            for i in range(20)
+        ]
+        Payment.objects.create(booking=cls.bookings[0], tx_ref='tx-mail',
+                               amount=Decimal('10.00'), status='completed')
+
+    def setUp(self):
+        super().setUp()
+        self.smtp = FakeSMTPServer().start()
+        self.addCleanup(self.smtp.stop)
+
+    def smtp_connection(self):
+        return get_connection('django.core.mail.backends.smtp.EmailBackend',
+                              host=self.smtp.host, port=self.smtp.port,
+                              timeout=2)
+
+    def batch(self, count, kind='booking'):
+        build = getattr(notifications, f'{kind}_confirmation')
+        return [build(booking.booking_id) for booking in self.bookings[:count]]
+
+    def test_batch_shares_one_connection_and_one_query(self):
+        with self.assertNumQueries(1):
+            failed = notifications.send_batch(self.batch(20),
+                                              self.smtp_connection())
+        self.assertEqual(failed, [])
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(len(self.smtp.messages), 20)
+
+    def test_failed_recipient_does_not_sink_the_batch(self):
+        self.smtp.rejected.add('p1@example.com')
+        failed = notifications.send_batch(self.batch(3),
+                                          self.smtp_connection())
+        self.assertEqual([n['booking_id'] for n in failed],
+                         [str(self.bookings[1].booking_id)])
+        self.assertEqual(len(self.smtp.messages), 2)
+        # Only the failure costs a reconnect.
+        self.assertEqual(self.smtp.connections, 2)
+
+    def test_task_retries_only_failed_recipients(self):
+        batch = self.batch(3)
+        with mock.patch.object(notifications, 'send_batch',
+                               side_effect=[batch[1:2], []]) as send:
+            send_notifications.apply(args=[batch])
+        self.assertEqual(send.call_args_list,
+                         [mock.call(batch), mock.call(batch[1:2])])
+
+    def test_renders_text_and_html_from_templates(self):
+        send_payment_confirmation_email(str(self.bookings[0].booking_id))
+        message = mail.outbox[0]
+        self.assertEqual(message.subject,
+                         'Payment Confirmation - Travel Booking')
+        self.assertEqual(message.to, ['p0@example.com'])
+        self.assertIn('Reference: tx-mail', message.body)
+        self.assertIn('Lagos <Express>', message.body)
+        html, mimetype = message.alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn('Lagos &lt;Express&gt;', html)
+
+    def test_messages_queued_with_the_old_signatures(self):
+        booking = self.bookings[0]
+        send_payment_confirmation_email.apply(
+            args=[booking.passenger_email, str(booking.booking_id), '10.00']
+        ).get()
+        send_booking_confirmation_email.apply(
+            args=[booking.passenger_email, str(booking.booking_id)]
+        ).get()
+        self.assertEqual([message.to for message in mail.outbox],
+                         [['p0@example.com'], ['p0@example.com']])
+        self.assertEqual(mail.outbox[0].subject,
+                         'Payment Confirmation - Travel Booking')
+
+    def test_locale_templates_with_fallback(self):
+        booking_id = self.bookings[1].booking_id
+        notifications.send_batch([
+            notifications.booking_confirmation(booking_id, 'fr-ca'),
+            notifications.booking_confirmation(booking_id, 'de'),
+        ])
+        french, german = mail.outbox
+        self.assertEqual(french.subject, 'Réservation créée avec succès')
+        self.assertIn('Places : 1', french.body)
+        self.assertEqual(german.subject, 'Booking Created Successfully')
+
+    def test_compiled_templates_are_reused(self):
+        rendering.get_templates.cache_clear()
+        with mock.patch('listings.rendering.select_template',
+                        wraps=select_template) as select:
+            notifications.send_batch(self.batch(5))
+        self.assertEqual(select.call_count, len(rendering.PARTS))
+        self.assertEqual(len(mail.outbox), 5)
+
+
+class FakeCeleryApp:
+    """
+    Records what the outbox relay publishes.
+    """
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.producers = 0
+
+    @contextmanager
+    def producer_or_acquire(self):
+        self.producers += 1
+        yield object()
+
+    def send_task(self, name, args, kwargs, producer):
+        if self.fail:
+            raise ConnectionRefusedError("broker down")
+        self.sent.append((name, args, kwargs))
+
+
+class OutboxTests(ListingsTestCase):
+    NOTIFY = 'listings.tasks.send_notifications'
+    DRAIN = 'listings.tasks.process_payment_events'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        cls.listing = make_listing(cls.operator, available_seats=2)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.operator)
+
+    def book(self, name, seats=1):
+        return self.client.post('/api/booking/', {
+            'listing_id': str(self.listing.listing_id),
+            'passenger_name': name,
+            'passenger_email': f'{name}@example.com',
+            'num_seats': seats,
+            'booking_date': timezone.now().isoformat(),
+            'amount_paid': '15000.00',
+        })
+
+    def test_booking_writes_its_confirmation_to_the_outbox(self):
+        self.assertEqual(self.book('ada').status_code, 201)
+        self.assertEqual(self.book('bob', seats=5).status_code, 400)
+
+        booking = Booking.objects.get()
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.task, self.NOTIFY)
+        self.assertEqual(message.args[0][0]['booking_id'],
+                         str(booking.booking_id))
+
+    def test_request_latency_is_flat_while_the_broker_is_down(self):
+        def unreachable_broker(*args, **kwargs):
+            time.sleep(1)
+            raise ConnectionRefusedError("broker down")
+
+        samples = []
+        with mock.patch('celery.app.base.Celery.send_task',
+                        side_effect=unreachable_broker) as send_task, \
+                mock.patch('celery.app.task.Task.apply_async',
+                           side_effect=unreachable_broker) as apply_async:
+            for name in ('ada', 'bob'):
+                with stopwatch(samples):
+                    self.assertEqual(self.book(name).status_code, 201)
+        self.assertLess(max(samples), 0.5)
+        send_task.assert_not_called()
+        apply_async.assert_not_called()
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+    def test_relay_merges_and_deduplicates_calls(self):
+        for i in range(3):
+            notifications.notify(notifications.booking_confirmation(i))
+        outbox.publish(self.DRAIN)
+        outbox.publish(self.DRAIN)
+        outbox.publish('listings.tasks.send_booking_confirmation_email',
+                       ['b-1'])
+
+        app = FakeCeleryApp()
+        with self.settings(NOTIFICATION_BATCH_SIZE=2):
+            stats = outbox.relay_all(app=app)
+
+        self.assertEqual(stats['relayed'], 6)
+        self.assertEqual(app.producers, 1)
+        self.assertEqual([name for name, _, _ in app.sent], [
+            self.DRAIN, 'listings.tasks.send_booking_confirmation_email',
+            self.NOTIFY, self.NOTIFY,
+        ])
+        self.assertEqual(
+            [len(args[0]) for name, args, _ in app.sent
+             if name == self.NOTIFY], [2, 1]
+        )
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_relay_keeps_rows_when_publishing_fails(self):
+        outbox.publish(self.DRAIN)
+        with self.assertRaises(ConnectionRefusedError):
+            outbox.relay(app=FakeCeleryApp(fail=True))
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+        app = FakeCeleryApp()
+        outbox.relay(app=app)
+        self.assertEqual(len(app.sent), 1)
+
+
+class TaskRoutingTests(SimpleTestCase):
+    PAYMENT = 'listings.tasks.process_payment_events'
+    SWEEP = 'listings.tasks.sweep_stale_payments'
+    EMAIL = 'listings.tasks.send_notifications'
+
+    def setUp(self):
+        self.handled = []
+
+    def broker(self, **handlers):
+        def record(name):
+            return lambda *args: self.handled.append((name, time.monotonic(),
+                                                      *args))
+        handlers = {name: handlers.get(name, record(name))
+                    for name in (self.PAYMENT, self.SWEEP, self.EMAIL)}
+        return FakeBroker(celery_app, handlers)
+
+    def test_tasks_are_routed_to_their_queues(self):
+        broker = self.broker()
+        self.assertEqual(broker.route(self.PAYMENT), ('payments', 9))
+        self.assertEqual(broker.route(self.SWEEP), ('payments', 1))
+        self.assertEqual(broker.route(self.EMAIL), ('email', 5))
+        self.assertEqual(
+            broker.route('listings.tasks.send_booking_confirmation_email')[0],
+            'email'
+        )
+        self.assertEqual(send_notifications.rate_limit,
+                         settings.EMAIL_TASK_RATE_LIMIT)
+
+    def test_higher_priority_payment_tasks_run_first(self):
+        broker = self.broker()
+        broker.send_task(self.SWEEP)
+        broker.send_task(self.PAYMENT)
+        with broker.worker(['payments']):
+            broker.join(timeout=5)
+        self.assertEqual([name for name, *_ in self.handled],
+                         [self.PAYMENT, self.SWEEP])
+
+    def test_email_flood_does_not_delay_payment_tasks(self):
+        broker = self.broker(**{self.EMAIL: lambda batch: time.sleep(0.01)})
+        with broker.worker(**settings.WORKER_PROFILES['payments']), \
+                broker.worker(**settings.WORKER_PROFILES['email']):
+            for _ in range(200):
+                broker.send_task(self.EMAIL, [[]])
+            sent_at = time.monotonic()
+            broker.send_task(self.PAYMENT)
+            broker.join(timeout=10)
+        (_, handled_at), = self.handled
+        self.assertLess(handled_at - sent_at, 0.2)
+
+
+class TaskResultTests(TestCase):
+    def test_only_polled_tasks_store_results(self):
+        self.assertTrue(send_notifications.ignore_result)
+        self.assertTrue(send_payment_confirmation_email.ignore_result)
+        self.assertTrue(relay_outbox.ignore_result)
+        self.assertFalse(sweep_stale_payments.ignore_result)
+
+    def test_purge_deletes_expired_results_in_chunks(self):
+        for i in range(4):
+            TaskResult.objects.create(task_id=f'task-{i}', status='SUCCESS')
+        GroupResult.objects.create(group_id='group-0')
+        day_ago = timezone.now() - timedelta(days=1)
+        TaskResult.objects.exclude(task_id='task-3').update(date_done=day_ago)
+        GroupResult.objects.update(date_done=day_ago)
+
+        deleted = task_results.purge(ttl=60 * 60, chunk_size=2)
+
+        self.assertEqual(deleted, {'taskresult': 3, 'groupresult': 1})
+        self.assertEqual(
+            list(TaskResult.objects.values_list('task_id', flat=True)),
+            ['task-3']
+        )
+        self.assertFalse(GroupResult.objects.exists())
+
+
+class SeedCommandTests(TestCase):
+    def seed(self, **options):
+        with CaptureQueriesContext(connection) as queries:
+            call_command('seed', stdout=StringIO(), **options)
+        return [query['sql'] for query in queries]
+
+    def snapshot(self):
+        return (
+            list(User.objects.order_by('pk').values_list('pk', 'username')),
+            list(Listing.objects.order_by('pk').values_list(
+                'pk', 'operator_id', 'available_seats', 'rating_avg')),
+            list(Booking.objects.order_by('pk').values_list(
+                'pk', 'listing_id', 'num_seats', 'status')),
+            Payment.objects.count(),
+            Review.objects.count(),
+        )
+
+    def test_scale_generates_consistent_rows_in_bulk(self):
+        queries = self.seed(scale=20, seed=7, chunk_size=50)
+
+        self.assertEqual(User.objects.count(), 100)
+        self.assertEqual(Listing.objects.count(), 200)
+        self.assertEqual(Payment.objects.count(), Booking.objects.count())
+        self.assertFalse([sql for sql in queries if 'RANDOM' in sql.upper()])
+        # A handful of bulk INSERTs per chunk, never one per row.
+        self.assertLess(len(queries), 200)
+
+        listings = Listing.objects.annotate(
+            booked=Sum('bookings__num_seats',
+                       filter=~Q(bookings__status='cancelled'))
+        )
+        for listing in listings:
+            self.assertEqual(listing.available_seats,
+                             listing.total_seats - (listing.booked or 0))
+        for listing in Listing.objects.annotate(reviews_total=Count('reviews')):
+            self.assertEqual(listing.review_count, listing.reviews_total)
+
+    def test_same_seed_is_deterministic_and_rerunnable(self):
+        self.seed(scale=3, seed=11)
+        first = self.snapshot()
+        self.seed(scale=3, seed=11)
+        self.assertEqual(self.snapshot(), first)
+
+        Booking.objects.all().delete()
+        Review.objects.all().delete()
+        Listing.objects.all().delete()
+        User.objects.all().delete()
+        self.seed(scale=3, seed=11)
+        self.assertEqual(self.snapshot(), first)
+
+
+class ApiBenchmarkTests(TestCase):
+    def test_compare_flags_slower_and_chattier_endpoints(self):
+        baseline = {'10': {
+            'listing-list': {'p95_ms': 10.0, 'queries_max': 2},
+            'review-list': {'p95_ms': 10.0, 'queries_max': 2},
+        }}
+        results = {'10': {
+            'listing-list': {'p95_ms': 11.0, 'queries_max': 2},
+            'review-list': {'p95_ms': 13.0, 'queries_max': 3},
+            'booking-create': {'p95_ms': 99.0, 'queries_max': 9},
+        }}
+        self.assertEqual(compare(results, baseline, tolerance=0.2), [
+            'review-list at scale 10: p95 13.0 ms, baseline 10.0 ms',
+            'review-list at scale 10: 3 queries per request, baseline 2',
+        ])
+
+    def test_results_round_trip_as_a_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_api', scales='1', requests=5, warmup=1,
+                         alloc_requests=2, output=output, stdout=StringIO())
+            with open(output) as handle:
+                report = json.load(handle)
+            self.assertEqual(
+                sorted(report['results']['1']),
+                ['booking-create', 'listing-detail', 'listing-list',
+                 'listing-search', 'review-list']
+            )
+            self.assertEqual(report['results']['1']['listing-list']['count'],
+                             5)
+
+            # Same run against itself, with room for timing noise.
+            stdout = StringIO()
+            call_command('bench_api', scales='1', requests=5, warmup=1,
+                         alloc_requests=2, baseline=output, tolerance=100,
+                         stdout=stdout)
+            self.assertIn('No regressions', stdout.getvalue())
+        self.assertFalse(Listing.objects.exists())
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1.0, LISTINGS_CACHE_TIMEOUT=0)
+class ProfilingTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        for _ in range(3):
+            make_listing(cls.operator)
+
+    def setUp(self):
+        super().setUp()
+        profiling.registry.reset()
+        self.addCleanup(profiling.registry.reset)
+        self.client = APIClient()
+
+    def test_sampled_request_breaks_down_sql_and_serializers(self):
+        with self.settings(LISTINGS_FAST_READ=False), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/listing/')
+
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn('ListingSerializer;dur=', timing)
+        self.assertIn('UserSerializer;dur=', timing)
+        summary = profiling.registry.summary('listing-list', 'GET',
+                                             'db_queries')
+        self.assertEqual(summary[0.5], len(queries))
+
+        self.assertIn('ReadPlan;dur=',
+                      self.client.get('/api/listing/')['Server-Timing'])
+
+    def test_nested_time_is_not_counted_twice(self):
+        profile = profiling.Profile()
+
+        def inner():
+            time.sleep(0.02)
+
+        def outer():
+            time.sleep(0.02)
+            profile.time('inner', inner)
+
+        profile.time('outer', outer)
+        self.assertGreaterEqual(profile.serializers['inner'], 0.02)
+        self.assertGreaterEqual(profile.serializers['outer'], 0.02)
+        self.assertLess(profile.serializers['outer'], 0.035)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_rate_zero_removes_the_middleware(self):
+        response = APIClient().get('/api/listing/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(profiling.registry.export(), '\n')
+
+    def test_metrics_exports_percentiles(self):
+        self.client.get('/api/listing/')
+        labels = 'view="listing-list",method="GET"'
+
+        with self.settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer scrape'
+            )
+        body = response.content.decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE listings_request_duration_seconds summary',
+                      body)
+        self.assertIn(f'listings_request_duration_seconds{{{labels},'
+                      f'quantile="0.95"}}', body)
+        self.assertIn(f'listings_request_db_queries_count{{{labels}}} 1.0',
+                      body)
+        self.assertIn('serializer="ReadPlan"', body)
+
+
+class MetricsTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        make_listing(cls.operator)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_are_counted_and_timed_by_view(self):
+        labels = {'view': 'listing-list', 'method': 'GET'}
+        before = self.sample('listings_http_requests_total', status='200',
+                             **labels)
+        observed = self.sample('listings_http_request_duration_seconds_count',
+                               **labels)
+        missing = self.sample('listings_http_requests_total',
+                              view='unmatched', method='GET', status='404')
+
+        APIClient().get('/api/listing/')
+        APIClient().get('/api/nowhere/')
+
+        self.assertEqual(self.sample('listings_http_requests_total',
+                                     status='200', **labels), before + 1)
+        self.assertEqual(
+            self.sample('listings_http_request_duration_seconds_count',
+                        **labels), observed + 1
+        )
+        self.assertEqual(self.sample('listings_http_requests_total',
+                                     view='unmatched', method='GET',
+                                     status='404'), missing + 1)
+
+    def test_gateway_calls_by_outcome(self):
+        chapa = FakeChapaServer().start()
+        self.addCleanup(chapa.stop)
+        client = ChapaClient(chapa.url, 'test-key', read_timeout=0.2,
+                             max_retries=1, backoff=0.01,
+                             breaker=CircuitBreaker(failure_threshold=1))
+        before = {outcome: self.sample('listings_chapa_calls_total',
+                                       operation='verify', outcome=outcome)
+                  for outcome in ('200', 'unavailable', 'circuit_open')}
+        retries = self.sample('listings_chapa_retries_total',
+                              operation='verify')
+
+        chapa.failures = [503]
+        client.verify('tx-1')
+        chapa.failures = [503, 503]
+        for _ in range(2):
+            with self.assertRaises(GatewayUnavailable):
+                client.verify('tx-1')
+
+        for outcome in before:
+            self.assertEqual(self.sample('listings_chapa_calls_total',
+                                         operation='verify',
+                                         outcome=outcome),
+                             before[outcome] + 1)
+        self.assertEqual(self.sample('listings_chapa_retries_total',
+                                     operation='verify'), retries + 2)
+
+    def test_task_runs_by_state(self):
+        name = send_notifications.name
+        succeeded = self.sample('listings_celery_task_runs_total',
+                                task=name, state='success')
+        failed = self.sample('listings_celery_task_runs_total',
+                             task=name, state='failure')
+
+        send_notifications.apply(args=[[]])
+        with mock.patch.object(notifications, 'send_batch',
+                               side_effect=RuntimeError):
+            send_notifications.apply(args=[[{}]])
+
+        self.assertEqual(self.sample('listings_celery_task_runs_total',
+                                     task=name, state='success'),
+                         succeeded + 1)
+        self.assertEqual(self.sample('listings_celery_task_runs_total',
+                                     task=name, state='failure'), failed + 1)
+        self.assertGreater(self.sample(
+            'listings_celery_task_duration_seconds_count', task=name
+        ), 0)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, LISTINGS_CACHE_TIMEOUT=0)
+    def test_metrics_view_serves_both_exports(self):
+        APIClient().get('/api/listing/')
+        response = APIClient().get('/metrics')
+        body = response.content.decode()
+        self.assertEqual(response['Content-Type'],
+                         metrics.CONTENT_TYPE_LATEST)
+        self.assertIn('# TYPE listings_http_request_duration_seconds '
+                      'histogram', body)
+        self.assertIn('# TYPE listings_request_duration_seconds summary',
+                      body)
+
+    def test_multiprocess_scrape_reads_the_shared_directory(self):
+        self.assertIs(metrics.collector_registry(), REGISTRY)
+        with tempfile.TemporaryDirectory() as path, \
+                mock.patch.dict(os.environ, PROMETHEUS_MULTIPROC_DIR=path):
+            registry = metrics.collector_registry()
+            self.assertIsNot(registry, REGISTRY)
+            self.assertEqual(list(registry.collect()), [])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], LISTINGS_CACHE_TIMEOUT=0,
+                   REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(ListingsTestCase):
+    """
+    A second SQLite file stands in for the replica; its copy of the
+    listing has another name, so responses show which database served
+    them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        cls.listing = make_listing(cls.operator, name='Primary')
+
+    def setUp(self):
+        super().setUp()
+        self.replica = self.add_database(
+            'replica', os.path.join(self.mkdtemp(), 'replica.sqlite3')
+        )
+        with self.replica.schema_editor() as editor:
+            for model in (User, Listing, Review):
+                editor.create_model(model)
+        self.operator.save(using='replica')
+        Listing.objects.filter(pk=self.listing.pk).first().save(
+            using='replica'
+        )
+        Listing.objects.using('replica').update(name='Replica')
+        self.client = APIClient()
+
+    def mkdtemp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+    def add_database(self, alias, name):
+        # Registered as a connection only, not in settings.DATABASES:
+        # Django's test case only guards the configured aliases.
+        config = connections.configure_settings({
+            DEFAULT_DB_ALIAS: {},
+            alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name},
+        })[alias]
+        connections[alias] = load_backend(config['ENGINE']).DatabaseWrapper(
+            config, alias
+        )
+
+        def remove():
+            connections[alias].close()
+            del connections[alias]
+        self.addCleanup(remove)
+        return connections[alias]
+
+    def name(self, response):
+        self.assertEqual(response.status_code, 200)
+        return response.json()['name']
+
+    def test_safe_reads_use_the_replica(self):
+        url = f'/api/listing/{self.listing.pk}/'
+        self.assertEqual(self.name(self.client.get(url)), 'Replica')
+        # Reads outside the replica-reading viewsets use the primary.
+        self.assertEqual(Listing.objects.get().name, 'Primary')
+
+    def test_writing_pins_the_client_to_the_primary(self):
+        url = f'/api/listing/{self.listing.pk}/'
+        self.client.force_authenticate(self.operator)
+        response = self.client.patch(url, {'description': 'Updated'})
+        self.assertEqual(self.name(response), 'Primary')
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+        self.assertEqual(self.name(self.client.get(url)), 'Primary')
+        with mock.patch('time.time', return_value=time.time() + 6):
+            self.assertEqual(self.name(self.client.get(url)), 'Replica')
+
+    def test_writes_inside_a_read_pin_the_rest_of_it(self):
+        with replicas.reads_from('replica'):
+            self.assertEqual(Listing.objects.get().name, 'Replica')
+            Listing.objects.update(description='Updated')
+            self.assertEqual(Listing.objects.get().name, 'Primary')
+
+    @override_settings(LISTINGS_CACHE_TIMEOUT=60)
+    def test_cached_responses_are_read_from_the_primary(self):
+        url = f'/api/listing/{self.listing.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(self.name(response), 'Primary')
+        self.assertEqual(self.name(self.client.get(url)), 'Primary')
+        # Reads that skip the cache still use the replica.
+        self.client.force_authenticate(self.operator)
+        self.assertEqual(self.name(self.client.get(url)), 'Replica')
+
+    @override_settings(DATABASE_REPLICAS=['broken', 'replica'],
+                       REPLICA_HEALTH_INTERVAL=60)
+    def test_unhealthy_replicas_are_skipped(self):
+        self.add_database('broken', os.path.join(self.mkdtemp(), 'missing',
+                                                 'broken.sqlite3'))
+        url = f'/api/listing/{self.listing.pk}/'
+        with mock.patch.object(replicas, '_ping',
+                               wraps=replicas._ping) as ping:
+            for _ in range(5):
+                self.assertEqual(self.name(self.client.get(url)), 'Replica')
+        self.assertFalse(replicas.is_healthy('broken'))
+        # Each replica is checked once per interval.
+        self.assertEqual(ping.call_count, 2)
+
+        with self.settings(DATABASE_REPLICAS=['broken']):
+            self.assertEqual(self.name(self.client.get(url)), 'Primary')
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = mock.Mock(return_value=0.0)
+        self.opened = []
+
+    def connect(self):
+        self.opened.append(mock.Mock())
+        return self.opened[-1]
+
+    def pool(self, **kwargs):
+        kwargs.setdefault('clock', self.clock)
+        return ConnectionPool(self.connect, **kwargs)
+
+    def test_released_connections_are_reused(self):
+        pool = self.pool()
+        connection, reused = pool.acquire()
+        self.assertFalse(reused)
+        pool.release(connection)
+        self.assertEqual(pool.acquire(), (connection, True))
+        self.assertEqual(len(self.opened), 1)
+
+    def test_waits_for_a_connection_up_to_the_timeout(self):
+        pool = self.pool(size=1, timeout=0.05, clock=time.monotonic)
+        connection, _ = pool.acquire()
+        with self.assertRaises(PoolExhausted):
+            pool.acquire()
+
+        threading.Timer(0.01, pool.release, [connection]).start()
+        self.assertEqual(pool.acquire(), (connection, True))
+
+    def test_idle_and_failed_connections_are_replaced(self):
+        check = mock.Mock(return_value=False)
+        pool = self.pool(size=1, max_idle=60, check=check)
+        stale, _ = pool.acquire()
+        pool.release(stale)
+        self.clock.return_value = 61.0
+        fresh, reused = pool.acquire()
+        self.assertFalse(reused)
+        stale.close.assert_called_once_with()
+        check.assert_not_called()
+
+        pool.release(fresh)
+        self.assertFalse(pool.acquire()[1])
+        fresh.close.assert_called_once_with()
+        self.assertEqual(pool.stats['discarded'], 2)
+
+    def test_pooled_backend_checks_connections_in_and_out(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = connections.configure_settings({
+            DEFAULT_DB_ALIAS: {},
+            'pooled': {'ENGINE': 'django.db.backends.sqlite3',
+                       'NAME': os.path.join(directory.name, 'db.sqlite3'),
+                       'POOL': {'SIZE': 2}},
+        })['pooled']
+        wrapper_class = pooled(
+            load_backend(config['ENGINE']).DatabaseWrapper
+        )
+        wrapper = wrapper_class(config, alias=f'pooled-{uuid.uuid4()}')
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, raw)
+
+        # Nor is one closed with autocommit left off.
+        pool = wrapper.get_pool(None)
+        wrapper.set_autocommit(False)
+        wrapper.close()
+        self.assertEqual(pool.stats['discarded'], 1)
+        wrapper.ensure_connection()
+        self.assertIsNot(wrapper.connection, raw)
+        wrapper.close()
+        pool.close()
+
+    def test_bench_connections_reports_every_mode(self):
+        out = StringIO()
+        call_command('bench_connections', requests=5, stdout=out)
+        output = out.getvalue()
+        for label in ('connect per request', 'persistent + checks',
+                      'pooled + checks'):
+            self.assertIn(f'{label}:', output)
+        self.assertIn('5 connections', output)
+
+
+@override_settings(LISTINGS_CACHE_TIMEOUT=0)
+class AsyncListingViewTests(ListingsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.operator = make_user()
+        cls.listings = [
+            make_listing(cls.operator, name=f'Route {i}',
+                         departure_time=timezone.now() + timedelta(days=i))
+            for i in range(1, 6)
+        ]
+
+    def get_both(self, path, params=None):
+        sync = self.client.get(f'/api/{path}', params)
+        native = self.client.get(f'/api/async/{path}', params)
+        self.assertEqual(native.status_code, sync.status_code)
+        self.assertEqual(native['Content-Type'], 'application/json')
+        return sync, native
+
+    def test_responses_match_the_sync_views(self):
+        detail = f'listing/{self.listings[0].pk}/'
+        for path, params in (('listing/', None), (detail, None),
+                             ('listing/search/', {'origin': 'NG-LA'}),
+                             ('listing/search/', {'min_seats': 0})):
+            sync, native = self.get_both(path, params)
+            self.assertEqual(native.json(), sync.json(), path)
+
+    def test_keyset_pages_match_the_sync_views(self):
+        sync, native = self.get_both('listing/', {'page_size': 2})
+        pages = []
+        while native.status_code == 200:
+            body, expected = native.json(), sync.json()
+            self.assertEqual(body['results'], expected['results'])
+            pages.append(body['results'])
+            if not body['next']:
+                break
+            self.assertIn('/api/async/listing/', body['next'])
+            native = self.client.get(body['next'])
+            sync = self.client.get(expected['next'])
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+
+    @override_settings(LISTINGS_CACHE_TIMEOUT=60)
+    def test_cached_pages_link_to_their_own_endpoint(self):
+        for first, second in (('/api/', '/api/async/'),
+                              ('/api/async/', '/api/')):
+            caches['default'].clear()
+            self.client.get(f'{first}listing/', {'page_size': 1})
+            response = self.client.get(f'{second}listing/', {'page_size': 1})
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertIn(f'{second}listing/?', response.json()['next'])
+            response = self.client.get(f'{second}listing/', {'page_size': 1})
+            self.assertEqual(response['X-Cache'], 'HIT')
+            self.assertIn(f'{second}listing/?', response.json()['next'])
+
+    def test_detail_is_one_query_and_revalidates(self):
+        url = f'/api/async/listing/{self.listings[0].pk}/'
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 304)
+        self.assertEqual(self.client.get(
+            f'/api/async/listing/{uuid.uuid4()}/'
+        ).status_code, 404)
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    async def test_runs_through_async_middleware(self):
+        profiling.registry.reset()
+        self.addCleanup(profiling.registry.reset)
+        response = await self.async_client.get('/api/async/listing/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 5)
+        # Queries ran in the request's sync thread and were still counted.
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertIn('ReadPlan;dur=', response['Server-Timing'])
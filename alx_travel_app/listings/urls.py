@@ -3,12 +3,15 @@ from rest_framework import routers, permissions
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from . import async_views
 from .views import (
     ListingViewSet,
     BookingViewSet,
     ReviewViewSet,
     initiate_payment,
-    verify_payment
+    verify_payment,
+    chapa_webhook,
+    payment_success
 )
 
 
@@ -33,6 +36,14 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('', include(router.urls)),
 
+    # Async listing reads for ASGI deployments
+    path('async/listing/', async_views.listing_list,
+         name='async-listing-list'),
+    path('async/listing/search/', async_views.listing_search,
+         name='async-listing-search'),
+    path('async/listing/<uuid:pk>/', async_views.listing_detail,
+         name='async-listing-detail'),
+
     # Payment endpoints
     path('payments/initiate/<uuid:booking_id>/',
          initiate_payment,
@@ -42,6 +53,14 @@ urlpatterns = [
          verify_payment,
          name='payment-verify'
     ),
+    path('payments/webhook/',
+         chapa_webhook,
+         name='payment-webhook'
+    ),
+    path('payments/success/',
+         payment_success,
+         name='payment-success'
+    ),
 
     # Documentation
     path('schema.json/', schema_view.without_ui(cache_timeout=0),
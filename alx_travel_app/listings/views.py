@@ -1,65 +1,335 @@
+import functools
+import hmac
+import json
 import uuid
-import requests
 
 from django.conf import settings
+from django.db.models import F
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.urls import reverse
+from django.utils import timezone
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
 
-from rest_framework import viewsets, status
+from rest_framework import generics, serializers, viewsets, status
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import (
+    action,
+    api_view,
+    authentication_classes,
+    permission_classes
+)
 from rest_framework.response import Response
 
 from .models import Listing, Booking, Review, Payment
+from .conditional import ConditionalGetMixin
+from .fast_read import ReadPlan
+from .pagination import KeysetPagination
+from .replicas import ReplicaReadMixin
+from . import (
+    cache,
+    idempotency,
+    metrics,
+    notifications,
+    payments,
+    ratings,
+    reservations
+)
+from .gateway import GatewayUnavailable, get_client
 from .serializers import (
     ListingSerializer,
+    ListingSearchSerializer,
     BookingSerializer,
+    BulkBookingItemSerializer,
     ReviewSerializer
 )
-from .tasks import (
-    send_payment_confirmation_email,
-    send_booking_confirmation_email
-)
 
 
-class ListingViewSet(viewsets.ModelViewSet):
+class ListingViewSet(ReplicaReadMixin, ConditionalGetMixin,
+                     viewsets.ModelViewSet):
     queryset = Listing.objects.all().select_related('operator')
     serializer_class = ListingSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('departure_time', 'listing_id')
+    validator_fields = ('updated_at', 'operator__updated_at')
+    read_plan = ReadPlan(ListingSerializer)
+
+    @property
+    def fast_read(self):
+        """
+        Serve list/retrieve/search from values() rows through the compiled
+        read plan instead of ListingSerializer (same JSON, less CPU).
+        """
+        return settings.LISTINGS_FAST_READ
+
+    def list(self, request, *args, **kwargs):
+        return cache.cached_response(
+            request, 'list', lambda: self._list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return cache.cached_response(
+            request, 'retrieve',
+            lambda: self._retrieve(request, *args, **kwargs),
+            pk=self.kwargs[lookup_url_kwarg]
+        )
+
+    def _list(self, request, *args, **kwargs):
+        if not self.fast_read:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_list(request, queryset,
+                                     lambda: self.fast_list(queryset))
+
+    def _retrieve(self, request, *args, **kwargs):
+        if not self.fast_read:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_retrieve(request, self.fast_retrieve)
+
+    def fast_retrieve(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = generics.get_object_or_404(
+            self.read_plan.values_list(self.get_queryset()),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        return Response(self.read_plan.render_row(row))
+
+    def fast_list(self, queryset):
+        rows = self.read_plan.values_list(queryset,
+                                          extra=self.keyset_ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.read_plan.render(page))
+        return Response(self.read_plan.render(rows))
 
     def perform_create(self, serializer):
         serializer.save(operator=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Route search by origin/destination, departure window, transport
+        type, seat availability and price range.
+        """
+        return cache.cached_response(request, 'search',
+                                     lambda: self._search(request))
+
+    def _search(self, request):
+        params = ListingSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        queryset = params.filter_queryset(self.get_queryset())
+        queryset = queryset.order_by(*self.keyset_ordering)
+        if self.fast_read:
+            return self.conditional_list(request, queryset,
+                                         lambda: self.fast_list(queryset))
+        return self.conditional_list(
+            request, queryset, lambda: self.serialized_list(queryset)
+        )
+
+    def serialized_list(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
 
-class BookingViewSet(viewsets.ModelViewSet):
+
+class BookingViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('created_at', 'booking_id')
+    bulk_max_size = 500
+
+    def create(self, request, *args, **kwargs):
+        return idempotency.idempotent_response(
+            request, 'booking-create',
+            functools.partial(super().create, request, *args, **kwargs)
+        )
 
     def perform_create(self, serializer):
-        booking = serializer.save()
+        data = serializer.validated_data
 
-        send_booking_confirmation_email.delay(
-            booking.passenger_email,
-            str(booking.booking_id)
+        def save():
+            # The confirmation joins the booking's transaction via the outbox.
+            booking = serializer.save()
+            notifications.notify(
+                notifications.booking_confirmation(booking.booking_id)
+            )
+            return booking
+
+        try:
+            reservations.book(save, data['listing'].pk,
+                              reservations.held_seats(
+                                  data.get('status', 'pending'),
+                                  data['num_seats']
+                              ))
+        except reservations.SeatsUnavailable as exc:
+            raise serializers.ValidationError({'num_seats': [str(exc)]})
+
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        data = serializer.validated_data
+        old = (instance.listing_id,
+               reservations.held_seats(instance.status, instance.num_seats))
+        listing = data.get('listing')
+        new = (listing.pk if listing else instance.listing_id,
+               reservations.held_seats(data.get('status', instance.status),
+                                       data.get('num_seats',
+                                                instance.num_seats)))
+        if old == new:
+            serializer.save()
+            return
+
+        try:
+            reservations.rebook(serializer.save, old, new)
+        except reservations.SeatsUnavailable as exc:
+            raise serializers.ValidationError({'num_seats': [str(exc)]})
+
+    def perform_destroy(self, instance):
+        reservations.cancel(
+            instance.delete,
+            instance.listing_id,
+            reservations.held_seats(instance.status, instance.num_seats)
         )
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Creates a batch of bookings in one request.
+
+        Expects a JSON list of bookings and answers with one result per
+        item, in request order. Listings are fetched once for the whole
+        batch, seats are reserved with one statement per listing and the
+        bookings are inserted with a single bulk insert.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"error": "Expected a non-empty list of bookings"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > self.bulk_max_size:
+            return Response(
+                {"error": f"At most {self.bulk_max_size} bookings per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-class ReviewViewSet(viewsets.ModelViewSet):
-    queryset = Review.objects.all()
+        results = [None] * len(items)
+        pending = []
+        for index, item in enumerate(items):
+            serializer = BulkBookingItemSerializer(data=item)
+            if serializer.is_valid():
+                pending.append((index, serializer.validated_data))
+            else:
+                results[index] = {"index": index, "status": "error",
+                                  "errors": serializer.errors}
+
+        listings = Listing.objects.in_bulk(
+            {data['listing_id'] for _, data in pending}
+        )
+        taken = set(Booking.objects.filter(
+            listing_id__in=listings,
+            passenger_email__in={data['passenger_email']
+                                 for _, data in pending}
+        ).values_list('listing_id', 'passenger_name', 'passenger_email'))
+
+        bookings = {}
+        for index, data in pending:
+            listing_id = data.pop('listing_id')
+            key = (listing_id, data['passenger_name'],
+                   data['passenger_email'])
+            if listing_id not in listings:
+                errors = {"listing_id": ["Listing not found."]}
+            elif key in taken:
+                errors = {"non_field_errors": [
+                    "This passenger is already booked on this listing."
+                ]}
+            else:
+                taken.add(key)
+                bookings[index] = Booking(listing=listings[listing_id],
+                                          **data)
+                continue
+            results[index] = {"index": index, "status": "error",
+                              "errors": errors}
+
+        def confirm(created):
+            if created:
+                notifications.notify(*[
+                    notifications.booking_confirmation(booking.booking_id)
+                    for booking in created
+                ])
+
+        created, sold_out = reservations.book_many(list(bookings.values()),
+                                                   on_created=confirm)
+
+        for index, booking in bookings.items():
+            if booking.listing_id in sold_out:
+                results[index] = {"index": index, "status": "error",
+                                  "errors": {"num_seats": [
+                                      "Not enough seats available for this "
+                                      "listing's bookings in the batch."
+                                  ]}}
+            else:
+                results[index] = {"index": index, "status": "created",
+                                  "booking": BookingSerializer(booking).data}
+
+        if len(created) == len(items):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({"created": len(created), "results": results},
+                        status=response_status)
+
+
+class ReviewViewSet(ReplicaReadMixin, ConditionalGetMixin,
+                    viewsets.ModelViewSet):
+    # listing_name is read from the join instead of one Listing per row.
+    queryset = Review.objects.annotate(listing_name=F('listing__name'))
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('created_at', 'review_id')
+    validator_fields = ('updated_at', 'listing__updated_at')
+
+    def perform_create(self, serializer):
+        ratings.record_review(serializer.save)
+
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        # The annotated name is stale once the review moves listings.
+        vars(instance).pop('listing_name', None)
+        ratings.rerate_review(serializer.save,
+                              (instance.listing_id, instance.rating))
+
+    def perform_destroy(self, instance):
+        ratings.remove_review(instance.delete, instance.listing_id,
+                              instance.rating)
 
-CHAPA_INIT_URL = "https://api.chapa.co/v1/transaction/initialize"
-CHAPA_VERIFY_URL = "https://api.chapa.co/v1/transaction/verify/"
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticatedOrReadOnly])
 def initiate_payment(request, booking_id):
     """
-    Initiate Chapa payment for a booking.
+    Initiate Chapa payment for a booking. Retries carrying the same
+    Idempotency-Key get the original checkout session back.
     """
+    return idempotency.idempotent_response(
+        request, 'payment-initiate',
+        functools.partial(_initiate_payment, request, booking_id)
+    )
+
+
+def _initiate_payment(request, booking_id):
     booking = get_object_or_404(Booking, booking_id=booking_id)
 
     if booking.status != "pending":
@@ -70,17 +340,37 @@ def initiate_payment(request, booking_id):
 
     tx_ref = f"tx-{uuid.uuid4()}"
 
-    payment = Payment.objects.create(
+    # A booking has a single payment. Only a failed attempt's row is taken
+    # over: a pending checkout may still be paid under its tx_ref.
+    payment, created = Payment.objects.get_or_create(
         booking=booking,
-        tx_ref=tx_ref,
-        amount=booking.amount_paid,
-        status="pending"
+        defaults={
+            "tx_ref": tx_ref,
+            "amount": booking.amount_paid,
+            "status": "pending"
+        }
     )
-
-    headers = {
-        "Authorization": f"Bearer {settings.CHAPA_SECRET_KEY}",
-        "Content-Type": "application/json"
-    }
+    if not created:
+        # The sweeper times checkouts from created_at, so it restarts too.
+        recycled = Payment.objects.filter(
+            pk=payment.pk, status="failed"
+        ).update(
+            tx_ref=tx_ref,
+            amount=booking.amount_paid,
+            status="pending",
+            created_at=timezone.now(),
+            updated_at=timezone.now()
+        )
+        if not recycled:
+            return Response(
+                {
+                    "error": "A checkout is already in progress for this "
+                             "booking",
+                    "tx_ref": payment.tx_ref
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+        payment.refresh_from_db()
 
     callback_url = request.build_absolute_uri(
         reverse('payment-verify')
@@ -103,17 +393,20 @@ def initiate_payment(request, booking_id):
         }
     }
 
-    response = requests.post(
-        CHAPA_INIT_URL,
-        json=payload,
-        headers=headers
-    )
-    data = response.json()
+    try:
+        response = get_client().initialize(payload)
+    except GatewayUnavailable:
+        payment.status = "failed"
+        payment.save()
+        return Response(
+            {"error": "Payment gateway unavailable, try again later"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
 
-    if response.status_code == 200 and data.get("status") == "success":
+    if response.ok:
         return Response(
             {
-                "checkout_url": data["data"]["checkout_url"],
+                "checkout_url": response.data["data"]["checkout_url"],
                 "tx_ref": tx_ref
             },
             status=status.HTTP_200_OK
@@ -132,7 +425,8 @@ def initiate_payment(request, booking_id):
 @permission_classes([AllowAny])
 def verify_payment(request):
     """
-    Verify Chapa payment after completion.
+    Chapa checkout callback. Queues the transaction for verification
+    instead of calling Chapa inside the request.
     """
     tx_ref = request.query_params.get("tx_ref")
 
@@ -142,44 +436,94 @@ def verify_payment(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    payment = get_object_or_404(Payment, tx_ref=tx_ref)
+    payment_status = Payment.objects.filter(tx_ref=tx_ref).values_list(
+        'status', flat=True
+    ).first()
+    if payment_status is None:
+        raise Http404
 
-    headers = {
-        "Authorization": f"Bearer {settings.CHAPA_SECRET_KEY}"
-    }
+    if payment_status == "completed":
+        return Response(
+            {"message": "Payment verified successfully"},
+            status=status.HTTP_200_OK
+        )
+    if payment_status == "failed":
+        return Response(
+            {"error": "Payment verification failed"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-    response = requests.get(
-        f"{CHAPA_VERIFY_URL}{tx_ref}",
-        headers=headers
+    payments.record_event(
+        tx_ref, 'callback', request.query_params.dict(),
+        key=payments.dedupe_key('callback', tx_ref,
+                                request.query_params.get('status', ''))
+    )
+    return Response(
+        {"message": "Payment verification queued", "tx_ref": tx_ref},
+        status=status.HTTP_202_ACCEPTED
     )
 
-    data = response.json()
-
-    if response.status_code == 200 and data.get("status") == "success":
-        if data["data"]["status"] == "success":
-            payment.status = "completed"
-            payment.chapa_transaction_id = data["data"]["id"]
-            payment.save()
 
-            booking = payment.booking
-            booking.status = "confirmed"
-            booking.save()
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def chapa_webhook(request):
+    """
+    Signed Chapa webhook. Records the event and answers right away; the
+    payment is verified and settled by the process_payment_events task.
+    """
+    # Read the raw body before DRF parses it: the signature covers bytes.
+    body = request.body
+    signature = (request.headers.get('Chapa-Signature') or
+                 request.headers.get('X-Chapa-Signature'))
+    if not payments.valid_signature(body, signature):
+        return Response(
+            {"error": "Invalid signature"},
+            status=status.HTTP_403_FORBIDDEN
+        )
 
-            send_payment_confirmation_email.delay(
-                booking.passenger_email,
-                str(booking.booking_id),
-                str(payment.amount)
-            )
+    try:
+        payload = json.loads(body)
+        tx_ref = payload["tx_ref"]
+    except (ValueError, TypeError, KeyError):
+        return Response(
+            {"error": "tx_ref is required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-            return Response(
-                {"message": "Payment verified successfully"},
-                status=status.HTTP_200_OK
-            )
+    event = str(payload.get("event", ""))[:50]
+    payments.record_event(
+        tx_ref, event, payload,
+        key=payments.dedupe_key('webhook', event, tx_ref,
+                                payload.get('status', ''),
+                                payload.get('reference', ''))
+    )
+    return Response({"received": True}, status=status.HTTP_200_OK)
 
-    payment.status = "failed"
-    payment.save()
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def payment_success(request):
+    """
+    Landing page Chapa redirects the customer to after checkout.
+    """
     return Response(
-        {"error": "Payment verification failed"},
-        status=status.HTTP_400_BAD_REQUEST
+        {"message": "Payment received. You will get a confirmation email "
+                    "once it is verified."},
+        status=status.HTTP_200_OK
     )
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus scrape of the API, gateway and task metrics and the sampled
+    request profiles. Requires ``Authorization: Bearer <METRICS_TOKEN>``
+    when that setting is set.
+    """
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    body, content_type = metrics.exposition()
+    return HttpResponse(body, content_type=content_type)